@@ -15,8 +15,17 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
+from celery.schedules import crontab
 from decouple import Csv, config
 
+from common.constants import (
+    CELERY_PRIORITY_DEFAULT,
+    CELERY_PRIORITY_HIGHEST,
+    CELERY_PRIORITY_LOWEST,
+    CELERY_QUEUE_DEFAULT,
+    CELERY_QUEUE_TRANSCODING,
+)
+
 # ---------------------------------------------------------------------------
 # Paths
 # ---------------------------------------------------------------------------
@@ -198,6 +207,8 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_THROTTLE_CLASSES": [],
     "DEFAULT_THROTTLE_RATES": {
+        # Per track; single and batch stream requests share this budget
+        # (see MusicStreamingBatchRateThrottle)
         "music_streaming": "10/minute",
     },
     "EXCEPTION_HANDLER": "rest_framework.views.exception_handler",
@@ -310,10 +321,140 @@ CELERY_WORKER_CONCURRENCY: int = config("CELERY_WORKER_CONCURRENCY", default=4,
 CELERY_TASK_ACKS_LATE = True
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
-# Task routing — separate queues for different workloads
-# In development, we allow these to fall back to the default queue for simplicity
-# if a dedicated worker is not running.
-CELERY_TASK_ROUTES = {}
+# Task routing — separate queues for different workloads.  Encodes run on
+# their own worker pool so cleanup and other short tasks never queue behind
+# them; a single development worker can consume every queue with
+# ``-Q default,transcoding,notifications,payouts``.
+CELERY_TASK_DEFAULT_QUEUE: str = CELERY_QUEUE_DEFAULT
+CELERY_TASK_ROUTES: dict[str, dict[str, str]] = {
+    "music.tasks.convert_audio_to_hls": {"queue": CELERY_QUEUE_TRANSCODING},
+    "music.tasks.regenerate_hls_for_music": {"queue": CELERY_QUEUE_TRANSCODING},
+    "music.tasks.trigger_hls_conversion_for_music": {"queue": CELERY_QUEUE_TRANSCODING},
+    "music.tasks.cleanup_failed_hls_conversion": {"queue": CELERY_QUEUE_DEFAULT},
+    "music.tasks.continue_backfill_lane": {"queue": CELERY_QUEUE_DEFAULT},
+    "common.tasks.generate_image_derivatives": {"queue": CELERY_QUEUE_DEFAULT},
+    "music.tasks.collect_orphaned_hls_objects": {"queue": CELERY_QUEUE_DEFAULT},
+}
+
+# Periodic tasks, run by ``celery -A Backend beat``
+CELERY_BEAT_SCHEDULE: dict[str, dict[str, object]] = {
+    "collect-orphaned-hls-objects": {
+        "task": "music.tasks.collect_orphaned_hls_objects",
+        "schedule": crontab(hour=4, minute=30),
+        "options": {"priority": CELERY_PRIORITY_LOWEST},
+    },
+}
+
+# Redis emulates priorities with one list per step, and within a queue the
+# lower-numbered (more urgent) steps are consumed first.  The default list
+# separator and round-robin queue order are kept on purpose: changing ``sep``
+# renames the lists (orphaning queued messages), and ``priority`` queue order
+# would let a backlogged queue starve the others on a shared worker.
+CELERY_BROKER_TRANSPORT_OPTIONS: dict[str, object] = {
+    "priority_steps": list(range(CELERY_PRIORITY_HIGHEST, CELERY_PRIORITY_LOWEST + 1)),
+}
+CELERY_TASK_DEFAULT_PRIORITY: int = CELERY_PRIORITY_DEFAULT
+
+# ---------------------------------------------------------------------------
+# HLS transcoding
+# ---------------------------------------------------------------------------
+# ``single_pass`` decodes the original once and encodes every quality tier
+# from one FFmpeg filter graph; ``per_quality`` runs one FFmpeg per tier.
+HLS_TRANSCODE_MODE: str = config("HLS_TRANSCODE_MODE", default="single_pass")
+
+# ``per_quality`` only: how many tiers may run concurrently, the timeout per
+# tier, and the RSS budgeted per FFmpeg process when capping by memory.
+HLS_TRANSCODE_PARALLELISM: int = config("HLS_TRANSCODE_PARALLELISM", default=1, cast=int)
+HLS_TRANSCODE_TIER_TIMEOUT_SECONDS: int = config("HLS_TRANSCODE_TIER_TIMEOUT_SECONDS", default=3600, cast=int)
+HLS_TRANSCODE_WORKER_MEMORY_MB: int = config("HLS_TRANSCODE_WORKER_MEMORY_MB", default=64, cast=int)
+
+# Originals are streamed to the worker in chunks; on S3 each chunk is a
+# ranged GET, with at most ``HLS_DOWNLOAD_MAX_CONCURRENCY`` in flight.
+HLS_DOWNLOAD_CHUNK_SIZE_BYTES: int = config("HLS_DOWNLOAD_CHUNK_SIZE_BYTES", default=8 * 1024 * 1024, cast=int)
+HLS_DOWNLOAD_MAX_CONCURRENCY: int = config("HLS_DOWNLOAD_MAX_CONCURRENCY", default=2, cast=int)
+
+# ``download`` copies the original to a temp dir before FFmpeg starts;
+# ``presigned_url`` / ``pipe`` stream it into FFmpeg with no temp copy.
+HLS_SOURCE_MODE: str = config("HLS_SOURCE_MODE", default="download")
+
+# Segments of one tier are uploaded in parallel through a shared S3 client.
+HLS_UPLOAD_MAX_CONCURRENCY: int = config("HLS_UPLOAD_MAX_CONCURRENCY", default=8, cast=int)
+AWS_S3_MAX_POOL_CONNECTIONS: int = config("AWS_S3_MAX_POOL_CONNECTIONS", default=32, cast=int)
+
+# Execution limits for every FFmpeg process, so encodes cannot starve the
+# web tier on a shared host: decoder/filter threads, CPU niceness, idle I/O
+# class (needs ``ionice``) and an address-space cap (0 disables a limit).
+HLS_FFMPEG_THREADS: int = config("HLS_FFMPEG_THREADS", default=2, cast=int)
+HLS_FFMPEG_NICE: int = config("HLS_FFMPEG_NICE", default=10, cast=int)
+HLS_FFMPEG_IDLE_IO: bool = config("HLS_FFMPEG_IDLE_IO", default=True, cast=bool)
+# RLIMIT_AS caps virtual address space, not RSS: glibc per-thread arenas
+# and FFmpeg's thread pools reserve far more than they touch, so a cap near
+# the real footprint fails healthy encodes.  Off by default; to enable it,
+# measure peak VmPeak of a lossless encode on the worker host and add
+# headroom.  Hitting the cap is not retried (see FFMPEG_RETRY_POLICY).
+HLS_FFMPEG_MEMORY_LIMIT_MB: int = config("HLS_FFMPEG_MEMORY_LIMIT_MB", default=0, cast=int)
+
+# Upload each segment as soon as FFmpeg closes it instead of after the
+# encode finishes; playlists are still published last.
+HLS_INCREMENTAL_UPLOAD: bool = config("HLS_INCREMENTAL_UPLOAD", default=False, cast=bool)
+
+# ``mpegts`` writes one .ts object per segment; ``fmp4`` writes one CMAF
+# .mp4 per rendition addressed with EXT-X-BYTERANGE (far fewer objects).
+HLS_SEGMENT_FORMAT: str = config("HLS_SEGMENT_FORMAT", default="mpegts")
+
+# Measure EBU R128 loudness from the transcode's own decode and publish a
+# ReplayGain-style gain towards ``LOUDNESS_TARGET_LUFS`` (-14 is the usual
+# streaming reference level).
+HLS_MEASURE_LOUDNESS: bool = config("HLS_MEASURE_LOUDNESS", default=True, cast=bool)
+LOUDNESS_TARGET_LUFS: float = config("LOUDNESS_TARGET_LUFS", default=-14.0, cast=float)
+
+# Downsampled waveform peaks for the player scrubber, from the same decode.
+HLS_GENERATE_WAVEFORM: bool = config("HLS_GENERATE_WAVEFORM", default=True, cast=bool)
+
+# Nightly garbage collection of HLS objects no database row references.
+# Objects younger than the grace period are kept (they may belong to a
+# transcode in flight); deletes go in DeleteObjects batches with a pause in
+# between, capped per run.
+HLS_GC_GRACE_HOURS: int = config("HLS_GC_GRACE_HOURS", default=24, cast=int)
+HLS_GC_TRACK_BATCH_SIZE: int = config("HLS_GC_TRACK_BATCH_SIZE", default=500, cast=int)
+HLS_GC_DELETE_BATCH_SIZE: int = config("HLS_GC_DELETE_BATCH_SIZE", default=1000, cast=int)
+HLS_GC_DELETE_PAUSE_SECONDS: float = config("HLS_GC_DELETE_PAUSE_SECONDS", default=1.0, cast=float)
+HLS_GC_MAX_DELETES_PER_RUN: int = config("HLS_GC_MAX_DELETES_PER_RUN", default=50_000, cast=int)
+
+# Short AAC clip for hover-to-preview in browse lists, cut from the same
+# decode; the offset is pulled back for tracks too short to fit the clip.
+HLS_GENERATE_PREVIEW: bool = config("HLS_GENERATE_PREVIEW", default=True, cast=bool)
+PREVIEW_OFFSET_SECONDS: float = config("PREVIEW_OFFSET_SECONDS", default=30.0, cast=float)
+PREVIEW_DURATION_SECONDS: int = config("PREVIEW_DURATION_SECONDS", default=30, cast=int)
+PREVIEW_BITRATE: str = config("PREVIEW_BITRATE", default="48k")
+
+# Per-track streaming manifests (renditions, visibility, owner) cached in
+# Redis; entries are invalidated on change, so the TTL is only a backstop.
+STREAM_MANIFEST_CACHE_TTL: int = config("STREAM_MANIFEST_CACHE_TTL", default=86400, cast=int)
+
+# Per-user entitlement snapshots (premium, max quality, EQ preset); a
+# premium snapshot is never kept past the subscription's expires_at.
+ENTITLEMENT_CACHE_TTL: int = config("ENTITLEMENT_CACHE_TTL", default=300, cast=int)
+
+# Path-token signing of playlist and segment URLs on the media domain
+# (see music.signing).  The key is shared with whatever verifies tokens at
+# the edge; URLs stay stable, and valid, for one to two TTL windows.
+STREAM_URL_SIGNING: bool = config("STREAM_URL_SIGNING", default=False, cast=bool)
+STREAM_URL_SIGNING_KEY: str = config("STREAM_URL_SIGNING_KEY", default="")
+STREAM_URL_TTL_SECONDS: int = config("STREAM_URL_TTL_SECONDS", default=3600, cast=int)
+
+# Most tracks one batch stream request may resolve (queue prefetch); must
+# not exceed the music_streaming rate, or a full batch can never pass.
+STREAM_BATCH_MAX_TRACKS: int = config("STREAM_BATCH_MAX_TRACKS", default=10, cast=int)
+
+# ---------------------------------------------------------------------------
+# Image derivatives
+# ---------------------------------------------------------------------------
+# Uploaded artwork is re-encoded to these widths (never upscaled) in each
+# format this Pillow build supports; AVIF needs a Pillow with libavif.
+IMAGE_DERIVATIVE_WIDTHS: list[int] = config("IMAGE_DERIVATIVE_WIDTHS", default="96,192,384,768", cast=Csv(int))
+IMAGE_DERIVATIVE_FORMATS: list[str] = config("IMAGE_DERIVATIVE_FORMATS", default="avif,webp", cast=Csv())
+IMAGE_DERIVATIVE_QUALITY: int = config("IMAGE_DERIVATIVE_QUALITY", default=75, cast=int)
 
 # ---------------------------------------------------------------------------
 # CORS
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from common.serializers import SrcsetField
 from music.models import Album, AlbumTrack, Music, Genre
 from django.db import models
 # from music.serializers import MusicSerializer
@@ -88,12 +89,14 @@ class AlbumSerializer(serializers.ModelSerializer):
     artist_username = serializers.SerializerMethodField()
     artist_id = serializers.SerializerMethodField()
     total_plays = serializers.SerializerMethodField()
+    cover_photo_srcset = SrcsetField(source='cover_photo_variants')
+    banner_img_srcset = SrcsetField(source='banner_img_variants')
     
     class Meta:
         model = Album
         fields = [
-            'id', 'name', 'description', 'cover_photo', 
-            'banner_img', 'release_date', 'is_public',
+            'id', 'name', 'description', 'cover_photo', 'cover_photo_srcset',
+            'banner_img', 'banner_img_srcset', 'release_date', 'is_public',
             'tracks', 'created_at', 'updated_at',
             'artist_username', 'artist_id', 'total_plays',
         ]
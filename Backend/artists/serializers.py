@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from common.serializers import SrcsetField
 from .models import Artist, Follow
 from users.models import CustomUser
 
@@ -9,11 +10,12 @@ class ArtistSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(source='user.first_name', read_only=True)
     last_name = serializers.CharField(source='user.last_name', read_only=True)
     profile_photo = serializers.ImageField(source='user.profile_photo', read_only=True, allow_null=True, required=False)
+    profile_photo_srcset = SrcsetField(source='user.profile_photo_variants')
     
     
     class Meta:
         model = Artist
-        fields = ['id', 'email', 'first_name', 'last_name', 'bio', 'status', 'profile_photo', 'username', 'submitted_at', 'updated_at']
+        fields = ['id', 'email', 'first_name', 'last_name', 'bio', 'status', 'profile_photo', 'profile_photo_srcset', 'username', 'submitted_at', 'updated_at']
         read_only_fields = ['status', 'submitted_at', 'updated_at']
 
 
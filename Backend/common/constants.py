@@ -80,6 +80,16 @@ CELERY_QUEUE_TRANSCODING: str = "transcoding"
 CELERY_QUEUE_NOTIFICATIONS: str = "notifications"
 CELERY_QUEUE_PAYOUTS: str = "payouts"
 
+# Task priorities on the Redis broker — lower values are consumed first
+CELERY_PRIORITY_HIGHEST: int = 0
+CELERY_PRIORITY_DEFAULT: int = 5
+CELERY_PRIORITY_LOWEST: int = 9
+TRANSCODE_PRIORITY_ADMIN: int = 0           # admin-requested re-transcode
+TRANSCODE_PRIORITY_SHORT_TRACK: int = 3     # fresh approval, under 5 minutes
+TRANSCODE_PRIORITY_DEFAULT: int = 5         # fresh approval, unknown duration
+TRANSCODE_PRIORITY_LONG_TRACK: int = 7      # fresh approval, 15 minutes or more
+TRANSCODE_PRIORITY_BACKFILL: int = 9        # catalogue re-encode, yields to everything
+
 
 # ---------------------------------------------------------------------------
 # Cache Key Prefixes
@@ -91,6 +101,8 @@ CACHE_PREFIX_RESEND_COOLDOWN: str = "resend_cooldown"
 CACHE_PREFIX_USER_EQ_PRESET: str = "user_eq_preset"
 CACHE_PREFIX_VERIFICATION_TOKEN: str = "verification_token"
 CACHE_PREFIX_REGISTRATION_EXTENDED: str = "registration_extended"
+CACHE_PREFIX_STREAM_MANIFEST: str = "stream_manifest"
+CACHE_PREFIX_ENTITLEMENTS: str = "entitlements"
 
 # ---------------------------------------------------------------------------
 # OTP Settings
@@ -110,4 +122,20 @@ HLS_CONTENT_TYPES: dict[str, str] = {
     "ts": "video/mp2t",
     "mp4": "video/mp4",
     "mp3": "audio/mpeg",
+    "m4a": "audio/mp4",
 }
+
+
+# ---------------------------------------------------------------------------
+# HLS Transcoding Modes
+# ---------------------------------------------------------------------------
+HLS_TRANSCODE_MODE_SINGLE_PASS: str = "single_pass"   # one decode, all tiers
+HLS_TRANSCODE_MODE_PER_QUALITY: str = "per_quality"   # one FFmpeg run per tier
+
+
+# ---------------------------------------------------------------------------
+# HLS Source Modes (how FFmpeg reads the original upload)
+# ---------------------------------------------------------------------------
+HLS_SOURCE_MODE_DOWNLOAD: str = "download"             # full temp copy first
+HLS_SOURCE_MODE_PRESIGNED_URL: str = "presigned_url"   # FFmpeg reads over HTTPS
+HLS_SOURCE_MODE_PIPE: str = "pipe"                     # storage stream -> stdin
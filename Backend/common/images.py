@@ -0,0 +1,160 @@
+"""
+Responsive image derivatives for uploaded artwork.
+
+Cover art, banners and profile photos are uploaded as large originals.
+``build_derivatives`` renders fixed-width copies in modern formats (WebP,
+plus AVIF when Pillow supports it) under content-hashed names, so a list
+response can point at a few kilobytes instead of the full upload.
+
+The derivative map stored on the model holds storage *names*, not URLs,
+because URLs may be signed and expire; ``srcset`` resolves them per
+request.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+from typing import Any
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.fields.files import FieldFile
+from PIL import ExifTags, Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_ROOT = "derivatives/"
+
+# Pillow save() format name and file extension per derivative format
+FORMATS: dict[str, tuple[str, str]] = {
+    "avif": ("AVIF", "avif"),
+    "webp": ("WEBP", "webp"),
+}
+
+# (model label, image field) pairs that get derivatives; each model has a
+# ``<field>_variants`` JSONField holding the derivative map.
+IMAGE_FIELDS: tuple[tuple[str, str], ...] = (
+    ("music.Music", "cover_photo"),
+    ("music.Album", "cover_photo"),
+    ("music.Album", "banner_img"),
+    ("playlist.Playlist", "cover_photo"),
+    ("users.CustomUser", "profile_photo"),
+)
+
+
+def variants_field(field_name: str) -> str:
+    """Name of the JSONField holding the derivatives of *field_name*."""
+    return f"{field_name}_variants"
+
+
+def enabled_formats() -> list[str]:
+    """
+    Configured derivative formats that this Pillow build can encode.
+
+    Checks Pillow's save-handler registry rather than ``features.check``,
+    which warns about names (like ``avif`` before Pillow 11.2) it does not
+    know.
+    """
+    Image.init()
+    formats = []
+    for fmt in getattr(settings, "IMAGE_DERIVATIVE_FORMATS", ["avif", "webp"]):
+        if fmt not in FORMATS:
+            logger.warning("Unknown image derivative format=%s", fmt)
+        elif FORMATS[fmt][0] in Image.SAVE:
+            formats.append(fmt)
+    return formats
+
+
+def build_derivatives(field_file: FieldFile) -> dict[str, Any]:
+    """
+    Render every configured width and format of *field_file*.
+
+    Returns ``{"source": <original name>, "<format>": {"<width>": <name>}}``.
+    Names are derived from a hash of the original bytes, so re-uploading
+    the same image reuses existing objects and every object can be cached
+    forever.  Images are never upscaled; an original narrower than the
+    smallest width gets a single derivative at its own width.
+    """
+    with field_file.open("rb") as fh:
+        original = fh.read()
+    digest = hashlib.sha256(original).hexdigest()[:16]
+    quality = getattr(settings, "IMAGE_DERIVATIVE_QUALITY", 75)
+    formats = enabled_formats()
+
+    with Image.open(io.BytesIO(original)) as img:
+        # Widths follow the displayed (EXIF-rotated) size, so a portrait
+        # photo stored sideways is not upscaled
+        widths = _target_widths(_display_size(img)[0])
+        # Let the JPEG decoder downscale by a power of two up front; the
+        # square box keeps both sides large enough whatever the rotation
+        img.draft("RGB", (widths[-1], widths[-1]))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGBA" if _has_alpha(img) else "RGB")
+
+        variants: dict[str, Any] = {"source": field_file.name}
+        for fmt in formats:
+            variants[fmt] = {}
+        # Largest first, so each step resamples from a smaller image
+        for width in reversed(widths):
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.Resampling.LANCZOS)
+            for fmt in formats:
+                pil_format, ext = FORMATS[fmt]
+                name = f"{DERIVATIVE_ROOT}{digest}/{width}w_q{quality}.{ext}"
+                if not default_storage.exists(name):
+                    buffer = io.BytesIO()
+                    img.save(buffer, pil_format, quality=quality)
+                    default_storage.save(name, ContentFile(buffer.getvalue()))
+                variants[fmt][str(width)] = name
+
+    logger.info(
+        "Built image derivatives source=%s formats=%s widths=%s",
+        field_file.name, formats, widths,
+    )
+    return variants
+
+
+def srcset(variants: dict[str, Any] | None) -> dict[str, str] | None:
+    """
+    ``{"<format>": "<url> 96w, <url> 192w, ..."}`` for ``<source srcset>``.
+
+    Returns ``None`` while derivatives have not been generated yet, so the
+    client falls back to the original image URL.
+    """
+    if not variants:
+        return None
+    result = {}
+    for fmt in FORMATS:
+        sizes = variants.get(fmt)
+        if sizes:
+            result[fmt] = ", ".join(
+                f"{default_storage.url(name)} {width}w"
+                for width, name in sorted(sizes.items(), key=lambda item: int(item[0]))
+            )
+    return result or None
+
+
+def _target_widths(original_width: int) -> list[int]:
+    """Configured widths not larger than the original, smallest first."""
+    configured = sorted(getattr(settings, "IMAGE_DERIVATIVE_WIDTHS", [96, 192, 384, 768]))
+    widths = [w for w in configured if w <= original_width]
+    return widths or [original_width]
+
+
+# EXIF orientations that swap width and height (90/270 degree rotations)
+_TRANSPOSING_ORIENTATIONS = frozenset({5, 6, 7, 8})
+
+
+def _display_size(img: Image.Image) -> tuple[int, int]:
+    """``(width, height)`` of *img* once ``exif_transpose`` has been applied."""
+    orientation = img.getexif().get(ExifTags.Base.Orientation)
+    if orientation in _TRANSPOSING_ORIENTATIONS:
+        return img.height, img.width
+    return img.width, img.height
+
+
+def _has_alpha(img: Image.Image) -> bool:
+    return img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
@@ -0,0 +1,68 @@
+"""
+Queue image derivatives for artwork uploaded before the pipeline existed.
+
+Only images whose stored derivative map is missing or stale are queued
+(unless ``--force``).
+
+Examples:
+    python manage.py backfill_image_derivatives --dry-run
+    python manage.py backfill_image_derivatives --model music.Album
+"""
+
+from __future__ import annotations
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from common.images import IMAGE_FIELDS, variants_field
+from common.tasks import generate_image_derivatives
+
+
+class Command(BaseCommand):
+    help = "Queue responsive derivatives for existing cover art and profile photos"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            choices=sorted({label for label, _ in IMAGE_FIELDS}),
+            help="Only this model (default: all)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild derivatives that are already up to date",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only print how many images would be queued",
+        )
+
+    def handle(self, *args, **options):
+        targets = [
+            (label, field) for label, field in IMAGE_FIELDS
+            if not options["model"] or label == options["model"]
+        ]
+        if not targets:
+            raise CommandError("No image fields selected")
+
+        total = 0
+        for label, field_name in targets:
+            model = apps.get_model(label)
+            rows = (
+                model.objects.exclude(**{field_name: ""})
+                .exclude(**{f"{field_name}__isnull": True})
+                .values_list("pk", field_name, variants_field(field_name))
+            )
+            queued = 0
+            for pk, name, variants in rows.iterator():
+                if not options["force"] and (variants or {}).get("source") == name:
+                    continue
+                if not options["dry_run"]:
+                    generate_image_derivatives.delay(label, pk, field_name)
+                queued += 1
+            self.stdout.write(f"{label}.{field_name}: {queued}")
+            total += queued
+
+        verb = "Would queue" if options["dry_run"] else "Queued"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} images."))
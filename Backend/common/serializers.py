@@ -0,0 +1,21 @@
+"""
+Serializer fields shared across apps.
+"""
+
+from __future__ import annotations
+
+from rest_framework import serializers
+
+from common.images import srcset
+
+
+class SrcsetField(serializers.ReadOnlyField):
+    """
+    Expose an image's derivative map as ``{"<format>": "<srcset string>"}``.
+
+    Point ``source`` at the ``<field>_variants`` JSONField.  The value is
+    ``None`` until the derivatives have been generated.
+    """
+
+    def to_representation(self, value):
+        return srcset(value)
@@ -0,0 +1,49 @@
+"""
+Django signals for the common app.
+
+Handles:
+- Queueing image derivatives when an artwork field changes
+"""
+
+from __future__ import annotations
+
+import logging
+from functools import partial
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from common.images import IMAGE_FIELDS, variants_field
+from common.tasks import generate_image_derivatives
+
+logger = logging.getLogger(__name__)
+
+
+def queue_image_derivatives(sender, instance, **kwargs):
+    """
+    Queue derivatives for every image field whose derivatives are stale.
+
+    The stored map records the original it was built from, so comparing
+    names detects new uploads without tracking state in ``pre_save``.
+    """
+    label = sender._meta.label
+    for model_label, field_name in IMAGE_FIELDS:
+        if model_label != label:
+            continue
+        name = getattr(instance, field_name).name or ""
+        variants = getattr(instance, variants_field(field_name)) or {}
+        if variants.get("source", "") == name:
+            continue
+        logger.info("Queueing image derivatives model=%s pk=%s field=%s", label, instance.pk, field_name)
+        transaction.on_commit(
+            partial(generate_image_derivatives.delay, label, instance.pk, field_name)
+        )
+
+
+for _label in {model_label for model_label, _ in IMAGE_FIELDS}:
+    post_save.connect(
+        queue_image_derivatives,
+        sender=apps.get_model(_label),
+        dispatch_uid=f"image_derivatives_{_label}",
+    )
@@ -0,0 +1,66 @@
+"""
+Celery tasks shared across apps.
+
+Currently: responsive derivatives for uploaded images (see
+``common.images``).
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from celery import shared_task
+from django.apps import apps
+from PIL import Image, UnidentifiedImageError
+
+from common.images import build_derivatives, variants_field
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def generate_image_derivatives(self, model_label: str, pk: Any, field_name: str) -> dict[str, Any]:
+    """
+    Build the derivatives of one image field and store the map on the row.
+
+    The map is only saved if the field still holds the image it was built
+    from, so a replacement uploaded meanwhile is not overwritten with stale
+    derivatives (its own task will store the right ones).
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return {"status": "skipped", "message": "Object no longer exists"}
+
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        variants: dict[str, Any] = {}
+    else:
+        try:
+            variants = build_derivatives(field_file)
+        except (UnidentifiedImageError, Image.DecompressionBombError) as exc:
+            # Not an image Pillow can decode; retrying won't help.  Record the
+            # source with no formats so later saves don't queue it again, and
+            # let clients fall back to the original.
+            logger.warning(
+                "Image derivatives skipped, unreadable image model=%s pk=%s field=%s error=%s",
+                model_label, pk, field_name, exc,
+            )
+            variants = {"source": field_file.name}
+        except OSError as exc:
+            # Pillow raises OSError subclasses for unreadable images and
+            # storage backends for transient I/O failures alike
+            logger.warning(
+                "Image derivatives failed model=%s pk=%s field=%s error=%s",
+                model_label, pk, field_name, exc,
+            )
+            raise self.retry(exc=exc)
+
+    rows = model.objects.filter(pk=pk)
+    if field_file:
+        rows = rows.filter(**{field_name: field_file.name})
+    updated = rows.update(**{variants_field(field_name): variants})
+    if not updated:
+        return {"status": "skipped", "message": "Image changed while processing"}
+    return {"status": "success", "formats": [k for k in variants if k != "source"]}
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from common.serializers import SrcsetField
 from music.models import Music, Album
 from playlist.models import Playlist
 from artists.models import Artist
@@ -8,10 +9,11 @@ class Music_ListSerializer(serializers.ModelSerializer):
     artist_id = serializers.SerializerMethodField()
     album_name = serializers.SerializerMethodField()
     album_id = serializers.SerializerMethodField()
+    cover_photo_srcset = SrcsetField(source='cover_photo_variants')
 
     class Meta:
         model = Music
-        fields = ['id', 'name', 'artist', 'artist_id', 'cover_photo', 'album_name', 'album_id']
+        fields = ['id', 'name', 'artist', 'artist_id', 'cover_photo', 'cover_photo_srcset', 'album_name', 'album_id', 'preview_url']
 
     def get_artist(self, obj):
         return obj.artist.user.username
@@ -32,12 +34,13 @@ class Music_ListSerializer(serializers.ModelSerializer):
 class Playlist_ListSerializer(serializers.ModelSerializer):
     created_by = serializers.CharField(source='created_by.username', read_only = True)  # To show username
     cover_photo = serializers.ImageField()  # To show the image URL
+    cover_photo_srcset = SrcsetField(source='cover_photo_variants')
     duration = serializers.IntegerField()  # Total duration in seconds
     name = serializers.CharField()  # Playlist name
     
     class Meta:
         model = Playlist
-        fields = ['created_by', 'cover_photo', 'duration', 'name', 'id']        
+        fields = ['created_by', 'cover_photo', 'cover_photo_srcset', 'duration', 'name', 'id']        
         
 
 
@@ -46,11 +49,13 @@ class Album_ListSerializer(serializers.ModelSerializer):
     artist = serializers.CharField(source='artist.user.username')  # To show email or username
     cover_photo = serializers.ImageField()  # Cover photo image
     banner_img = serializers.ImageField(required=False)  # Banner image (optional)
+    cover_photo_srcset = SrcsetField(source='cover_photo_variants')
+    banner_img_srcset = SrcsetField(source='banner_img_variants')
     is_public = serializers.BooleanField()  # Whether the album is public
 
     class Meta:
         model = Album
-        fields = ['id', 'name', 'artist', 'cover_photo', 'banner_img', 'is_public']        
+        fields = ['id', 'name', 'artist', 'cover_photo', 'cover_photo_srcset', 'banner_img', 'banner_img_srcset', 'is_public']        
         
         
 from django.conf import settings
@@ -62,11 +67,12 @@ class ArtistSerializer(serializers.ModelSerializer):
     username = serializers.EmailField(source='user.username', read_only=True)
     
     profile_photo = serializers.ImageField(source='user.profile_photo', read_only=True, allow_null=True, required=False)
+    profile_photo_srcset = SrcsetField(source='user.profile_photo_variants')
     
     
     class Meta:
         model = Artist
-        fields = ['id', 'email', 'bio', 'status', 'profile_photo', 'username', 'submitted_at', 'updated_at']
+        fields = ['id', 'email', 'bio', 'status', 'profile_photo', 'profile_photo_srcset', 'username', 'submitted_at', 'updated_at']
         read_only_fields = ['status', 'submitted_at', 'updated_at']
 
 
@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import Music, Genre, EqualizerPreset, StreamingFile, UserPreference
+from .models import Music, Genre, EqualizerPreset, StreamingFile, TranscodeJob, UserPreference
 # Register your models here.
 admin.site.register(Genre)
 admin.site.register(Music)
 admin.site.register(StreamingFile)
+admin.site.register(TranscodeJob)
 admin.site.register(UserPreference)
 admin.site.register(EqualizerPreset)
\ No newline at end of file
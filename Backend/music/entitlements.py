@@ -0,0 +1,121 @@
+"""
+Per-user entitlement snapshot.
+
+Streaming, quality-preference and equalizer endpoints all need the same
+few facts about a user: are they premium, until when, which tiers they
+may stream, what they prefer and which EQ preset they picked.
+``get_entitlements`` computes them in one query and caches the result,
+so those endpoints stop reading ``UserSubscription`` and
+``UserPreference`` on every request.
+
+A premium snapshot never outlives the subscription's ``expires_at``, so
+expiry takes effect without any write.  Entries are dropped on commit by
+the ``UserSubscription`` / ``UserPreference`` signals in ``music.signals``
+and by the equalizer endpoint.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from common.constants import CACHE_PREFIX_ENTITLEMENTS, CACHE_PREFIX_USER_EQ_PRESET
+from music import hls
+from music.models import HLSQuality
+from premium.models import SubscriptionStatus
+from users.models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+# Bump when the shape of ``Entitlements`` changes (see music.manifest)
+ENTITLEMENTS_VERSION = 1
+
+DEFAULT_EQ_PRESET_ID = 1
+
+
+@dataclass(frozen=True)
+class Entitlements:
+    """What a user may stream, and how, at the time of the snapshot."""
+
+    user_id: int
+    is_premium: bool
+    plan_name: str | None
+    expires_at: datetime | None
+    max_quality: str
+    preferred_quality: str
+    eq_preset_id: int
+
+    @property
+    def quality(self) -> str:
+        """Stored preference clamped to what the subscription allows."""
+        if self.preferred_quality in hls.qualities_up_to(self.max_quality):
+            return self.preferred_quality
+        return self.max_quality
+
+
+def cache_key(user_id: int) -> str:
+    return f"{CACHE_PREFIX_ENTITLEMENTS}_v{ENTITLEMENTS_VERSION}_{user_id}"
+
+
+def eq_preset_cache_key(user_id: int) -> str:
+    return f"{CACHE_PREFIX_USER_EQ_PRESET}:{user_id}"
+
+
+def get_entitlements(user: CustomUser) -> Entitlements:
+    """Entitlement snapshot of *user* from the cache, computed on a miss."""
+    key = cache_key(user.pk)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_entitlements(user.pk)
+        cache.set(key, snapshot, timeout=_ttl(snapshot))
+    return snapshot
+
+
+def build_entitlements(user_id: int) -> Entitlements:
+    """
+    Compute the snapshot of *user_id* from the database in one query.
+
+    Unlike ``UserSubscription.is_active`` this never writes: a lapsed
+    ``ACTIVE`` subscription is simply treated as not premium.
+    """
+    user = CustomUser.objects.select_related("subscription__plan", "preference").get(pk=user_id)
+    subscription = getattr(user, "subscription", None)
+    preference = getattr(user, "preference", None)
+
+    is_premium = bool(
+        subscription
+        and subscription.status == SubscriptionStatus.ACTIVE
+        and (subscription.expires_at is None or subscription.expires_at > timezone.now())
+    )
+    return Entitlements(
+        user_id=user_id,
+        is_premium=is_premium,
+        plan_name=subscription.plan.name if is_premium and subscription.plan else None,
+        expires_at=subscription.expires_at if is_premium else None,
+        max_quality=HLSQuality.LOSSLESS if is_premium else HLSQuality.LOW,
+        preferred_quality=preference.preferred_quality if preference else HLSQuality.LOW,
+        eq_preset_id=(
+            cache.get(eq_preset_cache_key(user_id), DEFAULT_EQ_PRESET_ID)
+            if is_premium else DEFAULT_EQ_PRESET_ID
+        ),
+    )
+
+
+def invalidate(user_id: int) -> None:
+    """Drop the cached snapshot of one user."""
+    cache.delete(cache_key(user_id))
+    logger.debug("Invalidated entitlements user_id=%s", user_id)
+
+
+def _ttl(snapshot: Entitlements) -> int:
+    """Configured TTL, cut short so a premium snapshot expires with the subscription."""
+    ttl = getattr(settings, "ENTITLEMENT_CACHE_TTL", 300)
+    if snapshot.expires_at is not None:
+        remaining = (snapshot.expires_at - timezone.now()).total_seconds()
+        ttl = min(ttl, max(1, int(remaining)))
+    return ttl
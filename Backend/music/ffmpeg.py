@@ -0,0 +1,317 @@
+"""
+FFmpeg process helpers for the HLS transcoding pipeline.
+
+Wraps ``subprocess`` so callers can stream the source into FFmpeg's
+stdin while it encodes, instead of materialising a local copy first.
+FFmpeg runs under ``ExecutionLimits`` (threads, CPU/IO priority, address
+space) so an encode cannot starve other processes on the host, and
+failures are raised as ``FFmpegError`` with a coarse ``kind`` that
+callers use to decide whether retrying can help.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import resource
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import BinaryIO
+
+logger = logging.getLogger(__name__)
+
+STDIN_CHUNK_SIZE_BYTES = 1024 * 1024  # 1 MB
+STDERR_CHUNK_SIZE_BYTES = 64 * 1024
+POLL_INTERVAL_SECONDS = 0.5
+
+# ``FFmpegError.kind`` values
+FAILURE_TIMEOUT = "timeout"
+FAILURE_OOM = "oom"
+FAILURE_MEMORY_LIMIT = "memory_limit"
+FAILURE_BAD_INPUT = "bad_input"
+FAILURE_ERROR = "error"
+
+# stderr fragments that mean the input itself cannot be decoded
+_BAD_INPUT_MARKERS: tuple[str, ...] = (
+    "Invalid data found when processing input",
+    "could not find codec parameters",
+    "moov atom not found",
+    "does not contain any stream",
+    "Decoder (codec none) not found",
+)
+# stderr fragments of a failed allocation, i.e. ``RLIMIT_AS`` was reached
+_MEMORY_LIMIT_MARKERS: tuple[str, ...] = (
+    "Cannot allocate memory",
+    "Out of memory",
+)
+
+# Add to an FFmpeg command to receive ``on_progress`` callbacks
+PROGRESS_ARGS: tuple[str, ...] = ("-progress", "pipe:1", "-nostats")
+
+# Measurement-only filter chain; per-frame lines are logged at verbose level
+# so only the summary reaches stderr.
+EBUR128_FILTER = "ebur128=peak=true:framelog=verbose,anullsink"
+
+_EBUR128_INTEGRATED = re.compile(r"^\s*I:\s+(-?[\d.]+|-inf)\s+LUFS", re.MULTILINE)
+_EBUR128_TRUE_PEAK = re.compile(r"^\s*Peak:\s+(-?[\d.]+|-inf)\s+dBFS", re.MULTILINE)
+
+
+@dataclass(frozen=True)
+class ExecutionLimits:
+    """
+    Resource limits applied to every FFmpeg process.
+
+    ``0`` disables a limit.  *threads* caps decoder and filter threads,
+    *nice* lowers CPU priority, *idle_io* puts FFmpeg in the idle I/O
+    class (via ``ionice`` when installed), *memory_limit_mb* sets
+    ``RLIMIT_AS`` so a runaway encode fails instead of waking the OOM
+    killer, and *stderr_tail_bytes* bounds how much stderr is kept.
+    """
+    threads: int = 0
+    nice: int = 0
+    idle_io: bool = False
+    memory_limit_mb: int = 0
+    stderr_tail_bytes: int = 256 * 1024
+
+
+class FFmpegError(subprocess.SubprocessError):
+    """FFmpeg failed; *kind* is one of the ``FAILURE_*`` constants."""
+
+    def __init__(self, kind: str, returncode: int | None, stderr: str) -> None:
+        super().__init__(f"FFmpeg failed kind={kind} returncode={returncode}")
+        self.kind = kind
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+def classify_failure(returncode: int, stderr: str) -> str:
+    """
+    Map a failed FFmpeg exit to a ``FAILURE_*`` kind.
+
+    ``FAILURE_OOM`` is an external SIGKILL (kernel or cgroup OOM killer),
+    which depends on what else was running.  ``FAILURE_MEMORY_LIMIT`` is an
+    allocation refused under our own address-space cap, which recurs on
+    every attempt with the same cap.
+    """
+    if returncode == -signal.SIGKILL:
+        # SIGKILL without our timeout is the kernel OOM killer (or cgroup)
+        return FAILURE_OOM
+    if any(m in stderr for m in _MEMORY_LIMIT_MARKERS):
+        return FAILURE_MEMORY_LIMIT
+    if any(m in stderr for m in _BAD_INPUT_MARKERS):
+        return FAILURE_BAD_INPUT
+    return FAILURE_ERROR
+
+
+def run_ffmpeg(
+    cmd: list[str],
+    *,
+    timeout: float,
+    stdin: BinaryIO | None = None,
+    on_poll: Callable[[], None] | None = None,
+    on_progress: Callable[[dict[str, str]], None] | None = None,
+    pass_fds: tuple[int, ...] = (),
+    limits: ExecutionLimits | None = None,
+) -> subprocess.CompletedProcess[str]:
+    """
+    Run an FFmpeg command under *limits* and wait for it to finish.
+
+    When *stdin* is given it is copied into the process in chunks from a
+    background thread, so decoding starts as soon as the first bytes
+    arrive.  *on_poll* is called every ``POLL_INTERVAL_SECONDS`` while
+    FFmpeg runs, e.g. to pick up finished segments.  *on_progress*
+    receives the latest ``-progress`` block (``out_time_us``,
+    ``total_size``, ...) at the same cadence and once more at the end;
+    the command must include ``PROGRESS_ARGS``.  Both callbacks run on
+    the calling thread.  *pass_fds* are inherited by FFmpeg (for extra
+    ``pipe:N`` outputs); the caller keeps and closes its copies.
+
+    Only the last ``limits.stderr_tail_bytes`` of stderr are kept.
+    Raises ``FFmpegError`` when FFmpeg exits non-zero or (after killing
+    it) when *timeout* seconds elapse.
+    """
+    limits = limits or ExecutionLimits()
+    proc = subprocess.Popen(
+        _limited_command(cmd, limits),
+        stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE if on_progress else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        pass_fds=pass_fds,
+    )
+    _apply_process_limits(proc.pid, limits)
+
+    stderr_chunks: deque[bytes] = deque(
+        maxlen=max(1, limits.stderr_tail_bytes // STDERR_CHUNK_SIZE_BYTES)
+    )
+    progress = _ProgressState()
+    threads = [
+        threading.Thread(target=_drain, args=(proc.stderr, stderr_chunks), daemon=True),
+    ]
+    if stdin is not None:
+        threads.append(
+            threading.Thread(target=_feed, args=(stdin, proc.stdin), daemon=True)
+        )
+    if on_progress:
+        threads.append(
+            threading.Thread(target=_read_progress, args=(proc.stdout, progress), daemon=True)
+        )
+    for thread in threads:
+        thread.start()
+
+    polling = on_poll is not None or on_progress is not None
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                proc.kill()
+                proc.wait()
+                raise FFmpegError(FAILURE_TIMEOUT, proc.returncode, _decode(stderr_chunks))
+            wait_for = min(POLL_INTERVAL_SECONDS, remaining) if polling else remaining
+            try:
+                returncode = proc.wait(timeout=wait_for)
+                break
+            except subprocess.TimeoutExpired:
+                if on_poll:
+                    on_poll()
+                if on_progress and (block := progress.take()):
+                    on_progress(block)
+    finally:
+        for thread in threads:
+            thread.join(timeout=5)
+
+    if on_progress and (block := progress.take()):
+        on_progress(block)
+
+    stderr = _decode(stderr_chunks)
+    if returncode != 0:
+        raise FFmpegError(classify_failure(returncode, stderr), returncode, stderr)
+    return subprocess.CompletedProcess(cmd, returncode, stdout=None, stderr=stderr)
+
+
+def parse_ebur128_summary(stderr: str) -> tuple[float | None, float | None]:
+    """
+    Extract ``(integrated_lufs, true_peak_dbtp)`` from ``ebur128`` output.
+
+    Either value is ``None`` when missing or ``-inf`` (digital silence).
+    """
+    _, found, summary = stderr.rpartition("Summary:")
+    if not found:
+        return None, None
+
+    def _value(pattern: re.Pattern[str]) -> float | None:
+        match = pattern.search(summary)
+        if not match or match.group(1) == "-inf":
+            return None
+        return float(match.group(1))
+
+    return _value(_EBUR128_INTEGRATED), _value(_EBUR128_TRUE_PEAK)
+
+
+def _limited_command(cmd: list[str], limits: ExecutionLimits) -> list[str]:
+    """Insert thread caps after the binary and wrap in ``ionice`` if asked."""
+    cmd = list(cmd)
+    if limits.threads:
+        # Global filter thread caps, plus the decoder threads of the first input
+        threads = str(limits.threads)
+        cmd[1:1] = [
+            "-filter_threads", threads,
+            "-filter_complex_threads", threads,
+            "-threads", threads,
+        ]
+    if limits.idle_io:
+        ionice = shutil.which("ionice")
+        if ionice:
+            cmd = [ionice, "-c", "3", *cmd]
+        else:
+            logger.debug("ionice not installed; running FFmpeg with default I/O priority")
+    return cmd
+
+
+def _apply_process_limits(pid: int, limits: ExecutionLimits) -> None:
+    """
+    Lower priority and cap the address space of a just-started process.
+
+    Applied from the parent with ``setpriority``/``prlimit`` rather than a
+    ``preexec_fn``, which is unsafe while other threads are running.
+    """
+    try:
+        if limits.nice:
+            os.setpriority(os.PRIO_PROCESS, pid, limits.nice)
+        if limits.memory_limit_mb:
+            limit = limits.memory_limit_mb * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+    except ProcessLookupError:
+        pass  # Already exited; the exit status tells the rest
+    except OSError:
+        logger.warning("Could not apply FFmpeg resource limits pid=%s", pid, exc_info=True)
+
+
+def _feed(src: BinaryIO, dst: BinaryIO) -> None:
+    """Copy *src* into FFmpeg's stdin, tolerating FFmpeg exiting early."""
+    try:
+        shutil.copyfileobj(src, dst, STDIN_CHUNK_SIZE_BYTES)
+    except (BrokenPipeError, ValueError):
+        logger.debug("FFmpeg closed stdin before the source was fully read")
+    except Exception:
+        logger.exception("Error streaming source into FFmpeg")
+    finally:
+        try:
+            dst.close()
+        except OSError:
+            pass
+
+
+class _ProgressState:
+    """Latest complete ``-progress`` block, handed from the reader thread."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._block: dict[str, str] | None = None
+
+    def put(self, block: dict[str, str]) -> None:
+        with self._lock:
+            self._block = block
+
+    def take(self) -> dict[str, str] | None:
+        """Return the newest unseen block, if any."""
+        with self._lock:
+            block, self._block = self._block, None
+            return block
+
+
+def _read_progress(stream: BinaryIO, state: _ProgressState) -> None:
+    """Parse ``key=value`` lines; each block ends with a ``progress=`` line."""
+    block: dict[str, str] = {}
+    for raw in iter(stream.readline, b""):
+        key, sep, value = raw.decode("utf-8", errors="replace").strip().partition("=")
+        if not sep:
+            continue
+        block[key] = value
+        if key == "progress":
+            state.put(block)
+            block = {}
+    stream.close()
+
+
+def _drain(stream: BinaryIO, chunks: deque[bytes]) -> None:
+    """
+    Read a pipe to EOF so FFmpeg never blocks on a full buffer.
+
+    *chunks* is bounded, so only the tail survives; FFmpeg prints the
+    interesting parts (errors, the ``ebur128`` summary) last.
+    """
+    for chunk in iter(lambda: stream.read(STDERR_CHUNK_SIZE_BYTES), b""):
+        chunks.append(chunk)
+    stream.close()
+
+
+def _decode(chunks: deque[bytes]) -> str:
+    return b"".join(chunks).decode("utf-8", errors="replace")
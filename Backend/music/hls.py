@@ -0,0 +1,69 @@
+"""
+HLS playlist helpers shared by the transcoding tasks and streaming views.
+
+Pure functions only — no storage or database access.
+"""
+
+from __future__ import annotations
+
+from music.models import HLSQuality
+
+# AAC-LC, which is what FFmpeg's native ``aac`` encoder produces
+AAC_LC_CODEC: str = "mp4a.40.2"
+
+# Headroom on top of the nominal bitrate for container overhead, so the
+# advertised BANDWIDTH is a safe peak rather than an average.
+BANDWIDTH_OVERHEAD: float = 1.1
+
+# EXT-X-SESSION-DATA ids carrying loudness metadata in master playlists
+SESSION_DATA_REPLAY_GAIN: str = "com.wave.replaygain.track_gain_db"
+SESSION_DATA_LOUDNESS: str = "com.wave.loudness.integrated_lufs"
+
+
+def quality_rank(quality: str) -> int:
+    """Position of *quality* from lowest (0) to highest tier."""
+    return HLSQuality.values.index(quality)
+
+
+def qualities_up_to(cap: str) -> list[str]:
+    """All tiers at or below *cap*, lowest first."""
+    return HLSQuality.values[: quality_rank(cap) + 1]
+
+
+def parse_bitrate(value: str) -> int:
+    """Convert an FFmpeg bitrate such as ``"128k"`` to bits per second."""
+    value = value.strip().lower()
+    multiplier = 1
+    if value.endswith("k"):
+        multiplier, value = 1000, value[:-1]
+    elif value.endswith("m"):
+        multiplier, value = 1_000_000, value[:-1]
+    return int(float(value) * multiplier)
+
+
+def master_playlist_name(music_id: int, cap: str) -> str:
+    """File name of the master playlist offering tiers up to *cap*."""
+    return f"{music_id}_master_{cap}.m3u8"
+
+
+def render_master_playlist(
+    variants: list[tuple[str, int]],
+    session_data: dict[str, str] | None = None,
+) -> str:
+    """
+    Render a master playlist from ``(variant_uri, bitrate_bps)`` pairs.
+
+    Variants are listed lowest bitrate first so players start cheap and
+    switch up as throughput allows.  *session_data* entries become
+    ``EXT-X-SESSION-DATA`` tags (e.g. the ReplayGain track gain).
+    """
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for data_id, value in (session_data or {}).items():
+        lines.append(f'#EXT-X-SESSION-DATA:DATA-ID="{data_id}",VALUE="{value}"')
+    for uri, bitrate in sorted(variants, key=lambda v: v[1]):
+        lines.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={int(bitrate * BANDWIDTH_OVERHEAD)},"
+            f"AVERAGE-BANDWIDTH={bitrate},CODECS=\"{AAC_LC_CODEC}\""
+        )
+        lines.append(uri)
+    return "\n".join(lines) + "\n"
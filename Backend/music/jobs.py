@@ -0,0 +1,192 @@
+"""
+Persistent state tracking for HLS transcode jobs.
+
+``TranscodeTracker`` records per-tier status, FFmpeg progress, timings and
+output size on ``TranscodeJob`` / ``TranscodeTier`` rows, so a retried
+task can skip tiers that already finished and the artist studio can read
+progress without polling the track endpoints.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import time
+from collections.abc import Callable, Iterable
+from datetime import timedelta
+
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+from music.models import (
+    Music,
+    StreamingFile,
+    TranscodeJob,
+    TranscodeStatus,
+    TranscodeTier,
+)
+
+logger = logging.getLogger(__name__)
+
+# Minimum gap between progress writes for the same tiers
+PROGRESS_UPDATE_INTERVAL_SECONDS = 2.0
+
+
+def settings_fingerprint(*parts: object) -> str:
+    """Stable hash of the encoder settings a rendition depends on."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def source_fingerprint(music: Music) -> str:
+    """
+    Stable hash identifying the original audio of *music*.
+
+    Covers the storage name as well as ``audio_sha256``, so a file replaced
+    outside the upload serializer (which is what refreshes the hash) still
+    counts as a new source.
+    """
+    return settings_fingerprint(music.audio_file.name, music.audio_sha256)
+
+
+class TranscodeTracker:
+    """Writes the progress of one transcode run to its ``TranscodeJob``."""
+
+    def __init__(self, job: TranscodeJob, duration: timedelta | None) -> None:
+        self.job = job
+        self._duration_us = duration.total_seconds() * 1_000_000 if duration else None
+
+    @classmethod
+    def start(
+        cls,
+        music: Music,
+        qualities: Iterable[str],
+        fingerprint: str,
+        source_fingerprint: str = "",
+    ) -> TranscodeTracker:
+        """
+        Begin a run for *music*, creating the job and tier rows as needed.
+
+        Tiers produced under a different *fingerprint* (encoder settings) or
+        *source_fingerprint* (the original audio, see ``source_fingerprint``)
+        are discarded, so a settings change or a replaced upload re-encodes
+        every tier.
+        """
+        job, _ = TranscodeJob.objects.get_or_create(music=music)
+        if (
+            job.settings_fingerprint != fingerprint
+            or job.source_fingerprint != source_fingerprint
+        ):
+            job.tiers.all().delete()
+        TranscodeTier.objects.bulk_create(
+            [TranscodeTier(job=job, quality=q) for q in qualities],
+            ignore_conflicts=True,
+        )
+        TranscodeJob.objects.filter(pk=job.pk).update(
+            status=TranscodeStatus.RUNNING,
+            attempts=F("attempts") + 1,
+            settings_fingerprint=fingerprint,
+            source_fingerprint=source_fingerprint,
+            error="",
+            started_at=timezone.now(),
+            finished_at=None,
+        )
+        job.refresh_from_db()
+        return cls(job, music.duration)
+
+    @staticmethod
+    def reset(music_id: int) -> None:
+        """Mark every tier of a track as pending again (after cleanup)."""
+        TranscodeTier.objects.filter(job__music_id=music_id).update(
+            status=TranscodeStatus.PENDING,
+            progress=0.0,
+            bytes_written=0,
+            started_at=None,
+            finished_at=None,
+        )
+
+    @staticmethod
+    def fail(music_id: int, error: str) -> None:
+        """Mark the job of a track failed when its run died before ``start`` returned."""
+        TranscodeJob.objects.filter(music_id=music_id).update(
+            status=TranscodeStatus.FAILED,
+            error=error[:2000],
+            finished_at=timezone.now(),
+        )
+        logger.info("Transcode job music_id=%s status=%s", music_id, TranscodeStatus.FAILED)
+
+    def completed_qualities(self) -> set[str]:
+        """Tiers finished in an earlier run whose ``StreamingFile`` still exists."""
+        published = StreamingFile.objects.filter(music_id=self.job.music_id).values("quality")
+        return set(
+            self.job.tiers.filter(status=TranscodeStatus.COMPLETED, quality__in=published)
+            .values_list("quality", flat=True)
+        )
+
+    def tiers_started(self, qualities: Iterable[str]) -> None:
+        self._tiers(qualities).update(
+            status=TranscodeStatus.RUNNING,
+            progress=0.0,
+            bytes_written=0,
+            started_at=timezone.now(),
+            finished_at=None,
+        )
+
+    def progress_callback(self, qualities: Iterable[str]) -> Callable[[dict[str, str]], None]:
+        """
+        Return an ``on_progress`` handler for an FFmpeg run encoding *qualities*.
+
+        Writes are throttled to one per ``PROGRESS_UPDATE_INTERVAL_SECONDS``
+        (plus the final block).  Progress is only a fraction when the track
+        duration is known.  ``bytes_written`` is only written for a
+        single-tier run: FFmpeg's ``total_size`` covers every output, so
+        a single-pass run leaves it to ``tier_completed``.
+        """
+        qualities = list(qualities)
+        last_write = 0.0
+
+        def _on_progress(block: dict[str, str]) -> None:
+            nonlocal last_write
+            now = time.monotonic()
+            if block.get("progress") != "end" and now - last_write < PROGRESS_UPDATE_INTERVAL_SECONDS:
+                return
+            last_write = now
+
+            fields: dict[str, float | int] = {}
+            out_time_us = block.get("out_time_us", "")
+            if self._duration_us and out_time_us.isdigit():
+                fields["progress"] = min(1.0, int(out_time_us) / self._duration_us)
+            total_size = block.get("total_size", "")
+            if len(qualities) == 1 and total_size.isdigit():
+                fields["bytes_written"] = int(total_size)
+            if fields:
+                self._tiers(qualities).update(**fields)
+
+        return _on_progress
+
+    def tier_completed(self, quality: str, bytes_written: int) -> None:
+        self._tiers([quality]).update(
+            status=TranscodeStatus.COMPLETED,
+            progress=1.0,
+            bytes_written=bytes_written,
+            finished_at=timezone.now(),
+        )
+
+    def tier_failed(self, quality: str) -> None:
+        self._tiers([quality]).update(
+            status=TranscodeStatus.FAILED,
+            finished_at=timezone.now(),
+        )
+
+    def finish(self, status: str, error: str = "") -> None:
+        """Record the outcome of this run on the job."""
+        TranscodeJob.objects.filter(pk=self.job.pk).update(
+            status=status,
+            error=error[:2000],
+            finished_at=timezone.now(),
+        )
+        logger.info("Transcode job music_id=%s status=%s", self.job.music_id, status)
+
+    def _tiers(self, qualities: Iterable[str]) -> QuerySet[TranscodeTier]:
+        return TranscodeTier.objects.filter(job_id=self.job.pk, quality__in=list(qualities))
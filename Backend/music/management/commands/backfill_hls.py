@@ -0,0 +1,173 @@
+"""
+Re-encode the HLS renditions of many tracks without flooding the broker.
+
+Tracks are split into ``--concurrency`` lanes; each lane runs its tracks
+one after another, so at most that many backfill encodes are in flight.
+A track is queued only once the previous one in its lane has finished,
+whether it succeeded or failed (see ``music.tasks.queue_backfill_lane``).
+``--rate`` spaces the tracks of every lane so that no more than that many
+encodes start per minute overall.
+
+Re-running the command resumes a backfill: tracks whose ``TranscodeJob``
+already completed with the current encoder settings are skipped, and a
+retried track skips the tiers it had finished.  ``--force`` selects those
+tracks too and has the task discard their finished tiers.
+
+Examples:
+    python manage.py backfill_hls --dry-run
+    python manage.py backfill_hls --concurrency 2 --rate 6
+    python manage.py backfill_hls --artist 12 --only-missing
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count, Q, QuerySet, Sum
+
+from music.models import Music, MusicApprovalStatus, TranscodeStatus
+from music.tasks import QUALITY_SETTINGS, current_settings_fingerprint, queue_backfill_lane
+
+# CPU seconds per second of audio per quality tier (decode + AAC encode +
+# muxing).  Tune with --cpu-factor after timing a few real encodes.
+DEFAULT_CPU_FACTOR = 0.05
+
+
+class Command(BaseCommand):
+    help = "Backfill HLS renditions for a filtered set of tracks via throttled Celery lanes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ids", nargs="+", type=int, help="Only these track ids")
+        parser.add_argument("--artist", type=int, help="Only tracks of this artist id")
+        parser.add_argument(
+            "--all-statuses",
+            action="store_true",
+            help="Include pending/rejected tracks (default: approved only)",
+        )
+        parser.add_argument(
+            "--only-missing",
+            action="store_true",
+            help="Only tracks without any streaming files",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Re-encode every tier, including tracks already completed with the current settings",
+        )
+        parser.add_argument("--limit", type=int, help="Process at most this many tracks")
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of parallel lanes, i.e. max backfill encodes in flight (default: 1)",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Max encodes started per minute across all lanes (default: unlimited)",
+        )
+        parser.add_argument(
+            "--cpu-factor",
+            type=float,
+            default=DEFAULT_CPU_FACTOR,
+            help=f"CPU seconds per audio second per tier for estimates (default: {DEFAULT_CPU_FACTOR})",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only print the selection and estimated CPU-hours",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        rate = options["rate"]
+        if concurrency < 1:
+            raise CommandError("--concurrency must be at least 1")
+        if rate < 0:
+            raise CommandError("--rate must not be negative")
+
+        queryset = self._select_tracks(options)
+        music_ids = list(queryset.values_list("id", flat=True))
+        if options["limit"]:
+            music_ids = music_ids[: options["limit"]]
+
+        if not music_ids:
+            self.stdout.write("Nothing to backfill.")
+            return
+
+        self._print_estimate(music_ids, concurrency, rate, options["cpu_factor"])
+        if options["dry_run"]:
+            return
+
+        # Space the tracks of each lane so all lanes together start at most
+        # ``rate`` encodes per minute.
+        spacing = concurrency * 60.0 / rate if rate else 0
+        lanes = [music_ids[i::concurrency] for i in range(concurrency)]
+        for lane_index, lane in enumerate(lanes):
+            if lane:
+                # Stagger the first track of each lane as well
+                queue_backfill_lane(
+                    lane,
+                    force=options["force"],
+                    spacing=spacing,
+                    countdown=lane_index * spacing / concurrency,
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Queued {len(music_ids)} tracks in {sum(1 for lane in lanes if lane)} lanes."
+        ))
+
+    def _select_tracks(self, options) -> QuerySet[Music]:
+        queryset = Music.objects.exclude(audio_file="")
+        if not options["all_statuses"]:
+            queryset = queryset.filter(approval_status=MusicApprovalStatus.APPROVED)
+        if options["ids"]:
+            queryset = queryset.filter(id__in=options["ids"])
+        if options["artist"]:
+            queryset = queryset.filter(artist_id=options["artist"])
+        if options["only_missing"]:
+            queryset = queryset.annotate(
+                stream_count=Count("streaming_files")
+            ).filter(stream_count=0)
+        if not options["force"]:
+            # Checkpoint: skip tracks already done with the current settings
+            queryset = queryset.exclude(
+                Q(transcode_job__status=TranscodeStatus.COMPLETED)
+                & Q(transcode_job__settings_fingerprint=current_settings_fingerprint())
+            )
+        # Shortest first, so progress is visible early
+        return queryset.order_by("duration", "id")
+
+    def _print_estimate(
+        self, music_ids: list[int], concurrency: int, rate: float, cpu_factor: float,
+    ) -> None:
+        stats = Music.objects.filter(id__in=music_ids).aggregate(
+            total=Sum("duration"),
+            average=Avg("duration"),
+            known=Count("duration"),
+        )
+        known = stats["known"]
+        unknown = len(music_ids) - known
+        average = stats["average"] or timedelta(minutes=4)
+        audio_seconds = (
+            (stats["total"] or timedelta()).total_seconds()
+            + unknown * average.total_seconds()
+        )
+        cpu_hours = audio_seconds * len(QUALITY_SETTINGS) * cpu_factor / 3600
+        wall_hours = cpu_hours / concurrency
+        if rate:
+            wall_hours = max(wall_hours, len(music_ids) / rate / 60)
+
+        self.stdout.write(f"Tracks selected:      {len(music_ids)}")
+        self.stdout.write(
+            f"Audio duration:       {audio_seconds / 3600:.1f} h"
+            + (f" ({unknown} tracks without duration assumed {average})" if unknown else "")
+        )
+        self.stdout.write(f"Quality tiers:        {len(QUALITY_SETTINGS)}")
+        self.stdout.write(f"Estimated CPU time:   {cpu_hours:.1f} CPU-hours")
+        self.stdout.write(
+            f"Estimated wall time:  {wall_hours:.1f} h "
+            f"(concurrency={concurrency}, rate={rate or 'unlimited'}/min)"
+        )
@@ -0,0 +1,329 @@
+"""
+Benchmark the HLS transcode pipeline over a synthetic audio corpus.
+
+For every combination of ``--durations``, ``--codecs`` and ``--modes`` a
+test signal (tone plus noise, so encoders have real work to do) is
+generated with FFmpeg's ``lavfi`` sources and run through
+``_transcode_all_qualities`` exactly as the Celery task would.  The
+database rows created for a case are rolled back and its output deleted
+afterwards.
+
+``--storage filesystem`` (default) writes to a throwaway ``MEDIA_ROOT``.
+``--storage s3`` uses the configured S3 storage and must point at a
+local stand-in such as MinIO via ``AWS_S3_ENDPOINT_URL``.
+
+Reported per case: wall time (over ``--rounds``), realtime factor, peak
+RSS of the FFmpeg children and, per tier, encode time, bytes written and
+object count.  ``--json`` writes a pytest-benchmark style report for
+regression tracking.
+
+Peak RSS is the kernel's high-water mark over all FFmpeg processes run
+so far, so cases are run shortest first; run a single case per
+invocation for an isolated figure.
+
+Examples:
+    python manage.py benchmark_transcode
+    python manage.py benchmark_transcode --durations 30 600 --codecs wav --modes per_quality
+    python manage.py benchmark_transcode --rounds 3 --json bench.json
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from artists.models import Artist, ArtistVerificationStatus
+from common.constants import HLS_TRANSCODE_MODE_PER_QUALITY, HLS_TRANSCODE_MODE_SINGLE_PASS
+from music import s3
+from music.jobs import TranscodeTracker
+from music.models import Music, MusicApprovalStatus
+from music.tasks import (
+    QUALITY_SETTINGS,
+    _cleanup_s3_objects,
+    _local_hls_dir,
+    _s3_hls_prefix,
+    _transcode_all_qualities,
+    current_settings_fingerprint,
+)
+from users.models import CustomUser
+
+# FFmpeg encoder arguments per synthetic source codec (the upload formats
+# ``Music.audio_file`` accepts)
+SOURCE_CODECS: dict[str, list[str]] = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "192k"],
+    "wav": ["-c:a", "pcm_s16le"],
+    "aac": ["-c:a", "aac", "-b:a", "192k", "-f", "adts"],
+}
+STORAGE_FILESYSTEM = "filesystem"
+STORAGE_S3 = "s3"
+
+
+class Command(BaseCommand):
+    help = "Benchmark HLS transcoding over synthetic audio and report speed, memory and output size"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--durations",
+            nargs="+",
+            type=int,
+            default=[30, 180, 600],
+            help="Source lengths in seconds (default: 30 180 600)",
+        )
+        parser.add_argument(
+            "--codecs",
+            nargs="+",
+            choices=sorted(SOURCE_CODECS),
+            default=["mp3"],
+            help="Source codecs (default: mp3)",
+        )
+        parser.add_argument(
+            "--modes",
+            nargs="+",
+            choices=[HLS_TRANSCODE_MODE_SINGLE_PASS, HLS_TRANSCODE_MODE_PER_QUALITY],
+            default=[HLS_TRANSCODE_MODE_SINGLE_PASS],
+            help="HLS_TRANSCODE_MODE values to compare (default: single_pass)",
+        )
+        parser.add_argument(
+            "--storage",
+            choices=[STORAGE_FILESYSTEM, STORAGE_S3],
+            default=STORAGE_FILESYSTEM,
+            help="Where renditions are written (default: filesystem)",
+        )
+        parser.add_argument("--rounds", type=int, default=1, help="Runs per case (default: 1)")
+        parser.add_argument("--json", dest="json_path", help="Write a JSON report to this path")
+
+    def handle(self, *args, **options):
+        if not shutil.which("ffmpeg"):
+            raise CommandError("ffmpeg is not installed")
+        if options["rounds"] < 1:
+            raise CommandError("--rounds must be at least 1")
+        if options["storage"] == STORAGE_S3:
+            self._check_s3_stand_in()
+
+        cases = sorted(
+            itertools.product(options["durations"], options["codecs"], options["modes"]),
+        )
+        benchmarks = []
+        with tempfile.TemporaryDirectory(prefix="wave-bench-") as work_dir:
+            corpus = {
+                (duration, codec): self._generate_source(work_dir, duration, codec)
+                for duration, codec, _ in cases
+            }
+            for duration, codec, mode in cases:
+                name = f"{mode}-{codec}-{duration}s-{options['storage']}"
+                self.stdout.write(f"Running {name} ...")
+                rounds = [
+                    self._run_case(corpus[(duration, codec)], duration, mode, options["storage"], work_dir)
+                    for _ in range(options["rounds"])
+                ]
+                benchmarks.append(_summarise(name, duration, codec, mode, options["storage"], rounds))
+
+        self._print_table(benchmarks)
+        if options["json_path"]:
+            report = {
+                "machine_info": _machine_info(),
+                "datetime": timezone.now().isoformat(),
+                "settings_fingerprint": current_settings_fingerprint(),
+                "benchmarks": benchmarks,
+            }
+            Path(options["json_path"]).write_text(json.dumps(report, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['json_path']}"))
+
+    def _check_s3_stand_in(self) -> None:
+        if missing := s3.missing_settings():
+            raise CommandError(f"--storage s3 needs {', '.join(missing)}")
+        if not getattr(settings, "AWS_S3_ENDPOINT_URL", ""):
+            raise CommandError(
+                "--storage s3 must run against a local S3 stand-in (e.g. MinIO); "
+                "set AWS_S3_ENDPOINT_URL"
+            )
+
+    def _generate_source(self, work_dir: str, duration: int, codec: str) -> str:
+        """Render *duration* seconds of stereo tone + noise in *codec*."""
+        path = os.path.join(work_dir, f"source_{duration}s.{codec}")
+        subprocess.run(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "lavfi", "-i", f"sine=frequency=220:duration={duration}:sample_rate=44100",
+                "-f", "lavfi", "-i", f"anoisesrc=duration={duration}:amplitude=0.05:sample_rate=44100",
+                "-filter_complex", "[0:a][1:a]amix=inputs=2,aformat=channel_layouts=stereo",
+                *SOURCE_CODECS[codec],
+                path,
+            ],
+            check=True,
+        )
+        return path
+
+    def _run_case(
+        self, source_path: str, duration: int, mode: str, storage: str, work_dir: str,
+    ) -> dict[str, Any]:
+        overrides: dict[str, Any] = {"HLS_TRANSCODE_MODE": mode}
+        if storage == STORAGE_FILESYSTEM:
+            overrides.update(
+                USE_S3_MEDIA_STORAGE=False,
+                MEDIA_ROOT=os.path.join(work_dir, "media"),
+                MEDIA_URL="/media/",
+                STORAGES={
+                    **settings.STORAGES,
+                    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                },
+            )
+        else:
+            overrides.update(USE_S3_MEDIA_STORAGE=True, DEBUG=False)
+
+        with override_settings(**overrides), transaction.atomic():
+            music = _create_track(source_path)
+            tracker = TranscodeTracker.start(music, QUALITY_SETTINGS, current_settings_fingerprint())
+            try:
+                started = time.monotonic()
+                streams = _transcode_all_qualities(music.id, music, dict(QUALITY_SETTINGS), tracker)
+                seconds = time.monotonic() - started
+                tiers = {
+                    tier.quality: {
+                        "status": tier.status,
+                        "seconds": _tier_seconds(tier),
+                        "bytes": tier.bytes_written,
+                        "objects": _count_objects(music.id, tier.quality, storage),
+                    }
+                    for tier in tracker.job.tiers.all()
+                }
+            finally:
+                _delete_output(music, storage)
+                transaction.set_rollback(True)
+
+        for stats in tiers.values():
+            stats["realtime_factor"] = (
+                round(duration / stats["seconds"], 2) if stats["seconds"] else None
+            )
+        return {
+            "seconds": seconds,
+            "streams": len(streams),
+            "peak_rss_mb": _children_peak_rss_mb(),
+            "tiers": tiers,
+        }
+
+    def _print_table(self, benchmarks: list[dict[str, Any]]) -> None:
+        self.stdout.write("")
+        self.stdout.write(
+            f"{'case':<40} {'mean s':>8} {'x realtime':>10} {'peak RSS MB':>12} "
+            f"{'bytes':>12} {'objects':>8}"
+        )
+        for bench in benchmarks:
+            extra = bench["extra_info"]
+            self.stdout.write(
+                f"{bench['name']:<40} {bench['stats']['mean']:>8.2f} "
+                f"{extra['realtime_factor']:>10.1f} {extra['peak_rss_mb']:>12.1f} "
+                f"{extra['bytes']:>12} {extra['objects']:>8}"
+            )
+
+
+def _create_track(source_path: str) -> Music:
+    """Throwaway user, artist and track holding *source_path* as its original."""
+    tag = uuid.uuid4().hex[:12]
+    user = CustomUser.objects.create(
+        email=f"bench-{tag}@example.invalid",
+        username=f"bench-{tag}",
+        first_name="Bench",
+        last_name="Mark",
+    )
+    artist = Artist.objects.create(user=user, status=ArtistVerificationStatus.APPROVED)
+    music = Music(
+        artist=artist,
+        name=f"Benchmark {tag}",
+        approval_status=MusicApprovalStatus.APPROVED,
+        release_date=timezone.now(),
+        is_public=False,
+    )
+    with open(source_path, "rb") as fh:
+        music.audio_file.save(f"bench_{tag}{Path(source_path).suffix}", File(fh), save=False)
+    music.save()
+    return music
+
+
+def _delete_output(music: Music, storage: str) -> None:
+    """Remove the original and every HLS artefact written for *music*."""
+    if storage == STORAGE_S3:
+        _cleanup_s3_objects(music.id)
+    else:
+        shutil.rmtree(_local_hls_dir(music.id), ignore_errors=True)
+    music.audio_file.delete(save=False)
+
+
+def _count_objects(music_id: int, quality: str, storage: str) -> int:
+    if storage == STORAGE_S3:
+        return sum(1 for _ in s3.iter_keys(_s3_hls_prefix(music_id, quality)))
+    tier_dir = Path(_local_hls_dir(music_id, quality))
+    return sum(1 for fp in tier_dir.iterdir() if fp.is_file()) if tier_dir.is_dir() else 0
+
+
+def _tier_seconds(tier) -> float | None:
+    if tier.started_at and tier.finished_at:
+        return round((tier.finished_at - tier.started_at).total_seconds(), 3)
+    return None
+
+
+def _children_peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+def _summarise(
+    name: str, duration: int, codec: str, mode: str, storage: str, rounds: list[dict[str, Any]],
+) -> dict[str, Any]:
+    """One pytest-benchmark style entry; per-tier figures come from the last round."""
+    timings = [r["seconds"] for r in rounds]
+    last = rounds[-1]
+    mean = statistics.fmean(timings)
+    return {
+        "name": name,
+        "params": {"duration": duration, "codec": codec, "mode": mode, "storage": storage},
+        "stats": {
+            "min": min(timings),
+            "max": max(timings),
+            "mean": mean,
+            "median": statistics.median(timings),
+            "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            "rounds": len(timings),
+        },
+        "extra_info": {
+            "realtime_factor": round(duration / mean, 2) if mean else 0.0,
+            "peak_rss_mb": max(r["peak_rss_mb"] for r in rounds),
+            "streams": last["streams"],
+            "bytes": sum(t["bytes"] for t in last["tiers"].values()),
+            "objects": sum(t["objects"] for t in last["tiers"].values()),
+            "tiers": last["tiers"],
+        },
+    }
+
+
+def _machine_info() -> dict[str, Any]:
+    ffmpeg_version = subprocess.run(
+        ["ffmpeg", "-version"], capture_output=True, text=True,
+    ).stdout.split("\n", 1)[0]
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "release": platform.release(),
+        "python_version": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version,
+    }
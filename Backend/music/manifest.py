@@ -0,0 +1,190 @@
+"""
+Per-track streaming manifest cache.
+
+A ``StreamManifest`` holds everything ``MusicStreamingView`` needs to
+answer a stream start: the tier -> playlist map, master playlists,
+visibility, owner, artist name, cover and loudness.  Renditions only
+change when a transcode or cleanup runs, so the manifest is kept in Redis
+and steady-state stream starts never touch Postgres.
+
+Entries are invalidated on commit by the ``Music`` / ``StreamingFile`` /
+``CustomUser`` signals in ``music.signals``, and explicitly by the HLS
+tasks, which write with ``QuerySet.update()`` and so bypass signals.
+
+A request that read the database just before a commit must not write its
+stale manifest back after the invalidation.  Each track therefore has a
+generation token, a random value so that an evicted token is never
+recreated with an old one.  ``invalidate`` replaces the token, entries
+are tagged with the token read *before* the database read, and an entry
+only counts while its tag matches the current token.
+``STREAM_MANIFEST_CACHE_TTL`` is only a safety net.
+"""
+
+from __future__ import annotations
+
+import logging
+import uuid
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from common.constants import CACHE_PREFIX_STREAM_MANIFEST
+from music.models import Music, StreamingFile
+
+logger = logging.getLogger(__name__)
+
+# Bump when the shape of ``StreamManifest`` changes, so entries pickled by
+# an older deploy are ignored rather than unpickled into the wrong shape.
+MANIFEST_VERSION = 2
+
+
+@dataclass(frozen=True)
+class StreamManifest:
+    """Cached streaming view of one track; field names mirror ``Music``."""
+
+    id: int
+    name: str
+    is_public: bool
+    owner_id: int
+    artist_name: str
+    cover_photo: str
+    loudness_lufs: float | None
+    true_peak_dbtp: float | None
+    renditions: dict[str, str] = field(default_factory=dict)
+    hls_master_playlists: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def cover_photo_url(self) -> str | None:
+        # Resolved per request: storage URLs may be signed and expire
+        return default_storage.url(self.cover_photo) if self.cover_photo else None
+
+    def get_replay_gain_db(self) -> float | None:
+        return Music(
+            loudness_lufs=self.loudness_lufs, true_peak_dbtp=self.true_peak_dbtp,
+        ).get_replay_gain_db()
+
+
+def cache_key(music_id: int) -> str:
+    return f"{CACHE_PREFIX_STREAM_MANIFEST}_v{MANIFEST_VERSION}_{music_id}"
+
+
+def generation_key(music_id: int) -> str:
+    return f"{CACHE_PREFIX_STREAM_MANIFEST}_gen_{music_id}"
+
+
+def get_manifest(music_id: int) -> StreamManifest | None:
+    """Manifest of *music_id* from the cache, built on a miss; ``None`` if no such track."""
+    return get_manifests([music_id]).get(music_id)
+
+
+def get_manifests(music_ids: Iterable[int]) -> dict[int, StreamManifest]:
+    """
+    Manifests of several tracks keyed by id, for batch stream resolution.
+
+    One cache round trip when everything is cached; the misses are built
+    together with two queries however many there are.  Ids of missing
+    tracks are left out.
+    """
+    music_ids = list(dict.fromkeys(music_ids))
+    cached = cache.get_many(
+        [cache_key(music_id) for music_id in music_ids]
+        + [generation_key(music_id) for music_id in music_ids]
+    )
+
+    manifests: dict[int, StreamManifest] = {}
+    generations: dict[int, str | None] = {}
+    for music_id in music_ids:
+        generation = cached.get(generation_key(music_id))
+        entry = cached.get(cache_key(music_id))
+        if generation is not None and entry is not None and entry[0] == generation:
+            manifests[music_id] = entry[1]
+        else:
+            generations[music_id] = generation
+    if not generations:
+        return manifests
+
+    # The token has to be known before the database is read (see module docstring)
+    unset = [music_id for music_id, generation in generations.items() if generation is None]
+    for music_id in unset:
+        cache.add(generation_key(music_id), uuid.uuid4().hex, timeout=None)
+    if unset:
+        current = cache.get_many([generation_key(music_id) for music_id in unset])
+        for music_id in unset:
+            generations[music_id] = current.get(generation_key(music_id))
+
+    built = build_manifests(generations)
+    cache.set_many(
+        {
+            cache_key(music_id): (generations[music_id], value)
+            for music_id, value in built.items()
+            if generations[music_id] is not None
+        },
+        timeout=getattr(settings, "STREAM_MANIFEST_CACHE_TTL", 86400),
+    )
+    manifests.update(built)
+    return manifests
+
+
+def build_manifest(music_id: int) -> StreamManifest | None:
+    """Read the manifest of *music_id* from the database (two queries)."""
+    return build_manifests([music_id]).get(music_id)
+
+
+def build_manifests(music_ids: Iterable[int]) -> dict[int, StreamManifest]:
+    """Read the manifests of *music_ids* from the database (two queries in total)."""
+    music_ids = list(music_ids)
+    tracks = (
+        Music.objects.select_related("artist__user")
+        .only(
+            "id", "name", "is_public", "cover_photo", "loudness_lufs", "true_peak_dbtp",
+            "hls_master_playlists", "artist__user__id", "artist__user__username",
+        )
+        .filter(pk__in=music_ids)
+    )
+    renditions: dict[int, dict[str, str]] = {}
+    for music_id, quality, url in StreamingFile.objects.filter(
+        music_id__in=music_ids,
+    ).values_list("music_id", "quality", "hls_playlist"):
+        renditions.setdefault(music_id, {})[quality] = url
+
+    return {
+        music.id: StreamManifest(
+            id=music.id,
+            name=music.name,
+            is_public=music.is_public,
+            owner_id=music.artist.user.id,
+            artist_name=music.artist.user.username,
+            cover_photo=music.cover_photo.name or "",
+            loudness_lufs=music.loudness_lufs,
+            true_peak_dbtp=music.true_peak_dbtp,
+            renditions=renditions.get(music.id, {}),
+            hls_master_playlists=dict(music.hls_master_playlists or {}),
+        )
+        for music in tracks
+    }
+
+
+def invalidate(music_id: int) -> None:
+    """Invalidate the cached manifest of one track."""
+    invalidate_many([music_id])
+    logger.debug("Invalidated stream manifest music_id=%s", music_id)
+
+
+def invalidate_many(music_ids: Iterable[int]) -> None:
+    """
+    Invalidate the cached manifests of several tracks in two round trips.
+
+    The new generation tokens are what invalidates: an entry tagged with an
+    older token is ignored even if it is written back after this call.
+    Deleting the entries only frees the memory early.
+    """
+    music_ids = list(music_ids)
+    if not music_ids:
+        return
+    cache.set_many(
+        {generation_key(music_id): uuid.uuid4().hex for music_id in music_ids}, timeout=None,
+    )
+    cache.delete_many([cache_key(music_id) for music_id in music_ids])
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0007_alter_album_options_alter_albumtrack_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='music',
+            name='audio_sha256',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the uploaded audio, used to reuse HLS renditions of identical uploads.', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0008_music_audio_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamingfile',
+            name='segment_format',
+            field=models.CharField(choices=[('mpegts', 'MPEG-TS segments'), ('fmp4', 'fMP4 / CMAF single file')], default='mpegts', help_text='Whether the playlist references .ts segments or byte ranges of one fMP4 file.', max_length=10),
+        ),
+    ]
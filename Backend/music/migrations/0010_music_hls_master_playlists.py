@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0009_streamingfile_segment_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='music',
+            name='hls_master_playlists',
+            field=models.JSONField(blank=True, default=dict, help_text='Master HLS playlist URL per maximum quality tier, for adaptive streaming.'),
+        ),
+    ]
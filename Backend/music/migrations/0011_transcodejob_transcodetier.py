@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0010_music_hls_master_playlists'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscodeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('settings_fingerprint', models.CharField(blank=True, help_text='Hash of the encoder settings the completed tiers were produced with.', max_length=64)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('music', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='transcode_job', to='music.music')),
+            ],
+            options={
+                'verbose_name': 'transcode job',
+                'verbose_name_plural': 'transcode jobs',
+            },
+        ),
+        migrations.CreateModel(
+            name='TranscodeTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quality', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('lossless', 'Lossless')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('progress', models.FloatField(default=0.0, help_text='Fraction encoded, 0.0 to 1.0.')),
+                ('bytes_written', models.BigIntegerField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiers', to='music.transcodejob')),
+            ],
+            options={
+                'verbose_name': 'transcode tier',
+                'verbose_name_plural': 'transcode tiers',
+                'constraints': [models.UniqueConstraint(fields=('job', 'quality'), name='unique_transcode_job_quality')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0011_transcodejob_transcodetier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='music',
+            name='loudness_lufs',
+            field=models.FloatField(blank=True, help_text='EBU R128 integrated loudness, measured while transcoding.', null=True),
+        ),
+        migrations.AddField(
+            model_name='music',
+            name='true_peak_dbtp',
+            field=models.FloatField(blank=True, help_text='EBU R128 true peak in dBTP, measured while transcoding.', null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0012_music_loudness'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='music',
+            name='bitrate',
+            field=models.PositiveIntegerField(blank=True, help_text='Bitrate of the uploaded audio in bits per second, read from its headers.', null=True),
+        ),
+        migrations.AddField(
+            model_name='music',
+            name='sample_rate',
+            field=models.PositiveIntegerField(blank=True, help_text='Sample rate of the uploaded audio in Hz.', null=True),
+        ),
+        migrations.AddField(
+            model_name='music',
+            name='channels',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
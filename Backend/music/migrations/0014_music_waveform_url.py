@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0013_music_audio_properties'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='music',
+            name='waveform_url',
+            field=models.CharField(blank=True, help_text='URL of the int8 waveform peaks blob for the player scrubber.', max_length=500),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0014_music_waveform_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='music',
+            name='cover_photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Responsive WebP/AVIF derivatives of cover_photo (see common.images).'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='cover_photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Responsive WebP/AVIF derivatives of cover_photo (see common.images).'),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='banner_img_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Responsive WebP/AVIF derivatives of banner_img (see common.images).'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0015_music_cover_photo_variants_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='music',
+            name='preview_url',
+            field=models.CharField(blank=True, help_text='URL of the short low-bitrate preview clip for browse lists.', max_length=500),
+        ),
+    ]
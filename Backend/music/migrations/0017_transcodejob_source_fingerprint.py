@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0016_music_preview_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcodejob',
+            name='source_fingerprint',
+            field=models.CharField(blank=True, help_text='Hash of the original audio (storage name and content hash) the completed tiers were produced from.', max_length=64),
+        ),
+    ]
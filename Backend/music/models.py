@@ -10,6 +10,7 @@ from __future__ import annotations
 import logging
 import os
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
 from django.db import models
@@ -40,6 +41,22 @@ class HLSQuality(models.TextChoices):
     LOSSLESS = "lossless", "Lossless"
 
 
+class HLSSegmentFormat(models.TextChoices):
+    """Container used for the media segments of an HLS rendition."""
+
+    MPEGTS = "mpegts", "MPEG-TS segments"
+    FMP4 = "fmp4", "fMP4 / CMAF single file"
+
+
+class TranscodeStatus(models.TextChoices):
+    """Lifecycle of an HLS transcode job and of each of its tiers."""
+
+    PENDING = "pending", "Pending"
+    RUNNING = "running", "Running"
+    COMPLETED = "completed", "Completed"
+    FAILED = "failed", "Failed"
+
+
 class AlbumStatus(models.TextChoices):
     """Publication states for albums."""
 
@@ -83,18 +100,66 @@ class Music(models.Model):
     )
     name = models.CharField(max_length=200, unique=True)
     cover_photo = models.ImageField(upload_to="music_covers/")
+    cover_photo_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Responsive WebP/AVIF derivatives of cover_photo (see common.images).",
+    )
     audio_file = models.FileField(
         upload_to="music/",
         validators=[FileExtensionValidator(allowed_extensions=["mp3", "wav", "aac"])],
     )
+    audio_sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="SHA-256 of the uploaded audio, used to reuse HLS renditions of identical uploads.",
+    )
     video_file = models.FileField(
         upload_to="music_videos/",
         null=True,
         blank=True,
         validators=[FileExtensionValidator(allowed_extensions=["mp4", "mov"])],
     )
+    hls_master_playlists = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Master HLS playlist URL per maximum quality tier, for adaptive streaming.",
+    )
     genres = models.ManyToManyField(Genre, related_name="musical_works")
     duration = models.DurationField(null=True, blank=True)
+    bitrate = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Bitrate of the uploaded audio in bits per second, read from its headers.",
+    )
+    sample_rate = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Sample rate of the uploaded audio in Hz.",
+    )
+    channels = models.PositiveSmallIntegerField(null=True, blank=True)
+    loudness_lufs = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="EBU R128 integrated loudness, measured while transcoding.",
+    )
+    true_peak_dbtp = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="EBU R128 true peak in dBTP, measured while transcoding.",
+    )
+    waveform_url = models.CharField(
+        max_length=500,
+        blank=True,
+        help_text="URL of the int8 waveform peaks blob for the player scrubber.",
+    )
+    preview_url = models.CharField(
+        max_length=500,
+        blank=True,
+        help_text="URL of the short low-bitrate preview clip for browse lists.",
+    )
     approval_status = models.CharField(
         max_length=20,
         choices=MusicApprovalStatus.choices,
@@ -124,6 +189,20 @@ class Music(models.Model):
                 "At least one of audio_file or video_file must be provided."
             )
 
+    def get_replay_gain_db(self) -> float | None:
+        """
+        Playback gain that brings the track to ``LOUDNESS_TARGET_LUFS``.
+
+        Boosts are limited so the true peak stays at or below -1 dBTP.
+        ``None`` until the loudness has been measured.
+        """
+        if self.loudness_lufs is None:
+            return None
+        gain = getattr(settings, "LOUDNESS_TARGET_LUFS", -14.0) - self.loudness_lufs
+        if self.true_peak_dbtp is not None:
+            gain = min(gain, -1.0 - self.true_peak_dbtp)
+        return round(gain, 2)
+
     def save(self, *args: object, **kwargs: object) -> None:
         """Truncate excessively long cover-photo filenames before saving."""
         if self.cover_photo:
@@ -145,6 +224,12 @@ class StreamingFile(models.Model):
     )
     quality = models.CharField(max_length=20, choices=HLSQuality.choices)
     hls_playlist = models.URLField(help_text="URL to the .m3u8 file")
+    segment_format = models.CharField(
+        max_length=10,
+        choices=HLSSegmentFormat.choices,
+        default=HLSSegmentFormat.MPEGTS,
+        help_text="Whether the playlist references .ts segments or byte ranges of one fMP4 file.",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -161,6 +246,83 @@ class StreamingFile(models.Model):
         return f"{self.music.name} - {self.quality}"
 
 
+class TranscodeJob(models.Model):
+    """
+    Persistent state of the HLS transcode of one track.
+
+    One job per track, reused across retries and re-transcodes.  Tiers
+    already completed under the same ``settings_fingerprint`` and
+    ``source_fingerprint`` are skipped when the task runs again.
+    """
+
+    music = models.OneToOneField(
+        Music,
+        on_delete=models.CASCADE,
+        related_name="transcode_job",
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=TranscodeStatus.choices,
+        default=TranscodeStatus.PENDING,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    settings_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Hash of the encoder settings the completed tiers were produced with.",
+    )
+    source_fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Hash of the original audio (storage name and content hash) the completed tiers were produced from.",
+    )
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "transcode job"
+        verbose_name_plural = "transcode jobs"
+
+    def __str__(self) -> str:
+        return f"{self.music_id} - {self.status}"
+
+
+class TranscodeTier(models.Model):
+    """Progress of one quality tier within a ``TranscodeJob``."""
+
+    job = models.ForeignKey(
+        TranscodeJob,
+        on_delete=models.CASCADE,
+        related_name="tiers",
+    )
+    quality = models.CharField(max_length=20, choices=HLSQuality.choices)
+    status = models.CharField(
+        max_length=20,
+        choices=TranscodeStatus.choices,
+        default=TranscodeStatus.PENDING,
+    )
+    progress = models.FloatField(default=0.0, help_text="Fraction encoded, 0.0 to 1.0.")
+    bytes_written = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "transcode tier"
+        verbose_name_plural = "transcode tiers"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["job", "quality"],
+                name="unique_transcode_job_quality",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.job.music_id} - {self.quality} - {self.status}"
+
+
 class UserPreference(models.Model):
     """Stores user's preferred streaming quality setting."""
 
@@ -207,12 +369,24 @@ class Album(models.Model):
         upload_to="album_covers/",
         validators=[FileExtensionValidator(allowed_extensions=["jpg", "jpeg", "png"])],
     )
+    cover_photo_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Responsive WebP/AVIF derivatives of cover_photo (see common.images).",
+    )
     banner_img = models.ImageField(
         upload_to="album_banners/",
         validators=[FileExtensionValidator(allowed_extensions=["jpg", "jpeg", "png"])],
         null=True,
         blank=True,
     )
+    banner_img_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Responsive WebP/AVIF derivatives of banner_img (see common.images).",
+    )
     tracks = models.ManyToManyField(
         Music,
         related_name="albums",
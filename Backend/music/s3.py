@@ -0,0 +1,302 @@
+"""
+Shared S3 client and parallel uploader for HLS artefacts.
+
+boto3 clients are thread-safe, so a single client per process (with a
+connection pool sized for the upload workers) is reused by every task
+instead of building a new one for each quality tier.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from django.conf import settings
+
+from common.constants import HLS_CONTENT_TYPES
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_SETTINGS: tuple[str, ...] = (
+    "AWS_ACCESS_KEY_ID",
+    "AWS_SECRET_ACCESS_KEY",
+    "AWS_STORAGE_BUCKET_NAME",
+    "AWS_S3_REGION_NAME",
+)
+
+# DeleteObjects accepts at most this many keys per call
+DELETE_BATCH_SIZE = 1000
+
+DEFAULT_CACHE_CONTROL = "max-age=86400"
+# For content-addressed objects whose bytes never change under one key
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_client_lock = threading.Lock()
+_client = None
+_client_pid: int | None = None
+
+
+@dataclass(frozen=True)
+class UploadReport:
+    """Outcome of uploading one HLS directory."""
+    files: int
+    bytes: int
+    seconds: float
+
+    @property
+    def bytes_per_sec(self) -> float:
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+
+def missing_settings() -> list[str]:
+    """Return the names of required AWS settings that are not configured."""
+    return [attr for attr in REQUIRED_SETTINGS if not getattr(settings, attr, None)]
+
+
+def get_s3_client():
+    """
+    Return the process-wide S3 client.
+
+    The client is rebuilt after a fork (Celery prefork children must not
+    share the parent's connection pool).
+    """
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = boto3.client(
+                "s3",
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                region_name=settings.AWS_S3_REGION_NAME,
+                endpoint_url=getattr(settings, "AWS_S3_ENDPOINT_URL", None) or None,
+                config=Config(
+                    max_pool_connections=getattr(settings, "AWS_S3_MAX_POOL_CONNECTIONS", 32),
+                    retries={"max_attempts": 5, "mode": "standard"},
+                ),
+            )
+            _client_pid = os.getpid()
+        return _client
+
+
+def upload_hls_directory(directory: str, prefix: str) -> UploadReport:
+    """
+    Upload every file in *directory* under *prefix* in the media bucket.
+
+    Segments are uploaded concurrently; playlists go last so a player can
+    never fetch a playlist that references a segment not yet uploaded.
+    Raises ``botocore.exceptions.ClientError`` if any upload fails.
+    """
+    files = [p for p in Path(directory).iterdir() if p.is_file()]
+    playlists = [p for p in files if p.suffix == ".m3u8"]
+    segments = [p for p in files if p.suffix != ".m3u8"]
+
+    started = time.monotonic()
+    workers = max(1, getattr(settings, "HLS_UPLOAD_MAX_CONCURRENCY", 8))
+    if segments:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hls-upload") as pool:
+            # list() re-raises the first upload error, if any
+            list(pool.map(lambda fp: upload_file(fp, prefix + fp.name), segments))
+    for fp in playlists:
+        upload_file(fp, prefix + fp.name)
+    elapsed = time.monotonic() - started
+
+    report = UploadReport(
+        files=len(files),
+        bytes=sum(fp.stat().st_size for fp in files),
+        seconds=elapsed,
+    )
+    logger.info(
+        "Uploaded prefix=%s files=%s bytes=%s seconds=%.2f bytes_per_sec=%d",
+        prefix, report.files, report.bytes, report.seconds, report.bytes_per_sec,
+    )
+    return report
+
+
+class IncrementalUploader:
+    """
+    Upload HLS segments as soon as FFmpeg closes them.
+
+    FFmpeg writes each segment to ``<name>.tmp`` and renames it when the
+    segment is complete (``-hls_flags temp_file``), so any segment file
+    without the ``.tmp`` suffix is safe to upload.  Call :meth:`scan`
+    periodically while encoding and :meth:`finish` once FFmpeg exits;
+    playlists are only published by :meth:`finish`.
+    """
+
+    def __init__(self, prefixes: dict[str, str]) -> None:
+        # Local directory -> key prefix in the bucket
+        self._prefixes = prefixes
+        self._seen: set[Path] = set()
+        self._futures: list[Future[None]] = []
+        self._bytes = 0
+        self._started = time.monotonic()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, getattr(settings, "HLS_UPLOAD_MAX_CONCURRENCY", 8)),
+            thread_name_prefix="hls-upload",
+        )
+
+    def scan(self) -> None:
+        """Queue every newly finished segment for upload."""
+        for directory, prefix in self._prefixes.items():
+            for fp in Path(directory).iterdir():
+                if fp in self._seen or fp.suffix in (".m3u8", ".tmp") or not fp.is_file():
+                    continue
+                self._seen.add(fp)
+                self._bytes += fp.stat().st_size
+                self._futures.append(self._pool.submit(upload_file, fp, prefix + fp.name))
+
+    def finish(self) -> UploadReport:
+        """Upload the remaining segments, then the playlists."""
+        try:
+            self.scan()
+            for future in self._futures:
+                future.result()
+        finally:
+            self._pool.shutdown(wait=True)
+
+        playlists = 0
+        for directory, prefix in self._prefixes.items():
+            for fp in Path(directory).glob("*.m3u8"):
+                upload_file(fp, prefix + fp.name)
+                self._bytes += fp.stat().st_size
+                playlists += 1
+
+        report = UploadReport(
+            files=len(self._seen) + playlists,
+            bytes=self._bytes,
+            seconds=time.monotonic() - self._started,
+        )
+        logger.info(
+            "Incrementally uploaded files=%s bytes=%s seconds=%.2f bytes_per_sec=%d",
+            report.files, report.bytes, report.seconds, report.bytes_per_sec,
+        )
+        return report
+
+    def abort(self) -> None:
+        """Stop uploading; segments already sent are left for cleanup."""
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def upload_file(path: Path, key: str) -> None:
+    """Upload a single HLS artefact with the right content type."""
+    content_type = HLS_CONTENT_TYPES.get(path.suffix.lstrip("."), "application/octet-stream")
+    with open(path, "rb") as fh:
+        get_s3_client().upload_fileobj(
+            fh,
+            settings.AWS_STORAGE_BUCKET_NAME,
+            key,
+            ExtraArgs={"ContentType": content_type, "CacheControl": DEFAULT_CACHE_CONTROL},
+            Config=_transfer_config(),
+        )
+    logger.debug("Uploaded %s", key)
+
+
+def iter_objects(prefix: str) -> Iterator[dict]:
+    """
+    Yield every object (``Key``, ``Size``, ``LastModified``, ...) under
+    *prefix* in key order, one listing page at a time.
+    """
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Prefix=prefix):
+        yield from page.get("Contents", [])
+
+
+def iter_keys(prefix: str) -> Iterator[str]:
+    """Yield every object key under *prefix*, following pagination."""
+    for obj in iter_objects(prefix):
+        yield obj["Key"]
+
+
+def delete_keys(
+    keys: Iterable[str],
+    batch_size: int = DELETE_BATCH_SIZE,
+    pause_seconds: float = 0.0,
+) -> int:
+    """
+    Delete *keys* with one ``DeleteObjects`` call per *batch_size* keys.
+
+    Sleeps *pause_seconds* between calls to stay well under the bucket's
+    request rate.  Keys S3 refuses to delete are logged, not raised.
+    Returns the number of keys deleted.
+    """
+    batch_size = min(max(1, batch_size), DELETE_BATCH_SIZE)
+    deleted = calls = 0
+    batch: list[str] = []
+
+    def _flush() -> None:
+        nonlocal deleted, calls
+        if calls and pause_seconds:
+            time.sleep(pause_seconds)
+        calls += 1
+        resp = get_s3_client().delete_objects(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+        )
+        errors = resp.get("Errors", [])
+        for error in errors[:10]:
+            logger.warning("Delete failed key=%s code=%s", error.get("Key"), error.get("Code"))
+        deleted += len(batch) - len(errors)
+        batch.clear()
+
+    for key in keys:
+        batch.append(key)
+        if len(batch) >= batch_size:
+            _flush()
+    if batch:
+        _flush()
+    return deleted
+
+
+def copy_objects(pairs: list[tuple[str, str]]) -> None:
+    """Server-side copy ``(source_key, dest_key)`` pairs concurrently."""
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+
+    def _copy(pair: tuple[str, str]) -> None:
+        src, dst = pair
+        get_s3_client().copy_object(
+            Bucket=bucket,
+            Key=dst,
+            CopySource={"Bucket": bucket, "Key": src},
+            MetadataDirective="COPY",
+        )
+
+    workers = max(1, getattr(settings, "HLS_UPLOAD_MAX_CONCURRENCY", 8))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hls-copy") as pool:
+        list(pool.map(_copy, pairs))
+
+
+def read_object(key: str) -> bytes:
+    """Return the body of a (small) object such as a playlist."""
+    resp = get_s3_client().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+    return resp["Body"].read()
+
+
+def put_object(key: str, body: bytes, cache_control: str = DEFAULT_CACHE_CONTROL) -> None:
+    """Write a small in-memory object with the right HLS content type."""
+    suffix = key.rsplit(".", 1)[-1]
+    get_s3_client().put_object(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=key,
+        Body=body,
+        ContentType=HLS_CONTENT_TYPES.get(suffix, "application/octet-stream"),
+        CacheControl=cache_control,
+    )
+
+
+def _transfer_config() -> TransferConfig:
+    """Transfer settings for one object (parallelism is across objects)."""
+    return TransferConfig(
+        multipart_threshold=8 * 1024 * 1024,
+        multipart_chunksize=8 * 1024 * 1024,
+        use_threads=False,
+    )
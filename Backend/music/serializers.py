@@ -1,7 +1,10 @@
+from django.conf import settings
 from rest_framework import serializers
+from common.serializers import SrcsetField
 from .models import Genre, Music
 from artists.models import Artist
-from .models import Album, AlbumTrack, Music, EqualizerPreset, UserPreference
+from .models import Album, AlbumTrack, Music, EqualizerPreset, TranscodeJob, TranscodeTier, UserPreference
+from .services import MusicService
 from users.models import CustomUser
 
 import os
@@ -18,6 +21,22 @@ class MusicMetadataSerializer(serializers.Serializer):
     format = serializers.CharField()        
 
 
+class StreamBatchRequestSerializer(serializers.Serializer):
+    """Track ids to resolve in one batch stream request, in play order."""
+
+    music_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+    )
+
+    def validate_music_ids(self, value):
+        max_tracks = getattr(settings, "STREAM_BATCH_MAX_TRACKS", 10)
+        value = list(dict.fromkeys(value))
+        if len(value) > max_tracks:
+            raise serializers.ValidationError(f"At most {max_tracks} tracks per request.")
+        return value
+
+
 class UserPreferenceSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserPreference
@@ -36,6 +55,7 @@ class MusicSerializer(serializers.ModelSerializer):
     total_plays = serializers.SerializerMethodField()
     album_name = serializers.SerializerMethodField()
     current_album_id = serializers.SerializerMethodField()
+    cover_photo_srcset = SrcsetField(source='cover_photo_variants')
 
     class Meta:
         model = Music
@@ -44,8 +64,10 @@ class MusicSerializer(serializers.ModelSerializer):
             'video_file', 'genres', 'release_date',
             'approval_status', 'duration', 'artist', 'is_public',
             'album_id', 'track_number', 'hls_processing_complete',
-            'total_plays', 'album_name', 'current_album_id'
+            'total_plays', 'album_name', 'current_album_id',
+            'bitrate', 'sample_rate', 'channels', 'cover_photo_srcset'
         ]
+        read_only_fields = ['bitrate', 'sample_rate', 'channels']
 
     def get_total_plays(self, obj):
         if hasattr(obj, 'annotated_total_plays'):
@@ -91,6 +113,8 @@ class MusicSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         album_id = validated_data.pop('album_id', None)
         track_number = validated_data.pop('track_number', None)
+        self._hash_audio_file(validated_data)
+        self._probe_audio_file(validated_data)
         
         # Create the music track with duration included
         music = super().create(validated_data)
@@ -107,6 +131,35 @@ class MusicSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError({'album_id': 'Album not found'})
             
         return music
+
+    def update(self, instance, validated_data):
+        self._hash_audio_file(validated_data)
+        self._probe_audio_file(validated_data)
+        return super().update(instance, validated_data)
+
+    @staticmethod
+    def _hash_audio_file(validated_data):
+        """Fingerprint a new upload so identical audio can reuse HLS renditions."""
+        audio_file = validated_data.get('audio_file')
+        if audio_file:
+            validated_data['audio_sha256'] = MusicService.compute_audio_hash(audio_file)
+
+    @staticmethod
+    def _probe_audio_file(validated_data):
+        """Take duration and stream properties from the upload, not the client."""
+        audio_file = validated_data.get('audio_file')
+        if not audio_file:
+            return
+        probe = MusicService.probe_audio(audio_file)
+        if probe is None:
+            # Keep the client-supplied duration only as a fallback
+            return
+        validated_data.update(
+            duration=probe.duration,
+            bitrate=probe.bitrate,
+            sample_rate=probe.sample_rate,
+            channels=probe.channels,
+        )
  
 
 
@@ -139,13 +192,17 @@ class MusicDataSerializer(serializers.ModelSerializer):
     album_id = serializers.SerializerMethodField()
 
     total_plays = serializers.SerializerMethodField()
+    replay_gain_db = serializers.FloatField(source='get_replay_gain_db', read_only=True)
+    cover_photo_srcset = SrcsetField(source='cover_photo_variants')
 
     class Meta:
         model = Music
         fields = [
-            'id', 'name', 'cover_photo', 'audio_file', 'release_date',
+            'id', 'name', 'cover_photo', 'cover_photo_srcset', 'audio_file', 'release_date',
             'duration', 'artist_email', 'artist_username', 'artist_id', 
-            'album_name', 'album_id', 'total_plays'
+            'album_name', 'album_id', 'total_plays',
+            'loudness_lufs', 'true_peak_dbtp', 'replay_gain_db', 'waveform_url',
+            'preview_url'
         ]
 
     def get_total_plays(self, obj):
@@ -246,4 +303,24 @@ class EqualizerPresetSerializer(serializers.ModelSerializer):
             'band_32', 'band_64', 'band_125', 'band_250', 'band_500',
             'band_1k', 'band_2k', 'band_4k', 'band_8k', 'band_16k'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+
+class TranscodeTierSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TranscodeTier
+        fields = ['quality', 'status', 'progress', 'bytes_written', 'started_at', 'finished_at']
+
+
+class TranscodeJobSerializer(serializers.ModelSerializer):
+    tiers = TranscodeTierSerializer(many=True, read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TranscodeJob
+        fields = ['status', 'progress', 'attempts', 'error', 'started_at', 'finished_at', 'tiers']
+
+    def get_progress(self, obj):
+        """Overall progress as the mean of the tier progress values."""
+        tiers = obj.tiers.all()
+        return sum(t.progress for t in tiers) / len(tiers) if tiers else 0.0
@@ -6,13 +6,24 @@ Centralises business rules that were previously scattered across views.
 
 from __future__ import annotations
 
+import hashlib
 import logging
-from typing import Any
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, BinaryIO
 
+import mutagen
 from django.conf import settings
 from django.db import transaction
 from django.db.models import QuerySet
 
+from common.constants import (
+    TRANSCODE_PRIORITY_ADMIN,
+    TRANSCODE_PRIORITY_DEFAULT,
+    TRANSCODE_PRIORITY_LONG_TRACK,
+    TRANSCODE_PRIORITY_SHORT_TRACK,
+)
+from music import entitlements, hls, manifest
 from music.models import (
     HLSQuality,
     Music,
@@ -25,6 +36,15 @@ from users.models import CustomUser
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class AudioProbe:
+    """Stream properties read from an audio file's headers."""
+    duration: timedelta
+    bitrate: int | None
+    sample_rate: int | None
+    channels: int | None
+
+
 class MusicService:
     """Business logic for track management and querying."""
 
@@ -54,17 +74,94 @@ class MusicService:
             return None
 
     @staticmethod
-    def trigger_hls_conversion(music_id: int) -> None:
+    def compute_audio_hash(fileobj: BinaryIO) -> str:
+        """
+        Return the hex SHA-256 of an audio file, reading it in chunks.
+
+        Accepts Django ``UploadedFile``/``File`` objects (rewound afterwards
+        so they can still be saved) as well as plain binary streams.
+        """
+        hasher = hashlib.sha256()
+        if hasattr(fileobj, "chunks"):
+            for chunk in fileobj.chunks():
+                hasher.update(chunk)
+            fileobj.seek(0)
+        else:
+            for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    @staticmethod
+    def transcode_priority(duration: timedelta | None) -> int:
+        """
+        Broker priority for transcoding a freshly approved track.
+
+        Shorter tracks finish sooner, so they go first and more artists see
+        their upload go live quickly; hour-long mixes wait their turn.
+        """
+        if duration is None:
+            return TRANSCODE_PRIORITY_DEFAULT
+        if duration < timedelta(minutes=5):
+            return TRANSCODE_PRIORITY_SHORT_TRACK
+        if duration >= timedelta(minutes=15):
+            return TRANSCODE_PRIORITY_LONG_TRACK
+        return TRANSCODE_PRIORITY_DEFAULT
+
+    @staticmethod
+    def probe_audio(fileobj: BinaryIO) -> AudioProbe | None:
+        """
+        Read duration and stream properties from an audio file's headers.
+
+        mutagen only parses the container/frame headers (plus the Xing/VBRI
+        frame for VBR MP3), so the upload is never decoded or read in full.
+        The file is rewound afterwards.  Returns ``None`` when the format is
+        not recognised or carries no duration.
+        """
+        try:
+            fileobj.seek(0)
+            audio = mutagen.File(fileobj)
+        except mutagen.MutagenError as exc:
+            logger.warning("Could not probe audio file error=%s", exc)
+            return None
+        finally:
+            fileobj.seek(0)
+
+        info = getattr(audio, "info", None)
+        if not info or not getattr(info, "length", 0):
+            return None
+        return AudioProbe(
+            duration=timedelta(seconds=round(info.length, 3)),
+            bitrate=getattr(info, "bitrate", None) or None,
+            sample_rate=getattr(info, "sample_rate", None) or None,
+            channels=getattr(info, "channels", None) or None,
+        )
+
+    @staticmethod
+    def trigger_hls_conversion(music_id: int, priority: int | None = None) -> None:
         """
         Dispatch HLS conversion task for a specific track.
         
         Centralized here to ensure consistent task configuration (queue, countdown, etc.)
         regardless of whether triggered by a signal, admin action, or API.
+        The task is routed to the transcoding queue by ``CELERY_TASK_ROUTES``.
         """
         from music.tasks import convert_audio_to_hls
-        logger.info("Triggering HLS conversion via MusicService music_id=%s", music_id)
-        # Using delay() or apply_async() without explicit queue to use default worker
-        convert_audio_to_hls.apply_async(args=[music_id], countdown=5)
+        if priority is None:
+            priority = TRANSCODE_PRIORITY_DEFAULT
+        logger.info(
+            "Triggering HLS conversion via MusicService music_id=%s priority=%s",
+            music_id, priority,
+        )
+        convert_audio_to_hls.apply_async(args=[music_id], countdown=5, priority=priority)
+
+    @staticmethod
+    def trigger_hls_regeneration(music_id: int) -> None:
+        """Queue an admin-requested re-transcode ahead of routine conversions."""
+        from music.tasks import regenerate_hls_for_music
+        logger.info("Triggering HLS regeneration music_id=%s", music_id)
+        regenerate_hls_for_music.apply_async(
+            args=[music_id], priority=TRANSCODE_PRIORITY_ADMIN,
+        )
 
     @staticmethod
     def handle_music_save(instance: Music, created: bool) -> None:
@@ -85,7 +182,10 @@ class MusicService:
             should_convert = created or not StreamingFile.objects.filter(music=instance).exists()
 
             if should_convert:
-                MusicService.trigger_hls_conversion(instance.id)
+                MusicService.trigger_hls_conversion(
+                    instance.id,
+                    priority=MusicService.transcode_priority(instance.duration),
+                )
 
         # Ensure task is queued only after the transaction is successfully committed
         transaction.on_commit(_queue_hls_conversion)
@@ -109,17 +209,50 @@ class StreamingService:
 
         Priority:
         1. Explicit ``requested_quality`` parameter
-        2. User's stored preference
+        2. User's stored preference, capped by their subscription
         3. Default to LOW
         """
         if requested_quality and requested_quality in HLSQuality.values:
             return requested_quality
+        return entitlements.get_entitlements(user).quality
 
-        try:
-            pref = UserPreference.objects.get(user=user)
-            return pref.preferred_quality
-        except UserPreference.DoesNotExist:
-            return HLSQuality.LOW
+    @staticmethod
+    def get_renditions(music_id: int) -> dict[str, str]:
+        """Map of quality -> HLS playlist URL for every tier of a track, from the manifest cache."""
+        stream_manifest = manifest.get_manifest(music_id)
+        return stream_manifest.renditions if stream_manifest else {}
+
+    @staticmethod
+    def pick_rendition(renditions: dict[str, str], quality: str) -> tuple[str, str] | None:
+        """
+        Return ``(url, quality_served)`` for the best tier at or below *quality*.
+
+        An unknown *quality* is treated as LOW.  ``None`` when no tier at or
+        below it exists.
+        """
+        cap = quality if quality in HLSQuality.values else HLSQuality.LOW
+        for q in reversed(hls.qualities_up_to(cap)):
+            if q in renditions:
+                return renditions[q], q
+        return None
+
+    @staticmethod
+    def resolve_stream(music_id: int, quality: str) -> tuple[str, str] | None:
+        """
+        Return ``(url, quality_served)`` for a track at the given quality.
+
+        Loads all renditions at once and falls back to the next-lower tier
+        in memory if the requested one doesn't exist.
+        """
+        stream = StreamingService.pick_rendition(
+            StreamingService.get_renditions(music_id), quality,
+        )
+        if stream and stream[1] != quality:
+            logger.info(
+                "Quality fallback: %s → %s for music_id=%s",
+                quality, stream[1], music_id,
+            )
+        return stream
 
     @staticmethod
     def get_streaming_url(music_id: int, quality: str) -> str | None:
@@ -128,44 +261,38 @@ class StreamingService:
 
         Falls back to the next-lower quality if the requested one doesn't exist.
         """
-        fallback_order = [
-            HLSQuality.LOSSLESS,
-            HLSQuality.HIGH,
-            HLSQuality.MEDIUM,
-            HLSQuality.LOW,
-        ]
-
-        # Try exact match first
-        streaming_file = StreamingFile.objects.filter(
-            music_id=music_id, quality=quality
-        ).first()
-        if streaming_file:
-            return streaming_file.hls_playlist
-
-        # Fallback: find the best available quality at or below requested
-        try:
-            requested_idx = fallback_order.index(quality)
-        except ValueError:
-            requested_idx = len(fallback_order) - 1
-
-        for q in fallback_order[requested_idx:]:
-            streaming_file = StreamingFile.objects.filter(
-                music_id=music_id, quality=q
-            ).first()
-            if streaming_file:
-                logger.info(
-                    "Quality fallback: %s → %s for music_id=%s",
-                    quality, q, music_id,
-                )
-                return streaming_file.hls_playlist
+        stream = StreamingService.resolve_stream(music_id, quality)
+        return stream[0] if stream else None
 
+    @staticmethod
+    def get_master_playlist(
+        music: Music | manifest.StreamManifest, max_quality: str,
+    ) -> tuple[str, str] | None:
+        """
+        Return ``(url, cap)`` of the adaptive master playlist for a track.
+
+        Picks the master for *max_quality*, or the highest one below it if
+        that cap was never published.  Returns ``None`` for tracks without
+        master playlists (e.g. transcoded before they were introduced).
+        """
+        masters = music.hls_master_playlists or {}
+        for cap in reversed(hls.qualities_up_to(max_quality)):
+            if masters.get(cap):
+                return masters[cap], cap
         return None
 
     @staticmethod
     def update_user_preference(user: CustomUser, quality: str) -> UserPreference:
-        """Create or update the user's streaming quality preference."""
+        """
+        Create or update the user's streaming quality preference.
+
+        Drops the cached entitlement snapshot on commit, so the next stream
+        start sees the new preference.
+        """
         pref, _ = UserPreference.objects.update_or_create(
             user=user,
             defaults={"preferred_quality": quality},
         )
+        user_id = user.pk
+        transaction.on_commit(lambda: entitlements.invalidate(user_id))
         return pref
@@ -5,7 +5,9 @@ Handles:
 - Auto-unpublish when a track is not approved
 - HLS conversion trigger on new uploads
 - HLS cleanup on deletion
+- Streaming manifest cache invalidation
 - Subscription-based quality enforcement
+- Entitlement snapshot invalidation
 - Default user preferences on user creation
 """
 
@@ -18,6 +20,7 @@ from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 
+from music import entitlements, manifest
 from music.models import HLSQuality, Music, MusicApprovalStatus, StreamingFile, UserPreference
 from music.tasks import cleanup_failed_hls_conversion, convert_audio_to_hls
 from premium.models import SubscriptionStatus, UserSubscription
@@ -78,6 +81,39 @@ def log_streaming_file_deletion(sender, instance, **kwargs):
         pass  # Music may have already been deleted
 
 
+# ---------------------------------------------------------------------------
+# Streaming manifest cache
+# ---------------------------------------------------------------------------
+# Invalidation runs on commit, so a request racing the write cannot cache
+# the pre-commit rows again.  ``QuerySet.update()`` bypasses these
+# receivers; the HLS tasks invalidate explicitly after such writes.
+
+@receiver(post_save, sender=Music)
+@receiver(post_delete, sender=Music)
+def invalidate_manifest_on_music_change(sender, instance, **kwargs):
+    """Drop the cached streaming manifest when a track changes."""
+    music_id = instance.pk  # cleared on the instance once deletion finishes
+    transaction.on_commit(lambda: manifest.invalidate(music_id))
+
+
+@receiver(post_save, sender=StreamingFile)
+@receiver(post_delete, sender=StreamingFile)
+def invalidate_manifest_on_rendition_change(sender, instance, **kwargs):
+    """Drop the cached streaming manifest when a rendition is added, replaced or removed."""
+    music_id = instance.music_id
+    transaction.on_commit(lambda: manifest.invalidate(music_id))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_manifests_on_username_change(sender, instance, created, update_fields=None, **kwargs):
+    """Drop the manifests of an artist's tracks, which embed the username."""
+    if created or (update_fields is not None and "username" not in update_fields):
+        return
+    music_ids = list(Music.objects.filter(artist__user=instance).values_list("id", flat=True))
+    if music_ids:
+        transaction.on_commit(lambda: manifest.invalidate_many(music_ids))
+
+
 # ---------------------------------------------------------------------------
 # Subscription & preference signals
 # ---------------------------------------------------------------------------
@@ -104,6 +140,22 @@ def enforce_quality_on_subscription_change(sender, instance, created, **kwargs):
         UserPreference.objects.create(user=instance.user, preferred_quality=HLSQuality.LOW)
 
 
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+def invalidate_entitlements_on_subscription_change(sender, instance, **kwargs):
+    """Drop the cached entitlement snapshot when a subscription changes."""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: entitlements.invalidate(user_id))
+
+
+@receiver(post_save, sender=UserPreference)
+@receiver(post_delete, sender=UserPreference)
+def invalidate_entitlements_on_preference_change(sender, instance, **kwargs):
+    """Drop the cached entitlement snapshot when the quality preference changes."""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: entitlements.invalidate(user_id))
+
+
 @receiver(pre_save, sender=UserSubscription)
 def auto_expire_subscription(sender, instance, **kwargs):
     """Mark subscriptions as expired if `expires_at` is in the past."""
@@ -0,0 +1,133 @@
+"""
+Offline signing of HLS URLs on the media domain.
+
+Playlist URLs are stored unsigned (``StreamingFile.hls_playlist``,
+``Music.hls_master_playlists``), so without signing anyone holding a URL
+can fetch any tier.  With ``STREAM_URL_SIGNING`` on, the streaming view
+rewrites them into path-token URLs::
+
+    https://cdn/media/hls/42/high/42_high.m3u8
+    https://cdn/media/_t/<expires>/<cap>/<token>/hls/42/high/42_high.m3u8
+
+The token is a truncated HMAC-SHA256 of ``"<expires>:<cap>:hls/<id>/"``
+under ``STREAM_URL_SIGNING_KEY``.  It lives in the path rather than the
+query string because playlists reference segments (and masters their
+variants) by relative URI; the player resolves those against the signed
+prefix, so every segment request carries the token without the stored
+playlists being rewritten.  A token grants one track, up to *cap*: tier
+directories and master playlists above it are refused.
+
+Signing is one HMAC over a few dozen bytes, with no storage or network
+call.  ``expires`` is rounded up to a ``STREAM_URL_TTL_SECONDS`` window
+boundary, so a user gets the same URL for the whole window and it stays
+cacheable by the player and the browser; a URL is valid for between one
+and two windows.
+
+Whatever serves the media domain checks the token with ``verify_path``
+(nginx ``auth_request`` to ``hls_token_auth`` locally) or an equivalent
+edge function holding the same key, and strips the ``_t/...`` prefix
+before reading the object.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import re
+import time
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from music import hls
+from music.models import HLSQuality
+
+TOKEN_SEGMENT = "_t"
+
+# Bytes of the HMAC kept in the URL (128 bits)
+TOKEN_BYTES = 16
+
+_SIGNABLE_URL = re.compile(r"^(?P<base>.*/)(?P<root>hls/\d+/)(?P<rest>[^?#]*)$")
+_SIGNED_PATH = re.compile(
+    rf"/{TOKEN_SEGMENT}/(?P<expires>\d+)/(?P<cap>[a-z]+)/(?P<token>[\w-]+)/"
+    r"(?P<root>hls/(?P<music_id>\d+)/)(?P<rest>[^?#]*)$"
+)
+
+
+def is_enabled() -> bool:
+    return getattr(settings, "STREAM_URL_SIGNING", False)
+
+
+def sign_url(url: str, cap: str, now: float | None = None) -> str:
+    """
+    Return *url* with a path token granting tiers up to *cap*.
+
+    Returns *url* unchanged when signing is off or it is not an HLS URL.
+    """
+    if not is_enabled():
+        return url
+    match = _SIGNABLE_URL.match(url)
+    if match is None:
+        return url
+    expires = expiry(now)
+    token = make_token(expires, cap, match["root"])
+    return (
+        f"{match['base']}{TOKEN_SEGMENT}/{expires}/{cap}/{token}/"
+        f"{match['root']}{match['rest']}"
+    )
+
+
+def expiry(now: float | None = None) -> int:
+    """End of the window after the current one, as a Unix timestamp."""
+    window = max(1, getattr(settings, "STREAM_URL_TTL_SECONDS", 3600))
+    now = time.time() if now is None else now
+    return (int(now) // window + 2) * window
+
+
+def make_token(expires: int, cap: str, root: str) -> str:
+    digest = hmac.new(
+        _signing_key(), f"{expires}:{cap}:{root}".encode(), hashlib.sha256,
+    ).digest()
+    return base64.urlsafe_b64encode(digest[:TOKEN_BYTES]).rstrip(b"=").decode()
+
+
+def verify_path(path: str, now: float | None = None) -> bool:
+    """
+    Whether a signed media *path* may be served.
+
+    Checks the expiry, the token and that the requested file is within
+    the granted cap.  *path* may be percent-encoded (nginx
+    ``$request_uri``); it is decoded before any check.
+    """
+    match = _SIGNED_PATH.search(unquote(path))
+    if match is None or match["cap"] not in HLSQuality.values:
+        return False
+    if int(match["expires"]) <= (time.time() if now is None else now):
+        return False
+    expected = make_token(int(match["expires"]), match["cap"], match["root"])
+    if not hmac.compare_digest(expected, match["token"]):
+        return False
+    return _within_cap(match["rest"], match["music_id"], match["cap"])
+
+
+def _within_cap(rest: str, music_id: str, cap: str) -> bool:
+    """Refuse tier directories and master playlists above *cap*."""
+    if ".." in rest.split("/"):
+        return False
+    allowed = hls.qualities_up_to(cap)
+    head, _, name = rest.partition("/")
+    if name:
+        return head in allowed
+    for quality in HLSQuality.values:
+        if rest == hls.master_playlist_name(int(music_id), quality):
+            return quality in allowed
+    return True
+
+
+def _signing_key() -> bytes:
+    key = getattr(settings, "STREAM_URL_SIGNING_KEY", "")
+    if not key:
+        raise ImproperlyConfigured("STREAM_URL_SIGNING requires STREAM_URL_SIGNING_KEY")
+    return key.encode()
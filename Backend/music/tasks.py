@@ -7,21 +7,62 @@ will overwrite previous HLS files rather than creating duplicates.
 
 from __future__ import annotations
 
+import hashlib
 import logging
 import os
+import shutil
 import subprocess
 import tempfile
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO
 
-import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 from celery import shared_task
 from django.conf import settings
 from django.core.files.storage import default_storage
+from django.db import connection as db_connection
+from django.db.models import Count
+from django.utils import timezone
+from storages.utils import clean_name
 
-from common.constants import HLS_CONTENT_TYPES
-from music.models import HLSQuality, Music, StreamingFile
+from common.constants import (
+    HLS_SOURCE_MODE_DOWNLOAD,
+    HLS_SOURCE_MODE_PIPE,
+    HLS_SOURCE_MODE_PRESIGNED_URL,
+    HLS_TRANSCODE_MODE_SINGLE_PASS,
+    TRANSCODE_PRIORITY_BACKFILL,
+)
+from music import hls, manifest, s3
+from music.ffmpeg import (
+    EBUR128_FILTER,
+    FAILURE_BAD_INPUT,
+    FAILURE_ERROR,
+    FAILURE_MEMORY_LIMIT,
+    FAILURE_OOM,
+    FAILURE_TIMEOUT,
+    PROGRESS_ARGS,
+    ExecutionLimits,
+    FFmpegError,
+    parse_ebur128_summary,
+    run_ffmpeg,
+)
+from music.jobs import TranscodeTracker, settings_fingerprint, source_fingerprint
+from music.models import (
+    HLSQuality,
+    HLSSegmentFormat,
+    Music,
+    StreamingFile,
+    TranscodeStatus,
+)
+from music.services import MusicService
+from music.waveform import WaveformPipe
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +95,30 @@ QUALITY_SETTINGS: dict[str, dict[str, str]] = {
 }
 
 FFMPEG_TIMEOUT_SECONDS = 3600  # 1 hour
+DOWNLOAD_CHUNK_SIZE_BYTES = 8 * 1024 * 1024  # 8 MB
+
+# Per FFmpeg failure kind: (retries allowed, seconds before each retry).
+# The task's own max_retries still caps the total.
+FFMPEG_RETRY_POLICY: dict[str, tuple[int, int]] = {
+    FAILURE_TIMEOUT: (1, 300),
+    FAILURE_OOM: (2, 120),  # External SIGKILL; the host may be quieter later
+    FAILURE_MEMORY_LIMIT: (0, 0),  # Same HLS_FFMPEG_MEMORY_LIMIT_MB, same outcome
+    FAILURE_BAD_INPUT: (0, 0),  # Fails the same way every time
+    FAILURE_ERROR: (3, 60),
+}
+# Failures that would recur for every tier of the same input
+FATAL_FFMPEG_FAILURES: tuple[str, ...] = (FAILURE_TIMEOUT, FAILURE_BAD_INPUT)
+
+PREVIEW_FILENAME = "preview.m4a"
+
+# Bucket prefix under which every track's HLS artefacts live
+HLS_ROOT_PREFIX = "media/hls/"
+PREVIEW_FADE_SECONDS = 1.0
+
+
+def current_settings_fingerprint() -> str:
+    """Fingerprint of everything that changes the encoded renditions."""
+    return settings_fingerprint(QUALITY_SETTINGS, _segment_format())
 
 
 # ---------------------------------------------------------------------------
@@ -61,12 +126,22 @@ FFMPEG_TIMEOUT_SECONDS = 3600  # 1 hour
 # ---------------------------------------------------------------------------
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
-def convert_audio_to_hls(self, music_id: int) -> dict[str, Any]:
+def convert_audio_to_hls(
+    self, music_id: int, reuse_duplicates: bool = True, force: bool = False,
+) -> dict[str, Any]:
     """
     Convert an audio file to HLS format with multiple quality levels.
 
     Idempotent: existing ``StreamingFile`` records for the same
-    music + quality are updated rather than duplicated.
+    music + quality are updated rather than duplicated.  When another
+    track has the same audio content (``audio_sha256``) and is already
+    transcoded, its renditions are copied instead of re-encoding.
+
+    Progress is recorded on the track's ``TranscodeJob``; tiers completed
+    by an earlier attempt with the same encoder settings and the same
+    original audio are skipped.  ``force`` re-encodes every tier (and
+    never reuses a duplicate's renditions); retries of a forced run still
+    skip the tiers that run already finished.
     """
     try:
         music = Music.objects.get(id=music_id)
@@ -84,10 +159,82 @@ def convert_audio_to_hls(self, music_id: int) -> dict[str, Any]:
         logger.error("Audio file missing from storage: %s", music.audio_file.name)
         return {"status": "error", "message": "Audio file not found in storage"}
 
+    if force:
+        reuse_duplicates = False
+        if not self.request.retries:
+            TranscodeTracker.reset(music_id)
+
+    tracker: TranscodeTracker | None = None
     try:
-        created_streams = _transcode_all_qualities(music_id, music)
+        # Tiers are only reused while both the settings and the original match
+        _ensure_audio_hash(music)
+        tracker = TranscodeTracker.start(
+            music, QUALITY_SETTINGS, current_settings_fingerprint(), source_fingerprint(music),
+        )
+
+        if reuse_duplicates:
+            try:
+                reused_streams = _reuse_duplicate_renditions(music)
+            except Exception:
+                logger.exception("Reusing duplicate renditions failed music_id=%s", music_id)
+                reused_streams = []
+            if reused_streams:
+                for stream in reused_streams:
+                    tracker.tier_completed(stream["quality"], 0)
+                tracker.finish(TranscodeStatus.COMPLETED)
+                _publish_master_playlists_safely(music)
+                manifest.invalidate(music_id)
+                return {
+                    "status": "success",
+                    "message": f"Reused {len(reused_streams)} HLS streams from an identical upload",
+                    "streams": reused_streams,
+                }
+
+        completed = tracker.completed_qualities()
+        pending = {q: cfg for q, cfg in QUALITY_SETTINGS.items() if q not in completed}
+        if completed:
+            logger.info("Skipping completed tiers=%s music_id=%s", sorted(completed), music_id)
+
+        created_streams = (
+            _transcode_all_qualities(music_id, music, pending, tracker) if pending else []
+        )
+    except FFmpegError as exc:
+        logger.error(
+            "FFmpeg failed kind=%s music_id=%s stderr=%s",
+            exc.kind, music_id, exc.stderr[-500:],
+        )
+        tracker.finish(TranscodeStatus.FAILED, f"{exc.kind}: {exc.stderr[-1000:]}")
+        allowed, countdown = FFMPEG_RETRY_POLICY.get(exc.kind, (0, 0))
+        if self.request.retries < min(allowed, self.max_retries):
+            logger.info(
+                "Retrying HLS conversion music_id=%s kind=%s attempt=%s",
+                music_id, exc.kind, self.request.retries + 1,
+            )
+            self.retry(countdown=countdown)
+        elif finished := tracker.completed_qualities():
+            # Out of retries, but some tiers are published: keep serving them
+            logger.warning(
+                "Keeping partial HLS output music_id=%s tiers=%s kind=%s",
+                music_id, sorted(finished), exc.kind,
+            )
+            _publish_master_playlists_safely(music)
+            manifest.invalidate(music_id)
+            return {
+                "status": "partial",
+                "message": f"FFmpeg failed ({exc.kind}) for some tiers",
+                "kind": exc.kind,
+                "completed": sorted(finished),
+            }
+        else:
+            cleanup_failed_hls_conversion.delay(music_id)
+        return {"status": "error", "message": f"FFmpeg failed ({exc.kind})", "kind": exc.kind}
     except Exception as exc:
         logger.exception("Unexpected error in HLS conversion music_id=%s", music_id)
+        # Hashing the source or starting the job may be what failed
+        if tracker is None:
+            TranscodeTracker.fail(music_id, str(exc))
+        else:
+            tracker.finish(TranscodeStatus.FAILED, str(exc))
         if self.request.retries < self.max_retries:
             logger.info(
                 "Retrying HLS conversion music_id=%s attempt=%s",
@@ -98,18 +245,24 @@ def convert_audio_to_hls(self, music_id: int) -> dict[str, Any]:
             cleanup_failed_hls_conversion.delay(music_id)
         return {"status": "error", "message": str(exc)}
 
-    if created_streams:
+    if created_streams or completed:
         logger.info(
-            "HLS conversion complete music=%s streams=%s",
-            music.name, len(created_streams),
+            "HLS conversion complete music=%s streams=%s skipped=%s",
+            music.name, len(created_streams), len(completed),
         )
+        tracker.finish(TranscodeStatus.COMPLETED)
+        _publish_master_playlists_safely(music)
+        # Loudness, analysis blobs and masters were written with update()
+        manifest.invalidate(music_id)
         return {
             "status": "success",
             "message": f"Created {len(created_streams)} HLS streams",
             "streams": created_streams,
+            "skipped": sorted(completed),
         }
 
     logger.error("No HLS streams created for music=%s", music.name)
+    tracker.finish(TranscodeStatus.FAILED, "No HLS streams were created")
     cleanup_failed_hls_conversion.delay(music_id)
     return {"status": "error", "message": "No HLS streams were created"}
 
@@ -121,6 +274,11 @@ def cleanup_failed_hls_conversion(self, music_id: int) -> dict[str, str]:
         logger.info("Starting cleanup music_id=%s", music_id)
         deleted = StreamingFile.objects.filter(music_id=music_id).delete()[0]
         logger.info("Deleted %s StreamingFile records music_id=%s", deleted, music_id)
+        Music.objects.filter(id=music_id).update(
+            hls_master_playlists={}, waveform_url="", preview_url="",
+        )
+        manifest.invalidate(music_id)
+        TranscodeTracker.reset(music_id)
         _cleanup_s3_objects(music_id)
         return {"status": "success", "message": "Cleanup completed"}
     except Exception as exc:
@@ -133,7 +291,7 @@ def regenerate_hls_for_music(self, music_id: int) -> dict[str, Any]:
     """Re-generate HLS files (cleanup old, then transcode fresh)."""
     logger.info("Regenerating HLS music_id=%s", music_id)
     cleanup_failed_hls_conversion(music_id)
-    return convert_audio_to_hls(music_id)
+    return convert_audio_to_hls(music_id, reuse_duplicates=False)
 
 
 @shared_task(bind=True)
@@ -145,110 +303,831 @@ def trigger_hls_conversion_for_music(self, music_id: int) -> dict[str, Any]:
     return convert_audio_to_hls(music_id)
 
 
+def queue_backfill_lane(
+    music_ids: list[int], force: bool = False, spacing: float = 0, countdown: float = 0,
+) -> None:
+    """
+    Queue the first track of a backfill lane; the rest follow one by one.
+
+    The next link is attached as both ``link`` and ``link_error``, so a
+    track that fails for good (an unhandled error, ``WorkerLostError`` after
+    an OOM kill) does not drop the remainder of the lane the way a Celery
+    ``chain`` would.  *spacing* is the pause before each following track.
+    """
+    head, *rest = music_ids
+    signature = convert_audio_to_hls.si(head, force=force).set(
+        priority=TRANSCODE_PRIORITY_BACKFILL, countdown=countdown,
+    )
+    if rest:
+        next_link = continue_backfill_lane.si(rest, force=force, spacing=spacing).set(
+            priority=TRANSCODE_PRIORITY_BACKFILL,
+        )
+        signature.link(next_link)
+        signature.link_error(next_link)
+    signature.apply_async()
+
+
+@shared_task
+def continue_backfill_lane(music_ids: list[int], force: bool = False, spacing: float = 0) -> None:
+    """Queue the next track of a backfill lane once the previous one has finished."""
+    queue_backfill_lane(music_ids, force=force, spacing=spacing, countdown=spacing)
+
+
+@shared_task(bind=True)
+def collect_orphaned_hls_objects(self, dry_run: bool = False) -> dict[str, Any]:
+    """
+    Delete HLS objects in the bucket that no database row references.
+
+    Streams the ``media/hls/`` listing page by page, checks it against
+    the database ``HLS_GC_TRACK_BATCH_SIZE`` tracks at a time, and
+    deletes orphans in ``DeleteObjects`` batches with a pause in between.
+    Objects younger than ``HLS_GC_GRACE_HOURS`` are never touched, so
+    uploads of a transcode that has not registered its rows yet survive.
+    At most ``HLS_GC_MAX_DELETES_PER_RUN`` keys go per run; the next run
+    picks up the rest.
+    """
+    if not _should_use_s3() or s3.missing_settings():
+        return {"status": "skipped", "message": "S3 output is not enabled"}
+
+    cutoff = timezone.now() - timedelta(hours=getattr(settings, "HLS_GC_GRACE_HOURS", 24))
+    max_deletes = getattr(settings, "HLS_GC_MAX_DELETES_PER_RUN", 50_000)
+    scanned = 0
+    orphaned: list[str] = []
+
+    def _orphans() -> Iterator[str]:
+        nonlocal scanned
+        groups = _group_objects_by_track(
+            s3.iter_objects(HLS_ROOT_PREFIX),
+            getattr(settings, "HLS_GC_TRACK_BATCH_SIZE", 500),
+        )
+        for group in groups:
+            tracks = _live_tracks(list(group))
+            for music_id, objects in group.items():
+                for obj in objects:
+                    scanned += 1
+                    if obj["LastModified"] < cutoff and _is_orphaned(
+                        obj["Key"], music_id, tracks.get(music_id),
+                    ):
+                        orphaned.append(obj["Key"])
+                        yield obj["Key"]
+                        if len(orphaned) >= max_deletes:
+                            return
+
+    if dry_run:
+        for _ in _orphans():
+            pass
+        deleted = 0
+    else:
+        deleted = s3.delete_keys(
+            _orphans(),
+            batch_size=getattr(settings, "HLS_GC_DELETE_BATCH_SIZE", s3.DELETE_BATCH_SIZE),
+            pause_seconds=getattr(settings, "HLS_GC_DELETE_PAUSE_SECONDS", 1.0),
+        )
+
+    logger.info(
+        "HLS GC scanned=%s orphaned=%s deleted=%s dry_run=%s",
+        scanned, len(orphaned), deleted, dry_run,
+    )
+    return {
+        "status": "success",
+        "scanned": scanned,
+        "orphaned": len(orphaned),
+        "deleted": deleted,
+        "sample": orphaned[:20],
+    }
+
+
 # ---------------------------------------------------------------------------
 # Internal helpers
 # ---------------------------------------------------------------------------
 
 def _transcode_all_qualities(
-    music_id: int, music: Music,
+    music_id: int,
+    music: Music,
+    qualities: dict[str, dict[str, str]],
+    tracker: TranscodeTracker,
 ) -> list[dict[str, Any]]:
-    """Download the original file and transcode to every quality tier."""
-    created_streams: list[dict[str, Any]] = []
-
+    """Resolve the original file and transcode to the given quality tiers."""
     with tempfile.TemporaryDirectory() as temp_dir:
-        original_path = _download_original(music, music_id, temp_dir)
+        source = _resolve_source(music, music_id, temp_dir)
 
-        for quality, cfg in QUALITY_SETTINGS.items():
+        mode = getattr(settings, "HLS_TRANSCODE_MODE", HLS_TRANSCODE_MODE_SINGLE_PASS)
+        if mode == HLS_TRANSCODE_MODE_SINGLE_PASS:
             try:
-                result = _transcode_single_quality(
-                    music_id, music, original_path, quality, cfg, temp_dir,
+                return _transcode_single_pass(
+                    music_id, music, source, qualities, temp_dir, tracker,
                 )
-                if result:
-                    created_streams.append(result)
-            except subprocess.TimeoutExpired:
-                logger.error("FFmpeg timeout quality=%s music_id=%s", quality, music_id)
-            except Exception:
-                logger.exception("Error processing quality=%s music_id=%s", quality, music_id)
+            except FFmpegError as exc:
+                if exc.kind in FATAL_FFMPEG_FAILURES:
+                    # Per-quality runs would decode the same input and fail too
+                    for quality in qualities:
+                        tracker.tier_failed(quality)
+                    raise
+                # Separate, smaller processes may well fit where one did not
+                logger.warning(
+                    "Single-pass transcode failed kind=%s, falling back to per-quality music_id=%s",
+                    exc.kind, music_id,
+                )
+
+        return _transcode_per_quality(music_id, music, source, qualities, temp_dir, tracker)
+
+
+def _transcode_per_quality(
+    music_id: int,
+    music: Music,
+    source: TranscodeSource,
+    qualities: dict[str, dict[str, str]],
+    temp_dir: str,
+    tracker: TranscodeTracker,
+) -> list[dict[str, Any]]:
+    """
+    Run one FFmpeg process per quality tier.
+
+    Tiers run sequentially unless ``HLS_TRANSCODE_PARALLELISM`` allows
+    more than one worker, in which case they are spread over a bounded
+    thread pool (the heavy lifting happens in the FFmpeg child processes,
+    so threads are enough to keep several cores busy).
+    """
+    created_streams: list[dict[str, Any]] = []
+    failures: list[FFmpegError] = []
+    workers = _transcode_worker_count(len(qualities))
+    # Loudness and waveform are taken from the first tier's decode only
+    analyse_quality = next(iter(qualities))
+
+    def _collect(run: Callable[[], dict[str, Any] | None]) -> None:
+        try:
+            result = run()
+        except FFmpegError as exc:
+            if exc.kind in FATAL_FFMPEG_FAILURES:
+                raise
+            failures.append(exc)
+            return
+        if result:
+            created_streams.append(result)
 
+    if workers <= 1:
+        for quality, cfg in qualities.items():
+            _collect(lambda quality=quality, cfg=cfg: _transcode_tier_safely(
+                music_id, music, source, quality, cfg, temp_dir, tracker,
+                quality == analyse_quality,
+            ))
+    else:
+        logger.info("Transcoding with %s parallel workers music_id=%s", workers, music_id)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"hls-{music_id}") as pool:
+            futures = [
+                pool.submit(
+                    _transcode_tier_in_thread,
+                    music_id, music, source, quality, cfg, temp_dir, tracker,
+                    quality == analyse_quality,
+                )
+                for quality, cfg in qualities.items()
+            ]
+            for future in as_completed(futures):
+                _collect(future.result)
+
+    if failures:
+        # The other tiers are finished and will be skipped on retry; raise
+        # the failure with the longest back-off so the task's policy applies
+        raise max(failures, key=lambda exc: FFMPEG_RETRY_POLICY.get(exc.kind, (0, 0))[1])
     return created_streams
 
 
+def _transcode_tier_safely(
+    music_id: int,
+    music: Music,
+    source: TranscodeSource,
+    quality: str,
+    cfg: dict[str, str],
+    temp_dir: str,
+    tracker: TranscodeTracker,
+    analyse: bool = False,
+) -> dict[str, Any] | None:
+    """
+    Run a single tier and record its outcome on the tracker.
+
+    ``FFmpegError`` is re-raised (after marking the tier failed) so its
+    failure kind reaches the task's retry policy; any other error is
+    logged and the tier counts as failed.
+    """
+    try:
+        result = _transcode_single_quality(
+            music_id, music, source, quality, cfg, temp_dir, tracker, analyse,
+        )
+    except FFmpegError as exc:
+        logger.error(
+            "FFmpeg failed kind=%s quality=%s music_id=%s stderr=%s",
+            exc.kind, quality, music_id, exc.stderr[-500:],
+        )
+        tracker.tier_failed(quality)
+        raise
+    except Exception:
+        logger.exception("Error processing quality=%s music_id=%s", quality, music_id)
+        result = None
+
+    if result:
+        tracker.tier_completed(quality, result["bytes"])
+    else:
+        tracker.tier_failed(quality)
+    return result
+
+
+def _transcode_tier_in_thread(*args: Any) -> dict[str, Any] | None:
+    """Pool entry-point: run one tier and release this thread's DB connection."""
+    try:
+        return _transcode_tier_safely(*args)
+    finally:
+        db_connection.close()
+
+
+def _transcode_worker_count(tier_count: int) -> int:
+    """
+    Number of tiers that may be transcoded at once.
+
+    Bounded by ``HLS_TRANSCODE_PARALLELISM``, the tier count, the CPU count
+    and by how many FFmpeg processes fit into the memory still available
+    to this container (``HLS_TRANSCODE_WORKER_MEMORY_MB`` each).
+    """
+    requested = int(getattr(settings, "HLS_TRANSCODE_PARALLELISM", 1) or 1)
+    workers = min(requested, tier_count, os.cpu_count() or 1)
+    if workers <= 1:
+        return 1
+
+    per_worker = int(getattr(settings, "HLS_TRANSCODE_WORKER_MEMORY_MB", 64)) * 1024 * 1024
+    available = _available_memory_bytes()
+    if available is not None and per_worker > 0:
+        memory_cap = max(1, available // per_worker)
+        if memory_cap < workers:
+            logger.info(
+                "Capping transcode workers %s -> %s (available_memory=%s)",
+                workers, memory_cap, available,
+            )
+            workers = memory_cap
+    return workers
+
+
+def _available_memory_bytes() -> int | None:
+    """Memory left under the cgroup limit, or host-available memory as fallback."""
+    cgroup_files = (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    )
+    for limit_path, usage_path in cgroup_files:
+        try:
+            limit = Path(limit_path).read_text().strip()
+            usage = Path(usage_path).read_text().strip()
+        except OSError:
+            continue
+        # "max" (v2) or a huge sentinel (v1) means the cgroup is unlimited
+        if limit.isdigit() and usage.isdigit() and int(limit) < 1 << 60:
+            return max(0, int(limit) - int(usage))
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+@dataclass(frozen=True)
+class TranscodeSource:
+    """Where FFmpeg reads the original audio from."""
+    input_args: tuple[str, ...]
+    # Set when the original is streamed into FFmpeg's stdin from storage
+    storage_name: str | None = None
+
+
+def _resolve_source(music: Music, music_id: int, temp_dir: str) -> TranscodeSource:
+    """
+    Pick the FFmpeg input for the original according to ``HLS_SOURCE_MODE``.
+
+    * ``download`` — stream a full copy into *temp_dir* first (default).
+    * ``presigned_url`` — let FFmpeg read a locally-signed S3 GET URL.
+    * ``pipe`` — feed FFmpeg's stdin straight from storage.
+
+    The last two overlap decoding with the transfer and write no temp
+    copy.  Storages that live on the local filesystem are read in place
+    in either streaming mode.
+    """
+    name = music.audio_file.name
+    mode = getattr(settings, "HLS_SOURCE_MODE", HLS_SOURCE_MODE_DOWNLOAD)
+
+    if mode != HLS_SOURCE_MODE_DOWNLOAD:
+        try:
+            local_path = default_storage.path(name)
+        except NotImplementedError:
+            local_path = None
+        if local_path:
+            logger.info("Reading original in place path=%s", local_path)
+            return TranscodeSource(input_args=("-i", local_path))
+
+    if mode == HLS_SOURCE_MODE_PRESIGNED_URL and getattr(default_storage, "bucket", None) is not None:
+        url = default_storage.bucket.meta.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": default_storage.bucket.name,
+                "Key": default_storage._normalize_name(clean_name(name)),
+            },
+            ExpiresIn=FFMPEG_TIMEOUT_SECONDS * 2,
+        )
+        logger.info("Streaming original from presigned URL music_id=%s", music_id)
+        return TranscodeSource(input_args=(
+            "-reconnect", "1",
+            "-reconnect_streamed", "1",
+            "-reconnect_delay_max", "5",
+            "-i", url,
+        ))
+
+    if mode == HLS_SOURCE_MODE_PIPE:
+        logger.info("Piping original from storage music_id=%s", music_id)
+        return TranscodeSource(input_args=("-i", "pipe:0"), storage_name=name)
+
+    return TranscodeSource(input_args=("-i", _download_original(music, music_id, temp_dir)))
+
+
+@contextmanager
+def _open_source_stream(source: TranscodeSource) -> Iterator[BinaryIO | None]:
+    """Open a fresh read stream for piped sources (``None`` otherwise)."""
+    if source.storage_name is None:
+        yield None
+        return
+    with _open_storage_stream(source.storage_name) as fh:
+        yield fh
+
+
+@contextmanager
+def _open_storage_stream(name: str) -> Iterator[BinaryIO]:
+    """Open a forward-only read stream for a file in ``default_storage``."""
+    if getattr(default_storage, "bucket", None) is not None:
+        # Read the S3 body directly — storage.open() would spool a full copy
+        key = default_storage._normalize_name(clean_name(name))
+        body = default_storage.bucket.Object(key).get()["Body"]
+        try:
+            yield body
+        finally:
+            body.close()
+    else:
+        with default_storage.open(name, "rb") as fh:
+            yield fh
+
+
+def _run_ffmpeg(
+    cmd: list[str],
+    timeout: float,
+    source: TranscodeSource,
+    uploader: s3.IncrementalUploader | None = None,
+    on_progress: Callable[[dict[str, str]], None] | None = None,
+    pass_fds: tuple[int, ...] = (),
+) -> subprocess.CompletedProcess[str]:
+    """
+    Run FFmpeg under the configured limits, streaming the original into
+    stdin for piped sources.
+
+    With an *uploader*, finished segments are uploaded while FFmpeg runs;
+    the uploader is aborted if FFmpeg fails or times out (``FFmpegError``).
+    """
+    try:
+        with _open_source_stream(source) as stdin:
+            return run_ffmpeg(
+                cmd,
+                timeout=timeout,
+                stdin=stdin,
+                on_poll=uploader.scan if uploader else None,
+                on_progress=on_progress,
+                pass_fds=pass_fds,
+                limits=ffmpeg_limits(),
+            )
+    except BaseException:
+        if uploader:
+            uploader.abort()
+        raise
+
+
+def ffmpeg_limits() -> ExecutionLimits:
+    """``ExecutionLimits`` from the ``HLS_FFMPEG_*`` settings."""
+    return ExecutionLimits(
+        threads=getattr(settings, "HLS_FFMPEG_THREADS", 0),
+        nice=getattr(settings, "HLS_FFMPEG_NICE", 0),
+        idle_io=getattr(settings, "HLS_FFMPEG_IDLE_IO", False),
+        memory_limit_mb=getattr(settings, "HLS_FFMPEG_MEMORY_LIMIT_MB", 0),
+    )
+
+
 def _download_original(music: Music, music_id: int, temp_dir: str) -> str:
-    """Download the original audio file from storage to a temp directory."""
+    """
+    Stream the original audio file from storage into a temp directory.
+
+    Memory stays bounded by the chunk size: S3-backed storage uses a ranged
+    multipart ``download_fileobj``, anything else a chunked copy.
+    """
     ext = music.audio_file.name.rsplit(".", 1)[-1]
     dest = os.path.join(temp_dir, f"original_{music_id}.{ext}")
+    chunk_size = getattr(settings, "HLS_DOWNLOAD_CHUNK_SIZE_BYTES", DOWNLOAD_CHUNK_SIZE_BYTES)
 
-    with default_storage.open(music.audio_file.name, "rb") as src:
-        with open(dest, "wb") as dst:
-            dst.write(src.read())
+    started = time.monotonic()
+    with open(dest, "wb") as dst:
+        if getattr(default_storage, "bucket", None) is not None:
+            _download_from_s3(music.audio_file.name, dst, chunk_size)
+        else:
+            with default_storage.open(music.audio_file.name, "rb") as src:
+                shutil.copyfileobj(src, dst, chunk_size)
+    elapsed = max(time.monotonic() - started, 1e-6)
 
     size = os.path.getsize(dest)
     if size == 0:
         raise RuntimeError("Downloaded file is empty")
-    logger.info("Downloaded original file=%s bytes=%s", dest, size)
+    logger.info(
+        "Downloaded original file=%s bytes=%s seconds=%.2f bytes_per_sec=%d",
+        dest, size, elapsed, size / elapsed,
+    )
     return dest
 
 
+def _download_from_s3(name: str, fileobj: BinaryIO, chunk_size: int) -> None:
+    """Ranged multipart download of a storage object straight into *fileobj*."""
+    key = default_storage._normalize_name(clean_name(name))
+    transfer_config = TransferConfig(
+        multipart_threshold=chunk_size,
+        multipart_chunksize=chunk_size,
+        max_concurrency=getattr(settings, "HLS_DOWNLOAD_MAX_CONCURRENCY", 2),
+        io_chunksize=min(chunk_size, 256 * 1024),
+    )
+    default_storage.bucket.download_fileobj(key, fileobj, Config=transfer_config)
+
+
+def _hls_output_args(
+    music_id: int,
+    quality: str,
+    cfg: dict[str, str],
+    quality_dir: str,
+) -> list[str]:
+    """
+    Return the FFmpeg encoder + HLS muxer arguments for one quality tier.
+
+    With ``HLS_SEGMENT_FORMAT = "fmp4"`` the tier is muxed as CMAF into a
+    single ``.mp4`` per rendition, addressed by ``EXT-X-BYTERANGE``, instead
+    of one ``.ts`` object per segment.
+    """
+    playlist_name = f"{music_id}_{quality}.m3u8"
+    if _segment_format() == HLSSegmentFormat.FMP4:
+        segment_args = [
+            "-hls_segment_type", "fmp4",
+            "-hls_flags", "single_file",
+            "-hls_segment_filename", os.path.join(quality_dir, f"{music_id}_{quality}.mp4"),
+        ]
+    else:
+        segment_args = [
+            # Segments are written as .tmp and renamed once complete
+            "-hls_flags", "temp_file",
+            "-hls_segment_filename", os.path.join(quality_dir, f"{music_id}_{quality}_%03d.ts"),
+        ]
+    return [
+        "-c:a", "aac",
+        "-b:a", cfg["bitrate"],
+        "-ar", cfg["sample_rate"],
+        "-f", "hls",
+        "-hls_time", cfg["segment_time"],
+        "-hls_list_size", "0",
+        *segment_args,
+        os.path.join(quality_dir, playlist_name),
+    ]
+
+
+class _AnalysisBranches:
+    """
+    Side branches hung off a transcode's decode instead of separate passes.
+
+    * loudness — ``ebur128`` meter whose summary is parsed from stderr
+    * waveform — mono PCM written to a pipe and reduced to peaks
+    * preview — short low-bitrate AAC clip for hover-to-preview
+
+    Use as a context manager around the FFmpeg run so the waveform pipe
+    is always closed.
+    """
+
+    def __init__(self, enabled: bool, music: Music, temp_dir: str) -> None:
+        self.loudness = enabled and getattr(settings, "HLS_MEASURE_LOUDNESS", True)
+        generate_waveform = enabled and getattr(settings, "HLS_GENERATE_WAVEFORM", True)
+        self.waveform = WaveformPipe() if generate_waveform else None
+        generate_preview = enabled and getattr(settings, "HLS_GENERATE_PREVIEW", True)
+        self.preview_path = os.path.join(temp_dir, PREVIEW_FILENAME) if generate_preview else None
+        self._preview_window = _preview_window(music) if generate_preview else (0.0, 0.0)
+
+    def __enter__(self) -> _AnalysisBranches:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        if self.waveform:
+            self.waveform.close()
+
+    @property
+    def labels(self) -> list[str]:
+        return (
+            (["[loud]"] if self.loudness else [])
+            + (["[wave]"] if self.waveform else [])
+            + (["[prev]"] if self.preview_path else [])
+        )
+
+    @property
+    def filters(self) -> list[str]:
+        filters = [f"[loud]{EBUR128_FILTER}"] if self.loudness else []
+        if self.preview_path:
+            start, length = self._preview_window
+            fade = min(PREVIEW_FADE_SECONDS, length / 4)
+            filters.append(
+                f"[prev]atrim=start={start:.3f}:duration={length:.3f},"
+                "asetpts=PTS-STARTPTS,"
+                f"afade=t=in:d={fade:.3f},afade=t=out:st={length - fade:.3f}:d={fade:.3f}[prevout]"
+            )
+        return filters
+
+    @property
+    def output_args(self) -> list[str]:
+        args = self.waveform.output_args("[wave]") if self.waveform else []
+        if self.preview_path:
+            args += [
+                "-map", "[prevout]",
+                "-c:a", "aac",
+                "-b:a", getattr(settings, "PREVIEW_BITRATE", "48k"),
+                "-ar", "22050",
+                # moov atom up front so the clip starts playing immediately
+                "-movflags", "+faststart",
+                self.preview_path,
+            ]
+        return args
+
+    @property
+    def pass_fds(self) -> tuple[int, ...]:
+        return (self.waveform.write_fd,) if self.waveform else ()
+
+    def store(self, music: Music, stderr: str) -> None:
+        """Persist the results after a successful FFmpeg run."""
+        if self.loudness:
+            _store_loudness(music, stderr)
+        if self.waveform:
+            try:
+                _store_waveform(music, self.waveform.buckets())
+            except Exception:
+                logger.exception("Storing waveform failed music_id=%s", music.pk)
+        if self.preview_path:
+            try:
+                _store_preview(music, self.preview_path)
+            except Exception:
+                logger.exception("Storing preview failed music_id=%s", music.pk)
+
+
+def _split_filter_graph(labels: list[str], analysis: _AnalysisBranches) -> str:
+    """
+    ``asplit`` graph fanning the decoded input out to *labels*.
+
+    Analysis branches are appended to the same split, so measurements
+    reuse the decode the encoders already pay for.
+    """
+    outputs = [*labels, *analysis.labels]
+    return ";".join([
+        f"[0:a]asplit={len(outputs)}{''.join(outputs)}",
+        *analysis.filters,
+    ])
+
+
+def _store_loudness(music: Music, stderr: str) -> None:
+    """Persist the ``ebur128`` summary found in an FFmpeg run's stderr."""
+    lufs, true_peak = parse_ebur128_summary(stderr)
+    if lufs is None and true_peak is None:
+        logger.warning("No loudness summary in FFmpeg output music_id=%s", music.pk)
+        return
+    Music.objects.filter(pk=music.pk).update(loudness_lufs=lufs, true_peak_dbtp=true_peak)
+    music.loudness_lufs, music.true_peak_dbtp = lufs, true_peak
+    logger.info(
+        "Measured loudness music_id=%s lufs=%s true_peak=%s",
+        music.pk, lufs, true_peak,
+    )
+
+
+def _store_waveform(music: Music, peaks: bytes) -> None:
+    """Publish waveform peaks and point ``Music.waveform_url`` at them."""
+    if not peaks:
+        logger.warning("No waveform data music_id=%s", music.pk)
+        return
+    url = _publish_blob(music.pk, "waveform", "bin", peaks)
+    if url:
+        Music.objects.filter(pk=music.pk).update(waveform_url=url)
+        music.waveform_url = url
+        logger.info("Stored waveform music_id=%s buckets=%s", music.pk, len(peaks))
+
+
+def _store_preview(music: Music, path: str) -> None:
+    """Publish the encoded preview clip and point ``Music.preview_url`` at it."""
+    clip = Path(path).read_bytes() if os.path.exists(path) else b""
+    if not clip:
+        logger.warning("No preview clip produced music_id=%s", music.pk)
+        return
+    url = _publish_blob(music.pk, "preview", "m4a", clip)
+    if url:
+        Music.objects.filter(pk=music.pk).update(preview_url=url)
+        music.preview_url = url
+        logger.info("Stored preview music_id=%s bytes=%s", music.pk, len(clip))
+
+
+def _publish_blob(music_id: int, stem: str, ext: str, body: bytes) -> str | None:
+    """
+    Publish a small derived asset as an immutable, content-hashed object.
+
+    The object sits next to the HLS renditions; a new encode with different
+    audio gets a new name, so the asset can be cached forever.
+    """
+    name = f"{stem}.{hashlib.sha256(body).hexdigest()[:16]}.{ext}"
+    if _should_use_s3():
+        if s3.missing_settings():
+            return None
+        key = _s3_hls_root(music_id) + name
+        s3.put_object(key, body, cache_control=s3.IMMUTABLE_CACHE_CONTROL)
+        return _s3_media_url(key)
+    root = _local_hls_dir(music_id)
+    os.makedirs(root, exist_ok=True)
+    Path(root, name).write_bytes(body)
+    return _local_hls_url(music_id, None, name)
+
+
+def _preview_window(music: Music) -> tuple[float, float]:
+    """
+    ``(start, length)`` of the preview clip in seconds.
+
+    The configured offset is pulled back so the clip fits in the track, and
+    a track shorter than the clip is previewed whole.  Without a known
+    duration the settings are used as-is; a track shorter than the offset
+    then yields an empty clip, which is simply not stored.
+    """
+    offset = float(getattr(settings, "PREVIEW_OFFSET_SECONDS", 30))
+    length = float(getattr(settings, "PREVIEW_DURATION_SECONDS", 30))
+    if not music.duration:
+        return offset, length
+    total = music.duration.total_seconds()
+    length = min(length, total)
+    return max(0.0, min(offset, total - length)), length
+
+
+def _segment_format() -> str:
+    """Configured HLS segment container (``HLSSegmentFormat`` value)."""
+    return getattr(settings, "HLS_SEGMENT_FORMAT", HLSSegmentFormat.MPEGTS)
+
+
+def _transcode_single_pass(
+    music_id: int,
+    music: Music,
+    source: TranscodeSource,
+    qualities: dict[str, dict[str, str]],
+    temp_dir: str,
+    tracker: TranscodeTracker,
+) -> list[dict[str, Any]]:
+    """
+    Decode the original once and encode every quality tier from one filter graph.
+
+    The decoded stream is fanned out with ``asplit`` and each branch is
+    mapped to its own AAC encoder + HLS muxer; extra branches feed the
+    loudness meter, the waveform pipe and the preview clip encoder.
+    Raises ``FFmpegError`` when FFmpeg itself fails so the caller can
+    decide whether per-quality runs are worth trying.
+    """
+    labels = [f"[a{i}]" for i in range(len(qualities))]
+    logger.info(
+        "Processing %s qualities in a single pass music_id=%s",
+        len(qualities), music_id,
+    )
+
+    with _AnalysisBranches(enabled=True, music=music, temp_dir=temp_dir) as analysis:
+        cmd = [
+            "ffmpeg", "-y",
+            *PROGRESS_ARGS,
+            *source.input_args,
+            "-filter_complex", _split_filter_graph(labels, analysis),
+        ]
+        quality_dirs: dict[str, str] = {}
+        for label, (quality, cfg) in zip(labels, qualities.items()):
+            quality_dir = os.path.join(temp_dir, quality)
+            os.makedirs(quality_dir, exist_ok=True)
+            quality_dirs[quality] = quality_dir
+            cmd += ["-map", label, *_hls_output_args(music_id, quality, cfg, quality_dir)]
+        cmd += analysis.output_args
+
+        uploader = _incremental_uploader(music_id, quality_dirs)
+        tracker.tiers_started(qualities)
+        result = _run_ffmpeg(
+            cmd, FFMPEG_TIMEOUT_SECONDS, source, uploader,
+            on_progress=tracker.progress_callback(qualities),
+            pass_fds=analysis.pass_fds,
+        )
+        analysis.store(music, result.stderr)
+
+    if uploader and not _finish_incremental_upload(uploader, music_id):
+        for quality in qualities:
+            tracker.tier_failed(quality)
+        return []
+
+    created_streams: list[dict[str, Any]] = []
+    for quality, quality_dir in quality_dirs.items():
+        try:
+            stream = _publish_quality(
+                music_id, music, quality, quality_dir, uploaded=uploader is not None,
+            )
+        except Exception:
+            logger.exception("Error publishing quality=%s music_id=%s", quality, music_id)
+            stream = None
+        if stream:
+            tracker.tier_completed(quality, stream["bytes"])
+            created_streams.append(stream)
+        else:
+            tracker.tier_failed(quality)
+    return created_streams
+
+
 def _transcode_single_quality(
     music_id: int,
     music: Music,
-    original_path: str,
+    source: TranscodeSource,
     quality: str,
     cfg: dict[str, str],
     temp_dir: str,
+    tracker: TranscodeTracker,
+    analyse: bool = False,
 ) -> dict[str, Any] | None:
-    """Transcode, upload, and register a single quality tier."""
+    """
+    Transcode, upload, and register a single quality tier.
+
+    With *analyse*, the loudness/waveform/preview branches ride on this
+    tier's decode.
+    """
     logger.info("Processing quality=%s music_id=%s", quality, music_id)
 
     quality_dir = os.path.join(temp_dir, quality)
     os.makedirs(quality_dir, exist_ok=True)
 
-    playlist_name = f"{music_id}_{quality}.m3u8"
-    segment_pattern = f"{music_id}_{quality}_%03d.ts"
-    playlist_path = os.path.join(quality_dir, playlist_name)
+    with _AnalysisBranches(enabled=analyse, music=music, temp_dir=temp_dir) as analysis:
+        cmd = ["ffmpeg", "-y", *PROGRESS_ARGS, *source.input_args]
+        if analysis.labels:
+            cmd += ["-filter_complex", _split_filter_graph(["[enc]"], analysis), "-map", "[enc]"]
+        cmd += [*_hls_output_args(music_id, quality, cfg, quality_dir), *analysis.output_args]
 
-    cmd = [
-        "ffmpeg",
-        "-i", original_path,
-        "-c:a", "aac",
-        "-b:a", cfg["bitrate"],
-        "-ar", cfg["sample_rate"],
-        "-f", "hls",
-        "-hls_time", cfg["segment_time"],
-        "-hls_list_size", "0",
-        "-hls_segment_filename", os.path.join(quality_dir, segment_pattern),
-        playlist_path,
-        "-y",
-    ]
+        timeout = getattr(settings, "HLS_TRANSCODE_TIER_TIMEOUT_SECONDS", FFMPEG_TIMEOUT_SECONDS)
+        uploader = _incremental_uploader(music_id, {quality: quality_dir})
+        tracker.tiers_started([quality])
+        result = _run_ffmpeg(
+            cmd, timeout, source, uploader,
+            on_progress=tracker.progress_callback([quality]),
+            pass_fds=analysis.pass_fds,
+        )
+        analysis.store(music, result.stderr)
 
-    result = subprocess.run(cmd, capture_output=True, text=True, timeout=FFMPEG_TIMEOUT_SECONDS)
-    if result.returncode != 0:
-        logger.error("FFmpeg failed quality=%s stderr=%s", quality, result.stderr[:500])
+    if uploader and not _finish_incremental_upload(uploader, music_id):
         return None
 
-    ts_files = list(Path(quality_dir).glob("*.ts"))
-    if not ts_files or not os.path.exists(playlist_path):
+    return _publish_quality(
+        music_id, music, quality, quality_dir, uploaded=uploader is not None,
+    )
+
+
+def _publish_quality(
+    music_id: int,
+    music: Music,
+    quality: str,
+    quality_dir: str,
+    uploaded: bool = False,
+) -> dict[str, Any] | None:
+    """
+    Upload (or copy locally) one encoded tier and upsert its ``StreamingFile``.
+
+    ``uploaded=True`` means the files already reached S3 incrementally
+    while FFmpeg was encoding, so only the playlist URL is resolved.
+    """
+    playlist_name = f"{music_id}_{quality}.m3u8"
+    playlist_path = os.path.join(quality_dir, playlist_name)
+
+    media_files = [
+        fp for fp in Path(quality_dir).iterdir()
+        if fp.is_file() and fp.suffix != ".m3u8"
+    ]
+    if not media_files or not os.path.exists(playlist_path):
         logger.error("No output files quality=%s", quality)
         return None
 
-    logger.info("Generated %s segments quality=%s", len(ts_files), quality)
+    segment_count = Path(playlist_path).read_text().count("#EXTINF")
+    output_bytes = sum(
+        fp.stat().st_size for fp in Path(quality_dir).iterdir() if fp.is_file()
+    )
+    logger.info(
+        "Generated %s segments in %s files quality=%s",
+        segment_count, len(media_files), quality,
+    )
 
-    # Handle S3 upload if enabled AND not in DEBUG mode (unless explicitly forced)
-    # We prioritize local storage in DEBUG mode to simplify development.
-    should_use_s3 = getattr(settings, 'USE_S3_MEDIA_STORAGE', False) and not settings.DEBUG
-    
-    if should_use_s3:
+    if uploaded:
+        hls_url = _s3_media_url(_s3_hls_prefix(music_id, quality) + playlist_name)
+    elif _should_use_s3():
         hls_url = _upload_hls_to_s3(music_id, quality, quality_dir, playlist_name)
     else:
         # For local storage, we'll store the relative path in the media directory
-        relative_path = os.path.join("hls", str(music_id), quality, playlist_name)
-        hls_url = os.path.join(settings.MEDIA_URL, relative_path)
+        hls_url = _local_hls_url(music_id, quality, playlist_name)
         
         # Ensure local media directory exists and move files there
-        local_hls_dir = os.path.join(settings.MEDIA_ROOT, "hls", str(music_id), quality)
+        local_hls_dir = _local_hls_dir(music_id, quality)
         os.makedirs(local_hls_dir, exist_ok=True)
         
-        import shutil
         for fp in Path(quality_dir).iterdir():
             if fp.is_file():
                 shutil.copy2(fp, os.path.join(local_hls_dir, fp.name))
@@ -262,7 +1141,7 @@ def _transcode_single_quality(
     streaming_file, created = StreamingFile.objects.update_or_create(
         music=music,
         quality=quality,
-        defaults={"hls_playlist": hls_url},
+        defaults={"hls_playlist": hls_url, "segment_format": _segment_format()},
     )
 
     logger.info(
@@ -273,10 +1152,208 @@ def _transcode_single_quality(
         "quality": quality,
         "url": hls_url,
         "created": created,
-        "segments": len(ts_files),
+        "segments": segment_count,
+        "bytes": output_bytes,
     }
 
 
+def _reuse_duplicate_renditions(music: Music) -> list[dict[str, Any]]:
+    """
+    Copy the HLS renditions of an already-transcoded identical upload.
+
+    Only donors encoded with the current settings qualify, so a catalogue
+    re-encode never copies stale renditions.  Returns the created streams,
+    or an empty list when there is no fully transcoded duplicate (or
+    copying failed) and a real transcode is needed.
+    """
+    digest = _ensure_audio_hash(music)
+    donor = (
+        Music.objects.filter(
+            audio_sha256=digest,
+            transcode_job__settings_fingerprint=current_settings_fingerprint(),
+        )
+        .exclude(pk=music.pk)
+        .annotate(rendition_count=Count("streaming_files"))
+        .filter(rendition_count__gte=len(QUALITY_SETTINGS))
+        .order_by("id")
+        .first()
+    )
+    if donor is None:
+        return []
+
+    logger.info("Reusing HLS renditions music_id=%s donor_id=%s", music.id, donor.id)
+    _copy_analysis(donor, music)
+    streams: list[dict[str, Any]] = []
+    for donor_file in donor.streaming_files.all():
+        hls_url = _clone_rendition(donor.id, music.id, donor_file.quality)
+        if not hls_url:
+            logger.warning(
+                "Could not copy quality=%s from donor_id=%s, transcoding instead",
+                donor_file.quality, donor.id,
+            )
+            return []
+        _, created = StreamingFile.objects.update_or_create(
+            music=music,
+            quality=donor_file.quality,
+            defaults={"hls_playlist": hls_url, "segment_format": donor_file.segment_format},
+        )
+        streams.append({
+            "quality": donor_file.quality,
+            "url": hls_url,
+            "created": created,
+            "reused_from": donor.id,
+        })
+    return streams
+
+
+def _copy_analysis(donor: Music, music: Music) -> None:
+    """Copy loudness values and the waveform/preview blobs of an identical upload."""
+    fields: dict[str, Any] = {
+        "loudness_lufs": donor.loudness_lufs,
+        "true_peak_dbtp": donor.true_peak_dbtp,
+    }
+    for url_field in ("waveform_url", "preview_url"):
+        donor_url = getattr(donor, url_field)
+        if not donor_url:
+            continue
+        name = donor_url.rsplit("/", 1)[-1]
+        try:
+            if _should_use_s3():
+                dst_key = _s3_hls_root(music.id) + name
+                s3.copy_objects([(_s3_hls_root(donor.id) + name, dst_key)])
+                fields[url_field] = _s3_media_url(dst_key)
+            else:
+                os.makedirs(_local_hls_dir(music.id), exist_ok=True)
+                shutil.copy2(
+                    os.path.join(_local_hls_dir(donor.id), name),
+                    os.path.join(_local_hls_dir(music.id), name),
+                )
+                fields[url_field] = _local_hls_url(music.id, None, name)
+        except Exception:
+            logger.exception("Copying %s failed donor_id=%s", url_field, donor.id)
+
+    Music.objects.filter(pk=music.pk).update(**fields)
+    for field, value in fields.items():
+        setattr(music, field, value)
+
+
+def _ensure_audio_hash(music: Music) -> str:
+    """Return ``music.audio_sha256``, hashing the stored original if missing."""
+    if not music.audio_sha256:
+        with _open_storage_stream(music.audio_file.name) as fh:
+            digest = MusicService.compute_audio_hash(fh)
+        Music.objects.filter(pk=music.pk).update(audio_sha256=digest)
+        music.audio_sha256 = digest
+    return music.audio_sha256
+
+
+def _clone_rendition(src_id: int, dst_id: int, quality: str) -> str | None:
+    """
+    Copy one tier's playlist and segments from track *src_id* to *dst_id*.
+
+    HLS file names embed the music id, so files are renamed and playlists
+    rewritten to reference the copied segments.  Returns the new playlist
+    URL, or ``None`` if the source tier has no files.
+    """
+    src_stem, dst_stem = f"{src_id}_", f"{dst_id}_"
+
+    def _rename(name: str) -> str:
+        return dst_stem + name[len(src_stem):] if name.startswith(src_stem) else name
+
+    def _rewrite(playlist: bytes) -> bytes:
+        return playlist.replace(
+            f"{src_id}_{quality}".encode(), f"{dst_id}_{quality}".encode(),
+        )
+
+    playlist_name = f"{dst_id}_{quality}.m3u8"
+
+    if _should_use_s3():
+        if s3.missing_settings():
+            return None
+        src_prefix = _s3_hls_prefix(src_id, quality)
+        dst_prefix = _s3_hls_prefix(dst_id, quality)
+        keys = list(s3.iter_keys(src_prefix))
+        if not keys:
+            return None
+        playlists = [k for k in keys if k.endswith(".m3u8")]
+        s3.copy_objects([
+            (key, dst_prefix + _rename(key[len(src_prefix):]))
+            for key in keys if key not in playlists
+        ])
+        # Playlists last, so they never reference segments not yet copied
+        for key in playlists:
+            s3.put_object(dst_prefix + _rename(key[len(src_prefix):]), _rewrite(s3.read_object(key)))
+        return _s3_media_url(dst_prefix + playlist_name)
+
+    src_dir = Path(_local_hls_dir(src_id, quality))
+    if not src_dir.is_dir():
+        return None
+    dst_dir = _local_hls_dir(dst_id, quality)
+    os.makedirs(dst_dir, exist_ok=True)
+    for fp in src_dir.iterdir():
+        dest = os.path.join(dst_dir, _rename(fp.name))
+        if fp.suffix == ".m3u8":
+            Path(dest).write_bytes(_rewrite(fp.read_bytes()))
+        elif fp.is_file():
+            shutil.copy2(fp, dest)
+    return _local_hls_url(dst_id, quality, playlist_name)
+
+
+def _publish_master_playlists(music: Music) -> dict[str, str]:
+    """
+    Write one master playlist per quality cap and store their URLs.
+
+    The master for a cap lists every published tier at or below it, so a
+    player can switch between them as bandwidth changes without ever
+    exceeding what the listener is entitled to.  Variant URIs are relative
+    (``<quality>/<id>_<quality>.m3u8``) and resolve next to the master on
+    both S3 and local storage.
+    """
+    if _should_use_s3() and s3.missing_settings():
+        return {}
+
+    available = set(music.streaming_files.values_list("quality", flat=True))
+    session_data: dict[str, str] = {}
+    gain = music.get_replay_gain_db()
+    if gain is not None:
+        session_data[hls.SESSION_DATA_REPLAY_GAIN] = f"{gain:.2f}"
+        session_data[hls.SESSION_DATA_LOUDNESS] = f"{music.loudness_lufs:.2f}"
+    masters: dict[str, str] = {}
+    for cap in HLSQuality.values:
+        variants = [
+            (f"{q}/{music.id}_{q}.m3u8", hls.parse_bitrate(QUALITY_SETTINGS[q]["bitrate"]))
+            for q in hls.qualities_up_to(cap)
+            if q in available
+        ]
+        if not variants:
+            continue
+
+        name = hls.master_playlist_name(music.id, cap)
+        body = hls.render_master_playlist(variants, session_data).encode()
+        if _should_use_s3():
+            key = _s3_hls_root(music.id) + name
+            s3.put_object(key, body)
+            masters[cap] = _s3_media_url(key)
+        else:
+            root = _local_hls_dir(music.id)
+            os.makedirs(root, exist_ok=True)
+            Path(root, name).write_bytes(body)
+            masters[cap] = _local_hls_url(music.id, None, name)
+
+    Music.objects.filter(pk=music.pk).update(hls_master_playlists=masters)
+    music.hls_master_playlists = masters
+    logger.info("Published %s master playlists music_id=%s", len(masters), music.id)
+    return masters
+
+
+def _publish_master_playlists_safely(music: Music) -> None:
+    """Publish master playlists; a failure leaves single-tier streaming intact."""
+    try:
+        _publish_master_playlists(music)
+    except Exception:
+        logger.exception("Publishing master playlists failed music_id=%s", music.id)
+
+
 def _upload_hls_to_s3(
     music_id: int,
     quality: str,
@@ -284,57 +1361,99 @@ def _upload_hls_to_s3(
     playlist_filename: str,
 ) -> str | None:
     """Upload HLS playlist and segments to S3, return the CloudFront/S3 URL."""
-    required = ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_STORAGE_BUCKET_NAME", "AWS_S3_REGION_NAME")
-    for attr in required:
-        if not getattr(settings, attr, None):
-            logger.error("Missing AWS setting: %s", attr)
-            return None
+    for attr in s3.missing_settings():
+        logger.error("Missing AWS setting: %s", attr)
+        return None
 
-    endpoint_url = getattr(settings, "AWS_S3_ENDPOINT_URL", None) or None
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME,
-        endpoint_url=endpoint_url,
-    )
-    bucket = settings.AWS_STORAGE_BUCKET_NAME
-    prefix = f"media/hls/{music_id}/{quality}/"
+    prefix = _s3_hls_prefix(music_id, quality)
 
-    files = [p for p in Path(quality_dir).iterdir() if p.is_file()]
-    if not files:
+    if not any(p.is_file() for p in Path(quality_dir).iterdir()):
         logger.error("No files to upload quality=%s", quality)
         return None
 
-    uploaded = 0
-    for i, fp in enumerate(files, 1):
-        key = prefix + fp.name
-        content_type = HLS_CONTENT_TYPES.get(fp.suffix.lstrip("."), "application/octet-stream")
-        try:
-            with open(fp, "rb") as fh:
-                s3.upload_fileobj(
-                    fh, bucket, key,
-                    ExtraArgs={"ContentType": content_type, "CacheControl": "max-age=86400"},
-                )
-            uploaded += 1
-            logger.debug("Uploaded %s (%s/%s)", fp.name, i, len(files))
-        except ClientError as exc:
-            logger.error("S3 upload failed file=%s error=%s", fp.name, exc)
-            return None
-
-    if uploaded == 0:
+    try:
+        report = s3.upload_hls_directory(quality_dir, prefix)
+    except ClientError as exc:
+        logger.error("S3 upload failed quality=%s error=%s", quality, exc)
         return None
 
-    playlist_key = prefix + playlist_filename
+    logger.info("Uploaded %s HLS files quality=%s", report.files, quality)
+    return _s3_media_url(prefix + playlist_filename)
+
+
+def _should_use_s3() -> bool:
+    """
+    Whether HLS output goes to S3.
+
+    S3 is used when enabled AND not in DEBUG mode; local storage is
+    preferred in DEBUG mode to simplify development.
+    """
+    return getattr(settings, "USE_S3_MEDIA_STORAGE", False) and not settings.DEBUG
+
+
+def _s3_hls_root(music_id: int) -> str:
+    """Bucket key prefix holding every HLS artefact of a track."""
+    return f"{HLS_ROOT_PREFIX}{music_id}/"
+
+
+def _s3_hls_prefix(music_id: int, quality: str) -> str:
+    """Bucket key prefix holding one tier's playlist and segments."""
+    return f"{_s3_hls_root(music_id)}{quality}/"
+
+
+def _local_hls_dir(music_id: int, quality: str | None = None) -> str:
+    """Directory under ``MEDIA_ROOT`` holding one tier (or the whole track) locally."""
+    return os.path.join(settings.MEDIA_ROOT, "hls", str(music_id), quality or "")
+
+
+def _local_hls_url(music_id: int, quality: str | None, filename: str) -> str:
+    """``MEDIA_URL``-relative URL of a locally served HLS file."""
+    return os.path.join(settings.MEDIA_URL, "hls", str(music_id), quality or "", filename)
+
+
+def _s3_media_url(key: str) -> str:
+    """Public CloudFront/S3 URL for an object key in the media bucket."""
     media_domain = getattr(settings, "MEDIA_DOMAIN", "") or getattr(settings, "CLOUDFRONT_DOMAIN", "")
     if media_domain:
-        url = f"https://{media_domain}/{playlist_key}"
-    else:
-        url = f"https://{bucket}.s3.{settings.AWS_S3_REGION_NAME}.amazonaws.com/{playlist_key}"
-        logger.warning("MEDIA_DOMAIN/CLOUDFRONT_DOMAIN not configured — using direct S3 URL")
+        return f"https://{media_domain}/{key}"
+    logger.warning("MEDIA_DOMAIN/CLOUDFRONT_DOMAIN not configured — using direct S3 URL")
+    return (
+        f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3."
+        f"{settings.AWS_S3_REGION_NAME}.amazonaws.com/{key}"
+    )
+
+
+def _incremental_uploader(
+    music_id: int, quality_dirs: dict[str, str],
+) -> s3.IncrementalUploader | None:
+    """
+    Build an uploader that ships segments while FFmpeg is still encoding.
 
-    logger.info("Uploaded %s HLS files quality=%s", uploaded, quality)
-    return url
+    Only used with ``HLS_INCREMENTAL_UPLOAD`` enabled and S3 output fully
+    configured; otherwise segments are uploaded after FFmpeg exits.  Not
+    available for single-file fMP4 output, whose one media file keeps
+    growing until FFmpeg exits.
+    """
+    if not getattr(settings, "HLS_INCREMENTAL_UPLOAD", False) or not _should_use_s3():
+        return None
+    if _segment_format() == HLSSegmentFormat.FMP4:
+        return None
+    if s3.missing_settings():
+        return None
+    return s3.IncrementalUploader({
+        quality_dir: _s3_hls_prefix(music_id, quality)
+        for quality, quality_dir in quality_dirs.items()
+    })
+
+
+def _finish_incremental_upload(uploader: s3.IncrementalUploader, music_id: int) -> bool:
+    """Flush the remaining segments and publish playlists; False on failure."""
+    try:
+        uploader.finish()
+        return True
+    except ClientError as exc:
+        logger.error("Incremental S3 upload failed music_id=%s error=%s", music_id, exc)
+        return False
 
 
 def _cleanup_s3_objects(music_id: int) -> None:
@@ -343,21 +1462,98 @@ def _cleanup_s3_objects(music_id: int) -> None:
         return
 
     try:
-        endpoint_url = getattr(settings, "AWS_S3_ENDPOINT_URL", None) or None
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME,
-            endpoint_url=endpoint_url,
-        )
-        bucket = settings.AWS_STORAGE_BUCKET_NAME
-        prefix = f"media/hls/{music_id}/"
-
-        resp = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
-        objects = [{"Key": o["Key"]} for o in resp.get("Contents", [])]
-        if objects:
-            s3.delete_objects(Bucket=bucket, Delete={"Objects": objects})
-            logger.info("Cleaned up %s S3 objects music_id=%s", len(objects), music_id)
+        deleted = s3.delete_keys(s3.iter_keys(_s3_hls_root(music_id)))
+        if deleted:
+            logger.info("Cleaned up %s S3 objects music_id=%s", deleted, music_id)
     except Exception:
         logger.exception("S3 cleanup failed music_id=%s", music_id)
+
+
+# ---------------------------------------------------------------------------
+# Orphaned artefact collection
+# ---------------------------------------------------------------------------
+
+@dataclass
+class _LiveTrack:
+    """What the database still references under one track's HLS prefix."""
+    # quality -> HLSSegmentFormat of its StreamingFile
+    qualities: dict[str, str]
+    # File names at the track root (masters, waveform, preview)
+    root_names: set[str]
+    # A transcode is running, so unreferenced files may be in flight
+    busy: bool
+
+
+def _group_objects_by_track(
+    objects: Iterator[dict], tracks_per_group: int,
+) -> Iterator[dict[int, list[dict]]]:
+    """
+    Group a key-ordered listing into ``{music_id: [objects]}`` chunks.
+
+    Keys of one track are contiguous in a listing, so a chunk can be
+    handed out as soon as it holds *tracks_per_group* tracks.  Keys that
+    do not follow the ``media/hls/<id>/`` layout are left alone.
+    """
+    group: dict[int, list[dict]] = {}
+    for obj in objects:
+        track_part = obj["Key"][len(HLS_ROOT_PREFIX):].split("/", 1)[0]
+        if not track_part.isdigit():
+            continue
+        music_id = int(track_part)
+        if music_id not in group and len(group) >= tracks_per_group:
+            yield group
+            group = {}
+        group.setdefault(music_id, []).append(obj)
+    if group:
+        yield group
+
+
+def _live_tracks(music_ids: list[int]) -> dict[int, _LiveTrack]:
+    """Referenced HLS files of *music_ids*, in two queries."""
+    tracks = {
+        row["id"]: _LiveTrack(
+            qualities={},
+            root_names={
+                url.rsplit("/", 1)[-1]
+                for url in [
+                    row["waveform_url"],
+                    row["preview_url"],
+                    *(row["hls_master_playlists"] or {}).values(),
+                ]
+                if url
+            },
+            busy=row["transcode_job__status"] == TranscodeStatus.RUNNING,
+        )
+        for row in Music.objects.filter(id__in=music_ids).values(
+            "id", "waveform_url", "preview_url", "hls_master_playlists", "transcode_job__status",
+        )
+    }
+    for music_id, quality, segment_format in StreamingFile.objects.filter(
+        music_id__in=music_ids,
+    ).values_list("music_id", "quality", "segment_format"):
+        tracks[music_id].qualities[quality] = segment_format
+    return tracks
+
+
+def _is_orphaned(key: str, music_id: int, track: _LiveTrack | None) -> bool:
+    """
+    Whether nothing in the database can lead a player to *key*.
+
+    Orphans are: anything of a deleted track, tiers without a
+    ``StreamingFile``, segments in the container the tier no longer uses,
+    and root files (superseded content-hashed waveforms/previews, masters)
+    the track no longer points at.
+    """
+    if track is None:
+        return True
+    if track.busy:
+        return False
+    rest = key[len(_s3_hls_root(music_id)):]
+    quality, sep, name = rest.partition("/")
+    if not sep:
+        return rest not in track.root_names
+    if quality not in track.qualities:
+        return True
+    stale_suffix = ".ts" if track.qualities[quality] == HLSSegmentFormat.FMP4 else ".mp4"
+    return name.endswith(stale_suffix)
+
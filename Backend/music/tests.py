@@ -1,3 +1,680 @@
-from django.test import TestCase
+import struct
+import uuid
+from datetime import timedelta
+from io import StringIO
+from urllib.parse import urlsplit
+from unittest.mock import patch
 
-# Create your tests here.
+from celery import Signature, signature
+from celery.exceptions import Retry
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+
+from artists.models import Artist, ArtistVerificationStatus
+from common.constants import HLS_TRANSCODE_MODE_PER_QUALITY
+from music import entitlements, hls, manifest, signing
+from music.ffmpeg import (
+    FAILURE_ERROR,
+    FAILURE_MEMORY_LIMIT,
+    FAILURE_OOM,
+    FFmpegError,
+    classify_failure,
+    parse_ebur128_summary,
+)
+from music.jobs import TranscodeTracker, source_fingerprint
+from music.models import (
+    HLSQuality,
+    HLSSegmentFormat,
+    Music,
+    MusicApprovalStatus,
+    StreamingFile,
+    TranscodeJob,
+    TranscodeStatus,
+)
+from music.services import StreamingService
+from music.tasks import (
+    QUALITY_SETTINGS,
+    collect_orphaned_hls_objects,
+    convert_audio_to_hls,
+    current_settings_fingerprint,
+)
+from music.throttles import MusicStreamingBatchRateThrottle, MusicStreamingRateThrottle
+from music.views import MusicViewSet
+from music.waveform import BLOCK_SAMPLES, WAVEFORM_BUCKETS, PeakCollector
+from premium.models import SubscriptionStatus, UserSubscription
+from users.models import CustomUser
+
+
+def _create_track(**fields):
+    tag = uuid.uuid4().hex[:12]
+    user = CustomUser.objects.create(
+        email=f"test-{tag}@example.invalid",
+        username=f"test-{tag}",
+        first_name="Test",
+        last_name="Artist",
+    )
+    artist = Artist.objects.create(user=user, status=ArtistVerificationStatus.APPROVED)
+    return Music.objects.create(
+        artist=artist,
+        name=f"Track {tag}",
+        audio_file=f"music_files/{tag}.mp3",
+        audio_sha256="a" * 64,
+        approval_status=MusicApprovalStatus.PENDING,
+        release_date=timezone.now(),
+        **fields,
+    )
+
+
+def _complete_all_tiers(music, tracker):
+    for quality in HLSQuality.values:
+        StreamingFile.objects.create(
+            music=music, quality=quality, hls_playlist=f"https://cdn.example/{quality}.m3u8",
+        )
+        tracker.tier_completed(quality, 1024)
+
+
+class TranscodeTrackerSourceTests(TestCase):
+    def test_completed_tiers_are_kept_for_the_same_source(self):
+        music = _create_track()
+        tracker = TranscodeTracker.start(music, HLSQuality.values, "settings", source_fingerprint(music))
+        _complete_all_tiers(music, tracker)
+
+        tracker = TranscodeTracker.start(music, HLSQuality.values, "settings", source_fingerprint(music))
+
+        self.assertEqual(tracker.completed_qualities(), set(HLSQuality.values))
+
+    def test_replaced_audio_discards_completed_tiers(self):
+        music = _create_track()
+        tracker = TranscodeTracker.start(music, HLSQuality.values, "settings", source_fingerprint(music))
+        _complete_all_tiers(music, tracker)
+
+        music.audio_file = "music_files/replacement.mp3"
+        music.audio_sha256 = "b" * 64
+        music.save()
+        tracker = TranscodeTracker.start(music, HLSQuality.values, "settings", source_fingerprint(music))
+
+        self.assertEqual(tracker.completed_qualities(), set())
+        self.assertEqual(
+            set(tracker.job.tiers.values_list("status", flat=True)), {TranscodeStatus.PENDING},
+        )
+
+
+class ForcedTranscodeTests(TestCase):
+    def setUp(self):
+        self.music = _create_track()
+        tracker = TranscodeTracker.start(
+            self.music, QUALITY_SETTINGS, current_settings_fingerprint(), source_fingerprint(self.music),
+        )
+        _complete_all_tiers(self.music, tracker)
+
+    def _run(self, **kwargs):
+        """Run the task eagerly with encoding stubbed; returns the tiers it encoded."""
+        encoded = []
+
+        def _transcode(music_id, music, pending, tracker):
+            encoded.extend(pending)
+            return [{"quality": quality} for quality in pending]
+
+        with patch("music.tasks.default_storage.exists", return_value=True), \
+                patch("music.tasks._transcode_all_qualities", side_effect=_transcode), \
+                patch("music.tasks._publish_master_playlists_safely"), \
+                patch("music.manifest.invalidate"):
+            convert_audio_to_hls.apply(args=[self.music.id], kwargs=kwargs)
+        return encoded
+
+    def test_completed_tiers_are_skipped_without_force(self):
+        self.assertEqual(self._run(), [])
+
+    def test_force_re_encodes_every_tier(self):
+        self.assertCountEqual(self._run(force=True), QUALITY_SETTINGS)
+
+    def test_backfill_force_passes_force_to_the_task(self):
+        with patch.object(Signature, "apply_async", autospec=True) as apply_async:
+            call_command(
+                "backfill_hls", ids=[self.music.id], all_statuses=True, force=True, stdout=StringIO(),
+            )
+
+        (signature,) = [call.args[0] for call in apply_async.call_args_list]
+        self.assertEqual(signature.args, (self.music.id,))
+        self.assertEqual(signature.kwargs, {"force": True})
+
+
+class BackfillLaneTests(TestCase):
+    def test_failed_track_does_not_stop_the_rest_of_the_lane(self):
+        music_ids = [_create_track().id for _ in range(3)]
+        queued = []
+
+        with patch.object(Signature, "apply_async", autospec=True) as apply_async:
+            call_command(
+                "backfill_hls", ids=music_ids, all_statuses=True, concurrency=1, stdout=StringIO(),
+            )
+            # Fail every track for good: only its errback keeps the lane going
+            while apply_async.call_count > len(queued):
+                current = apply_async.call_args.args[0]
+                queued.append(current.args[0])
+                for errback in current.options.get("link_error", []):
+                    signature(errback).apply()
+
+        self.assertEqual(queued, music_ids)
+
+
+class HLSReadinessTests(TestCase):
+    def test_track_without_renditions_is_not_ready(self):
+        self.assertFalse(MusicViewSet._hls_ready(_create_track()))
+
+    def test_partial_or_re_encoding_track_with_renditions_is_ready(self):
+        music = _create_track()
+        tracker = TranscodeTracker.start(music, QUALITY_SETTINGS, current_settings_fingerprint(), "")
+        _complete_all_tiers(music, tracker)
+
+        for status in (TranscodeStatus.FAILED, TranscodeStatus.RUNNING):
+            TranscodeJob.objects.filter(music=music).update(status=status)
+            self.assertTrue(MusicViewSet._hls_ready(music))
+
+
+class TranscodeSetupFailureTests(TestCase):
+    def test_failing_to_hash_the_source_fails_the_job_and_retries(self):
+        music = _create_track()
+        TranscodeTracker.start(music, QUALITY_SETTINGS, current_settings_fingerprint(), "")
+
+        with patch("music.tasks.default_storage.exists", return_value=True), \
+                patch("music.tasks._ensure_audio_hash", side_effect=OSError("storage read failed")), \
+                patch.object(convert_audio_to_hls, "retry", side_effect=Retry()) as retry:
+            convert_audio_to_hls.apply(args=[music.id])
+
+        retry.assert_called_once_with(countdown=60)
+        music.transcode_job.refresh_from_db()
+        self.assertEqual(music.transcode_job.status, TranscodeStatus.FAILED)
+        self.assertIn("storage read failed", music.transcode_job.error)
+
+
+@override_settings(HLS_TRANSCODE_MODE=HLS_TRANSCODE_MODE_PER_QUALITY, HLS_TRANSCODE_PARALLELISM=1)
+class FFmpegRetryPolicyTests(TestCase):
+    def _run(self, failing: dict[str, FFmpegError]):
+        """Run the task eagerly; tiers in *failing* raise, the rest succeed."""
+        music = _create_track()
+
+        def _transcode_tier(music_id, music, source, quality, cfg, temp_dir, tracker, analyse):
+            if quality in failing:
+                raise failing[quality]
+            return {"quality": quality, "bytes": 1024}
+
+        with patch("music.tasks.default_storage.exists", return_value=True), \
+                patch("music.tasks._resolve_source"), \
+                patch("music.tasks._transcode_single_quality", side_effect=_transcode_tier), \
+                patch("music.tasks._publish_master_playlists_safely"), \
+                patch("music.tasks.cleanup_failed_hls_conversion"), \
+                patch("music.manifest.invalidate"), \
+                patch.object(convert_audio_to_hls, "retry", side_effect=Retry()) as retry:
+            convert_audio_to_hls.apply(args=[music.id])
+        return retry
+
+    def test_oom_in_one_tier_is_retried_after_a_pause(self):
+        oom = FFmpegError(classify_failure(-9, "Killed"), -9, "Killed")
+        self.assertEqual(oom.kind, FAILURE_OOM)
+
+        retry = self._run({HLSQuality.HIGH: oom})
+
+        retry.assert_called_once_with(countdown=120)
+
+    def test_worst_tier_failure_decides_the_back_off(self):
+        error = FFmpegError(FAILURE_ERROR, 1, "Conversion failed!")
+        oom = FFmpegError(FAILURE_OOM, -9, "Killed")
+
+        retry = self._run({HLSQuality.MEDIUM: error, HLSQuality.LOSSLESS: oom})
+
+        retry.assert_called_once_with(countdown=120)
+
+    def test_hitting_the_memory_limit_is_not_retried(self):
+        stderr = "Error while filtering: Cannot allocate memory"
+        failure = FFmpegError(classify_failure(1, stderr), 1, stderr)
+        self.assertEqual(failure.kind, FAILURE_MEMORY_LIMIT)
+
+        retry = self._run({HLSQuality.LOSSLESS: failure})
+
+        retry.assert_not_called()
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class StreamManifestCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_manifest_built_before_an_invalidation_is_not_served(self):
+        music = _create_track()
+        stale = manifest.build_manifest(music.id)
+
+        def _build_then_invalidate(music_ids):
+            # The track changes and commits between the read and the cache write
+            manifest.invalidate(music.id)
+            return {music.id: stale}
+
+        with patch("music.manifest.build_manifests", side_effect=_build_then_invalidate):
+            manifest.get_manifest(music.id)
+        Music.objects.filter(pk=music.id).update(name="Renamed")
+
+        self.assertEqual(manifest.get_manifest(music.id).name, "Renamed")
+
+    def test_cached_manifest_is_served_without_queries(self):
+        music = _create_track()
+        manifest.get_manifest(music.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(manifest.get_manifests([music.id])[music.id].id, music.id)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class StreamingThrottleTests(TestCase):
+    class _BatchView:
+        def __init__(self, cost):
+            self.cost = cost
+
+        def throttle_cost(self, request):
+            return self.cost
+
+    def setUp(self):
+        cache.clear()
+        self.user = _create_track().artist.user
+
+    def _request(self):
+        request = APIRequestFactory().get("/")
+        request.user = self.user
+        return request
+
+    def test_batch_and_single_requests_share_one_budget(self):
+        single = MusicStreamingRateThrottle()
+        for _ in range(4):
+            self.assertTrue(single.allow_request(self._request(), None))
+
+        batch = MusicStreamingBatchRateThrottle()
+        self.assertFalse(batch.allow_request(self._request(), self._BatchView(7)))
+        self.assertTrue(batch.allow_request(self._request(), self._BatchView(6)))
+        self.assertFalse(MusicStreamingRateThrottle().allow_request(self._request(), None))
+
+
+@override_settings(
+    STREAM_URL_SIGNING=True, STREAM_URL_SIGNING_KEY="test-signing-key", STREAM_URL_TTL_SECONDS=3600,
+)
+class SignedPathTests(SimpleTestCase):
+    NOW = 1_700_000_000
+
+    def _signed(self, rest="low/42_low.m3u8", cap=HLSQuality.LOW, music_id=42):
+        url = signing.sign_url(f"https://cdn.example/media/hls/{music_id}/{rest}", cap, now=self.NOW)
+        return urlsplit(url).path
+
+    def _with_rest(self, path, rest):
+        prefix, _, _ = path.partition("hls/42/")
+        return f"{prefix}hls/42/{rest}"
+
+    def test_signed_path_is_accepted(self):
+        self.assertTrue(signing.verify_path(self._signed(), now=self.NOW))
+
+    def test_forged_token_is_refused(self):
+        path = self._signed()
+        token = path.split("/")[5]
+        forged = path.replace(token, ("A" if token[0] != "A" else "B") + token[1:])
+        self.assertFalse(signing.verify_path(forged, now=self.NOW))
+
+    def test_token_signed_under_another_key_is_refused(self):
+        with override_settings(STREAM_URL_SIGNING_KEY="another-key"):
+            path = self._signed()
+        self.assertFalse(signing.verify_path(path, now=self.NOW))
+
+    def test_expired_token_is_refused(self):
+        path = self._signed()
+        expires = int(path.split("/")[3])
+        self.assertTrue(signing.verify_path(path, now=expires - 1))
+        self.assertFalse(signing.verify_path(path, now=expires))
+
+    def test_token_of_one_track_does_not_grant_another(self):
+        path = self._signed()
+        self.assertFalse(signing.verify_path(path.replace("hls/42/", "hls/43/"), now=self.NOW))
+        self.assertFalse(signing.verify_path(path.replace("hls/42/", "hls/420/"), now=self.NOW))
+
+    def test_low_token_does_not_grant_higher_tiers(self):
+        path = self._signed()
+        self.assertTrue(signing.verify_path(self._with_rest(path, "low/42_low_000.ts"), now=self.NOW))
+        self.assertTrue(signing.verify_path(self._with_rest(path, "42_master_low.m3u8"), now=self.NOW))
+        for rest in ("high/42_high.m3u8", "high/42_high_000.ts", "42_master_high.m3u8"):
+            with self.subTest(rest=rest):
+                self.assertFalse(signing.verify_path(self._with_rest(path, rest), now=self.NOW))
+
+    def test_cap_outside_the_known_tiers_is_refused(self):
+        path = self._signed()
+        self.assertFalse(signing.verify_path(path.replace("/low/", "/ultra/", 1), now=self.NOW))
+
+    def test_traversal_is_refused(self):
+        path = self._signed()
+        for rest in (
+            "low/../high/42_high.m3u8",
+            "low/%2e%2e/high/42_high.m3u8",
+            "low%2F..%2Fhigh%2F42_high.m3u8",
+        ):
+            with self.subTest(rest=rest):
+                self.assertFalse(signing.verify_path(self._with_rest(path, rest), now=self.NOW))
+
+
+@override_settings(USE_S3_MEDIA_STORAGE=True, DEBUG=False, HLS_GC_GRACE_HOURS=24)
+class OrphanedHLSCollectionTests(TestCase):
+    def setUp(self):
+        self.old = timezone.now() - timedelta(days=7)
+        self.music = _create_track(
+            waveform_url="https://cdn.example/media/hls/1/waveform.cafe.json",
+            preview_url="https://cdn.example/media/hls/1/preview.cafe.m4a",
+        )
+        self.root = f"media/hls/{self.music.id}/"
+        Music.objects.filter(pk=self.music.pk).update(
+            hls_master_playlists={"low": f"https://cdn.example/{self.root}{self.music.id}_master_low.m3u8"},
+        )
+        StreamingFile.objects.create(
+            music=self.music, quality=HLSQuality.LOW, segment_format=HLSSegmentFormat.FMP4,
+            hls_playlist=f"https://cdn.example/{self.root}low/low.m3u8",
+        )
+        StreamingFile.objects.create(
+            music=self.music, quality=HLSQuality.MEDIUM, segment_format=HLSSegmentFormat.MPEGTS,
+            hls_playlist=f"https://cdn.example/{self.root}medium/medium.m3u8",
+        )
+        self.busy = _create_track()
+        TranscodeJob.objects.create(music=self.busy, status=TranscodeStatus.RUNNING)
+        self.deleted_id = _create_track().id
+        Music.objects.filter(pk=self.deleted_id).delete()
+
+    def _object(self, key, modified=None):
+        return {"Key": key, "Size": 1, "LastModified": modified or self.old}
+
+    def _listing(self):
+        live = [
+            "low/low.m3u8", "low/low.mp4", "medium/medium.m3u8", "medium/medium_000.ts",
+            "waveform.cafe.json", "preview.cafe.m4a", f"{self.music.id}_master_low.m3u8",
+        ]
+        stale = [
+            "low/low_000.ts", "medium/medium.mp4", "high/high.m3u8",
+            "waveform.beef.json", "preview.beef.m4a", f"{self.music.id}_master_high.m3u8",
+        ]
+        objects = [self._object(self.root + name) for name in sorted(live + stale)]
+        objects.append(self._object(f"media/hls/{self.busy.id}/high/high_000.ts"))
+        objects.append(self._object(f"media/hls/{self.deleted_id}/low/low.m3u8"))
+        objects.append(self._object(f"media/hls/{self.deleted_id}/low/low_000.ts", timezone.now()))
+        objects.sort(key=lambda obj: obj["Key"])
+        expected = {self.root + name for name in stale} | {f"media/hls/{self.deleted_id}/low/low.m3u8"}
+        return objects, expected
+
+    def _collect(self, objects, dry_run=False):
+        deleted = []
+
+        def _delete_keys(keys, batch_size, pause_seconds):
+            deleted.extend(keys)
+            return len(deleted)
+
+        with patch("music.tasks.s3.missing_settings", return_value=[]), \
+                patch("music.tasks.s3.iter_objects", return_value=iter(objects)), \
+                patch("music.tasks.s3.delete_keys", side_effect=_delete_keys) as delete_keys:
+            result = collect_orphaned_hls_objects.apply(kwargs={"dry_run": dry_run}).get()
+        return result, deleted, delete_keys
+
+    def test_collects_only_unreferenced_objects_past_the_grace_period(self):
+        objects, expected = self._listing()
+
+        result, deleted, _ = self._collect(objects)
+
+        self.assertEqual(set(deleted), expected)
+        self.assertEqual(result["scanned"], len(objects))
+        self.assertEqual(result["deleted"], len(expected))
+
+    def test_max_deletes_caps_a_run(self):
+        objects, expected = self._listing()
+
+        with override_settings(HLS_GC_MAX_DELETES_PER_RUN=3):
+            result, deleted, _ = self._collect(objects)
+
+        self.assertEqual(len(deleted), 3)
+        self.assertLessEqual(set(deleted), expected)
+        self.assertEqual(result["deleted"], 3)
+
+    def test_dry_run_deletes_nothing(self):
+        objects, expected = self._listing()
+
+        result, _, delete_keys = self._collect(objects, dry_run=True)
+
+        delete_keys.assert_not_called()
+        self.assertEqual(result["orphaned"], len(expected))
+        self.assertEqual(result["deleted"], 0)
+
+
+class TranscodeProgressTests(TestCase):
+    def setUp(self):
+        self.music = _create_track(duration=timedelta(seconds=100))
+        self.tracker = TranscodeTracker.start(self.music, QUALITY_SETTINGS, "settings")
+
+    def _tiers(self):
+        return {tier.quality: tier for tier in self.tracker.job.tiers.all()}
+
+    def test_single_tier_run_records_bytes_written(self):
+        on_progress = self.tracker.progress_callback([HLSQuality.LOW])
+        on_progress({"out_time_us": "50000000", "total_size": "4096", "progress": "end"})
+
+        tier = self._tiers()[HLSQuality.LOW]
+        self.assertEqual(tier.progress, 0.5)
+        self.assertEqual(tier.bytes_written, 4096)
+
+    def test_multi_tier_run_only_records_progress(self):
+        on_progress = self.tracker.progress_callback(QUALITY_SETTINGS)
+        on_progress({"out_time_us": "50000000", "total_size": "4096", "progress": "end"})
+
+        for tier in self._tiers().values():
+            self.assertEqual(tier.progress, 0.5)
+            self.assertEqual(tier.bytes_written, 0)
+
+
+# Tail of ``ffmpeg -af ebur128=peak=true:framelog=verbose`` stderr (FFmpeg 6.1)
+EBUR128_STDERR = """\
+size=N/A time=00:03:21.12 bitrate=N/A speed= 312x
+[Parsed_ebur128_0 @ 0x55d5c8e0c6c0] Summary:
+
+  Integrated loudness:
+    I:         -9.3 LUFS
+    Threshold: -19.5 LUFS
+
+  Loudness range:
+    LRA:         4.8 LU
+    Threshold: -29.5 LUFS
+    LRA low:   -12.4 LUFS
+    LRA high:   -7.6 LUFS
+
+  True peak:
+    Peak:        0.4 dBFS
+"""
+
+
+class EBUR128SummaryTests(SimpleTestCase):
+    def test_summary_values_are_parsed(self):
+        self.assertEqual(parse_ebur128_summary(EBUR128_STDERR), (-9.3, 0.4))
+
+    def test_parsed_values_drive_the_replay_gain(self):
+        loudness, peak = parse_ebur128_summary(EBUR128_STDERR)
+        music = Music(loudness_lufs=loudness, true_peak_dbtp=peak)
+
+        with override_settings(LOUDNESS_TARGET_LUFS=-14.0):
+            self.assertEqual(music.get_replay_gain_db(), -4.7)
+            # A quieter master would need a boost, but its peak caps the gain at -1.4 dB
+            music.loudness_lufs = -20.0
+            self.assertEqual(music.get_replay_gain_db(), -1.4)
+
+    def test_digital_silence_has_no_true_peak(self):
+        stderr = EBUR128_STDERR.replace("I:         -9.3 LUFS", "I:         -70.0 LUFS").replace(
+            "Peak:        0.4 dBFS", "Peak:       -inf dBFS",
+        )
+        self.assertEqual(parse_ebur128_summary(stderr), (-70.0, None))
+
+    def test_negative_infinite_loudness_is_none(self):
+        stderr = EBUR128_STDERR.replace("I:         -9.3 LUFS", "I:         -inf LUFS")
+        self.assertEqual(parse_ebur128_summary(stderr), (None, 0.4))
+
+    def test_missing_summary_gives_nothing(self):
+        truncated = EBUR128_STDERR.split("[Parsed_ebur128_0")[0]
+        self.assertEqual(parse_ebur128_summary(truncated), (None, None))
+        self.assertEqual(parse_ebur128_summary(""), (None, None))
+
+    def test_summary_cut_before_the_true_peak(self):
+        truncated = EBUR128_STDERR.split("  True peak:")[0]
+        self.assertEqual(parse_ebur128_summary(truncated), (-9.3, None))
+
+
+def _pcm(*samples: int) -> bytes:
+    return struct.pack(f"<{len(samples)}h", *samples)
+
+
+class PeakCollectorTests(SimpleTestCase):
+    def test_partial_trailing_block_is_kept(self):
+        collector = PeakCollector()
+        collector.feed(_pcm(*[1024] * BLOCK_SAMPLES))
+        # A few samples short of a block, then half a sample
+        collector.feed(_pcm(*[0] * 9, -32768) + b"\x01")
+
+        self.assertEqual(list(collector.buckets(2)), [1024 * 127 // 32768, 127])
+
+    def test_chunking_does_not_change_the_peaks(self):
+        samples = [(i * 37) % 65536 - 32768 for i in range(BLOCK_SAMPLES * 7 + 100)]
+        whole, chunked = PeakCollector(), PeakCollector()
+        whole.feed(_pcm(*samples))
+        data = _pcm(*samples)
+        for offset in range(0, len(data), 333):
+            chunked.feed(data[offset:offset + 333])
+
+        self.assertEqual(whole.buckets(5), chunked.buckets(5))
+
+    def test_output_is_always_the_configured_number_of_buckets(self):
+        for blocks in (1, 3, WAVEFORM_BUCKETS - 1, WAVEFORM_BUCKETS, WAVEFORM_BUCKETS + 1, 4321):
+            with self.subTest(blocks=blocks):
+                collector = PeakCollector()
+                collector.feed(_pcm(*[100] * (BLOCK_SAMPLES * blocks)))
+                self.assertEqual(len(collector.buckets()), WAVEFORM_BUCKETS)
+
+    def test_track_shorter_than_the_bucket_count_is_stretched_in_order(self):
+        collector = PeakCollector()
+        for level in (8192, 16384, 32767):
+            collector.feed(_pcm(*[level] * BLOCK_SAMPLES))
+
+        peaks = list(collector.buckets(9))
+
+        self.assertEqual(peaks, [31] * 3 + [63] * 3 + [126] * 3)
+
+    def test_no_audio_gives_no_buckets(self):
+        collector = PeakCollector()
+        collector.feed(b"\x01")
+        self.assertEqual(collector.buckets(), b"")
+
+
+class PickRenditionTests(SimpleTestCase):
+    RENDITIONS = {
+        HLSQuality.LOW: "https://cdn.example/low.m3u8",
+        HLSQuality.HIGH: "https://cdn.example/high.m3u8",
+    }
+
+    def test_requested_tier_is_served_when_present(self):
+        self.assertEqual(
+            StreamingService.pick_rendition(self.RENDITIONS, HLSQuality.HIGH),
+            (self.RENDITIONS[HLSQuality.HIGH], HLSQuality.HIGH),
+        )
+
+    def test_missing_tier_falls_back_to_the_next_lower_one(self):
+        self.assertEqual(
+            StreamingService.pick_rendition(self.RENDITIONS, HLSQuality.MEDIUM),
+            (self.RENDITIONS[HLSQuality.LOW], HLSQuality.LOW),
+        )
+
+    def test_unknown_quality_is_treated_as_low(self):
+        for quality in ("ultra", "", "HIGH"):
+            with self.subTest(quality=quality):
+                self.assertEqual(
+                    StreamingService.pick_rendition(self.RENDITIONS, quality),
+                    (self.RENDITIONS[HLSQuality.LOW], HLSQuality.LOW),
+                )
+
+    def test_cap_is_never_exceeded(self):
+        renditions = {HLSQuality.HIGH: "high.m3u8", HLSQuality.LOSSLESS: "lossless.m3u8"}
+        for cap in (HLSQuality.LOW, HLSQuality.MEDIUM):
+            with self.subTest(cap=cap):
+                self.assertIsNone(StreamingService.pick_rendition(renditions, cap))
+        for cap in HLSQuality.values:
+            stream = StreamingService.pick_rendition(self.RENDITIONS, cap)
+            self.assertLessEqual(hls.quality_rank(stream[1]), hls.quality_rank(cap))
+
+    def test_no_renditions(self):
+        self.assertIsNone(StreamingService.pick_rendition({}, HLSQuality.LOSSLESS))
+
+
+class MasterPlaylistTests(SimpleTestCase):
+    def test_variants_are_listed_lowest_bitrate_first(self):
+        playlist = hls.render_master_playlist(
+            [("high/42_high.m3u8", 256_000), ("low/42_low.m3u8", 64_000), ("medium/42_medium.m3u8", 128_000)],
+        )
+
+        self.assertEqual(
+            playlist,
+            "#EXTM3U\n"
+            "#EXT-X-VERSION:3\n"
+            "#EXT-X-INDEPENDENT-SEGMENTS\n"
+            '#EXT-X-STREAM-INF:BANDWIDTH=70400,AVERAGE-BANDWIDTH=64000,CODECS="mp4a.40.2"\n'
+            "low/42_low.m3u8\n"
+            '#EXT-X-STREAM-INF:BANDWIDTH=140800,AVERAGE-BANDWIDTH=128000,CODECS="mp4a.40.2"\n'
+            "medium/42_medium.m3u8\n"
+            '#EXT-X-STREAM-INF:BANDWIDTH=281600,AVERAGE-BANDWIDTH=256000,CODECS="mp4a.40.2"\n'
+            "high/42_high.m3u8\n",
+        )
+
+    def test_session_data_precedes_the_variants(self):
+        playlist = hls.render_master_playlist(
+            [("low/42_low.m3u8", 64_000)], {hls.SESSION_DATA_REPLAY_GAIN: "-4.7"},
+        )
+        lines = playlist.splitlines()
+
+        self.assertEqual(
+            lines[3], '#EXT-X-SESSION-DATA:DATA-ID="com.wave.replaygain.track_gain_db",VALUE="-4.7"',
+        )
+        self.assertTrue(lines[4].startswith("#EXT-X-STREAM-INF:"))
+
+    def test_bitrates_are_parsed_from_ffmpeg_notation(self):
+        self.assertEqual(hls.parse_bitrate("64k"), 64_000)
+        self.assertEqual(hls.parse_bitrate(" 1.5M "), 1_500_000)
+        self.assertEqual(hls.parse_bitrate("96000"), 96_000)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class UpdatePreferenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = _create_track().artist.user
+        UserSubscription.objects.create(
+            user=self.user,
+            status=SubscriptionStatus.ACTIVE,
+            started_at=timezone.now(),
+            expires_at=timezone.now() + timedelta(days=30),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_preference_change_invalidates_the_cached_entitlements(self):
+        self.assertEqual(entitlements.get_entitlements(self.user).quality, HLSQuality.LOW)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("update_preference"), {"preferred_quality": HLSQuality.HIGH}, format="json",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"preferred_quality": HLSQuality.HIGH})
+        self.assertEqual(entitlements.get_entitlements(self.user).quality, HLSQuality.HIGH)
+
+    def test_service_drops_the_snapshot_on_commit(self):
+        entitlements.get_entitlements(self.user)
+
+        with patch("music.services.entitlements.invalidate") as invalidate, \
+                self.captureOnCommitCallbacks(execute=True):
+            StreamingService.update_user_preference(self.user, HLSQuality.MEDIUM)
+
+        invalidate.assert_any_call(self.user.pk)
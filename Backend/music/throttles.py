@@ -1,4 +1,40 @@
 from rest_framework.throttling import UserRateThrottle
 
 class MusicStreamingRateThrottle(UserRateThrottle):
-    scope = "music_streaming"   # scope name
\ No newline at end of file
+    scope = "music_streaming"   # scope name
+
+
+class MusicStreamingBatchRateThrottle(UserRateThrottle):
+    """
+    Rate limit for batch stream resolution that counts tracks, not requests.
+
+    Shares the ``music_streaming`` scope, and so the cache history, with
+    ``MusicStreamingRateThrottle``: a request for N tracks spends N slots
+    of the same window, so prefetching a queue costs the same budget as
+    resolving its tracks one by one, minus the round trips.  The view
+    supplies the count via ``throttle_cost``.
+    """
+
+    scope = "music_streaming"
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.history = self.cache.get(self.key, [])
+        self.now = self.timer()
+
+        # Drop any requests from the history which have now passed the throttle duration
+        while self.history and self.history[-1] <= self.now - self.duration:
+            self.history.pop()
+        cost = max(1, view.throttle_cost(request))
+        if len(self.history) + cost > self.num_requests:
+            return self.throttle_failure()
+
+        self.history[:0] = [self.now] * cost
+        self.cache.set(self.key, self.history, self.duration)
+        return True
@@ -1,7 +1,7 @@
 from django.urls import path
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import GenreViewSet, MusicViewSet, MusicVerificationViewSet, PublicSongsView, SongsByArtistView, get_equalizer_presets, user_equalizer_preset, UserQualityPreferenceView, MusicStreamingView
+from .views import GenreViewSet, MusicViewSet, MusicVerificationViewSet, PublicSongsView, SongsByArtistView, get_equalizer_presets, user_equalizer_preset, UserQualityPreferenceView, MusicStreamingView, MusicWaveformView
 from . import views
 
 router = DefaultRouter()
@@ -18,6 +18,9 @@ urlpatterns = [
     path('artist/<int:artist_id>/', SongsByArtistView.as_view(), name='songs_by_artist'),
 
     path('<int:music_id>/stream/', MusicStreamingView.as_view(), name='music_stream_preferred'),
+    path('stream/batch/', views.MusicStreamingBatchView.as_view(), name='music_stream_batch'),
+    path('<int:music_id>/waveform/', MusicWaveformView.as_view(), name='music_waveform'),
+    path('hls-auth/', views.hls_token_auth, name='hls_token_auth'),
     
     # User preferences endpoints
     path('user/quality-preference/', UserQualityPreferenceView.as_view(), name='user_quality_preference'),
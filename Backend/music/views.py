@@ -8,12 +8,15 @@ from __future__ import annotations
 
 import logging
 
+from django.conf import settings
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
 from django.db.models import Q, Value, Sum
 from django.db.models.functions import Coalesce
-from django.shortcuts import get_object_or_404
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control
 from rest_framework import generics, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.generics import UpdateAPIView
@@ -24,6 +27,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from music import entitlements, manifest, signing
 from music.models import (
     Album,
     AlbumTrack,
@@ -32,22 +36,25 @@ from music.models import (
     HLSQuality,
     Music,
     MusicApprovalStatus,
-    StreamingFile,
-    UserPreference,
+    TranscodeJob,
+    TranscodeStatus,
 )
 from music.serializers import (
     GenreSerializer,
     MusicDataSerializer,
     MusicSerializer,
     MusicVerificationSerializer,
+    StreamBatchRequestSerializer,
+    TranscodeJobSerializer,
     UserPreferenceSerializer,
 )
 from music.services import MusicService, StreamingService
-from music.throttles import MusicStreamingRateThrottle
-from premium.models import UserSubscription
+from music.throttles import MusicStreamingBatchRateThrottle, MusicStreamingRateThrottle
 
 logger = logging.getLogger(__name__)
 
+WAVEFORM_REDIRECT_MAX_AGE = 3600  # 1 hour
+
 
 # ---------------------------------------------------------------------------
 # Genre views
@@ -213,7 +220,7 @@ class MusicViewSet(ModelViewSet):
         music = self.get_object()
         
         # Prevent making a track public if HLS processing isn't finished
-        if not music.is_public and not music.streaming_files.exists():
+        if not music.is_public and not self._hls_ready(music):
             return Response(
                 {"error": "Cannot make track public until HLS processing is complete."},
                 status=status.HTTP_400_BAD_REQUEST
@@ -223,6 +230,29 @@ class MusicViewSet(ModelViewSet):
         music.save(update_fields=["is_public", "updated_at"])
         return Response({"is_public": music.is_public})
 
+    @action(detail=True, methods=["get"])
+    def transcode_status(self, request, pk=None):
+        """Per-tier HLS transcode progress for the artist studio."""
+        music = self.get_object()
+        job = (
+            TranscodeJob.objects.filter(music=music)
+            .prefetch_related("tiers")
+            .first()
+        )
+        if job is None:
+            return Response({"status": TranscodeStatus.PENDING, "progress": 0.0, "tiers": []})
+        return Response(TranscodeJobSerializer(job).data)
+
+    @staticmethod
+    def _hls_ready(music: Music) -> bool:
+        """
+        Whether the track has published renditions to stream.
+
+        Deliberately not the job status: a partial run (FAILED) still serves
+        its finished tiers, and a re-encode (RUNNING) keeps serving the old ones.
+        """
+        return music.streaming_files.exists()
+
     @action(detail=True, methods=["post"])
     @transaction.atomic
     def update_album(self, request, pk=None):
@@ -272,7 +302,12 @@ class MusicViewSet(ModelViewSet):
 
     @staticmethod
     def _parse_duration(duration_str: str | None):
-        """Parse an ISO 8601 duration string, returning None on failure."""
+        """
+        Parse an ISO 8601 duration string, returning None on failure.
+
+        Only a fallback: the serializer replaces it with the duration read
+        from the uploaded file whenever the format can be probed.
+        """
         if not duration_str:
             return None
         try:
@@ -314,28 +349,23 @@ def get_equalizer_presets(request) -> Response:
 
 def _is_user_premium(user) -> bool:
     """Helper to check if a user has an active premium subscription."""
-    try:
-        return user.subscription.status == "active"
-    except UserSubscription.DoesNotExist:
-        return False
+    return entitlements.get_entitlements(user).is_premium
 
 
 @api_view(["GET", "POST"])
 @permission_classes([IsAuthenticated])
 def user_equalizer_preset(request) -> Response:
     """Get or set the user's preferred equalizer preset."""
-    cache_key = f"user_eq_preset:{request.user.id}"
-    is_premium = _is_user_premium(request.user)
+    snapshot = entitlements.get_entitlements(request.user)
 
     if request.method == "GET":
         # Even non-premium can GET (defaults to normal), but they can't change it.
         # However, for consistency with the "Premium Only" requirement, 
         # let's return a default if not premium.
-        preset_id = cache.get(cache_key, 1) if is_premium else 1
-        return Response({"preset_id": preset_id})
+        return Response({"preset_id": snapshot.eq_preset_id})
 
     # POST - Set preset (Premium Only)
-    if not is_premium:
+    if not snapshot.is_premium:
         return Response(
             {"error": "Premium subscription required to use the equalizer."},
             status=status.HTTP_403_FORBIDDEN
@@ -350,7 +380,8 @@ def user_equalizer_preset(request) -> Response:
     except EqualizerPreset.DoesNotExist:
         return Response({"error": "Preset not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    cache.set(cache_key, preset_id, timeout=None)
+    cache.set(entitlements.eq_preset_cache_key(request.user.id), preset_id, timeout=None)
+    entitlements.invalidate(request.user.id)
     return Response({
         "success": True,
         "preset": {"id": preset.id, "name": preset.name, "description": preset.description},
@@ -398,60 +429,194 @@ class MusicVerificationViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(music)
         return Response(serializer.data)
 
+    @action(detail=True, methods=["post"])
+    def retranscode(self, request, pk=None):
+        """Queue a fresh HLS transcode, ahead of routine conversions."""
+        music = self.get_object()
+        if not music.audio_file:
+            return Response(
+                {"error": "Track has no audio file."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        MusicService.trigger_hls_regeneration(music.id)
+        return Response({"status": "queued"}, status=status.HTTP_202_ACCEPTED)
+
 
 # ---------------------------------------------------------------------------
 # Streaming
 # ---------------------------------------------------------------------------
 
 class MusicStreamingView(APIView):
-    """Return the HLS streaming URL for a track at the user's preferred quality."""
+    """
+    Return the HLS streaming URL for a track at the user's preferred quality.
+
+    With ``?mode=adaptive`` the response points at a master playlist that
+    lets the player switch between every tier the user's subscription
+    allows (premium: up to lossless, free: low only).
+    """
 
     permission_classes = [IsAuthenticated]
     throttle_classes = [MusicStreamingRateThrottle]
 
     def get(self, request, music_id: int) -> Response:
-        music = get_object_or_404(Music, id=music_id)
+        # Cached per track; a steady-state stream start reads no track rows
+        music = manifest.get_manifest(music_id)
+        if music is None:
+            raise Http404("No Music matches the given query.")
+
+        body, status_code = _stream_payload(
+            music,
+            entitlements.get_entitlements(request.user),
+            request.user.id,
+            adaptive=request.query_params.get("mode") == "adaptive",
+        )
+        return Response(body, status=status_code)
+
+
+class MusicStreamingBatchView(APIView):
+    """
+    Resolve streaming URLs for several tracks in one round trip.
+
+    ``POST {"music_ids": [...]}`` (e.g. the next items of a queue) returns
+    one entry per id, in request order, shaped like the single-track
+    response; tracks that can't be streamed carry ``error`` and
+    ``status`` instead.  Honours ``?mode=adaptive`` like
+    ``MusicStreamingView``.  The throttle counts tracks, not requests.
+    """
+
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [MusicStreamingBatchRateThrottle]
+
+    def throttle_cost(self, request) -> int:
+        """Number of distinct tracks requested, charged to the throttle."""
+        music_ids = request.data.get("music_ids") if hasattr(request.data, "get") else None
+        if not isinstance(music_ids, list):
+            return 1
+        # Oversized batches are rejected by validation; don't let them
+        # drain the whole window first
+        return min(
+            len({str(music_id) for music_id in music_ids}),
+            getattr(settings, "STREAM_BATCH_MAX_TRACKS", 10),
+        )
 
-        # Permission check
+    def post(self, request) -> Response:
+        serializer = StreamBatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        music_ids = serializer.validated_data["music_ids"]
+
+        manifests = manifest.get_manifests(music_ids)
+        snapshot = entitlements.get_entitlements(request.user)
+        adaptive = request.query_params.get("mode") == "adaptive"
+
+        results = []
+        for music_id in music_ids:
+            music = manifests.get(music_id)
+            if music is None:
+                body, status_code = {"error": "Music not found."}, status.HTTP_404_NOT_FOUND
+            else:
+                body, status_code = _stream_payload(music, snapshot, request.user.id, adaptive)
+            if status_code != status.HTTP_200_OK:
+                body = {"music_id": music_id, "status": status_code, **body}
+            results.append(body)
+        return Response({"results": results})
+
+
+def _stream_payload(
+    music: manifest.StreamManifest,
+    snapshot: entitlements.Entitlements,
+    user_id: int,
+    adaptive: bool,
+) -> tuple[dict, int]:
+    """
+    Response body and status for streaming one track.
+
+    Shared by the single and batch endpoints; reads only the cached
+    manifest and entitlement snapshot.
+    """
+    # Permission check
+    if not music.is_public and music.owner_id != user_id:
+        return (
+            {"error": "You do not have permission to access this music."},
+            status.HTTP_403_FORBIDDEN,
+        )
+
+    if adaptive:
+        master = StreamingService.get_master_playlist(music, snapshot.max_quality)
+        if master:
+            master_url, cap = master
+            return {
+                "music_id": music.id,
+                "adaptive": True,
+                "max_quality": cap,
+                "url": signing.sign_url(master_url, cap),
+                "replay_gain_db": music.get_replay_gain_db(),
+                "name": music.name,
+                "artist": music.artist_name,
+                "cover_photo": music.cover_photo_url,
+            }, status.HTTP_200_OK
+        # No master playlist yet — fall through to a single tier
+
+    preferred_quality = snapshot.quality
+    stream = StreamingService.pick_rendition(music.renditions, preferred_quality)
+    if not stream:
+        return (
+            {"error": "No streaming files available for this music."},
+            status.HTTP_404_NOT_FOUND,
+        )
+    streaming_url, quality_served = stream
+
+    # Use relative URLs for proxy compatibility in local development
+    # HLS.js handled by Vite proxy for /media requests
+
+    return {
+        "music_id": music.id,
+        "quality_served": quality_served,
+        "user_preferred_quality": preferred_quality,
+        "url": signing.sign_url(streaming_url, quality_served),
+        "replay_gain_db": music.get_replay_gain_db(),
+        "name": music.name,
+        "artist": music.artist_name,
+        "quality_matched": quality_served == preferred_quality,
+        "cover_photo": music.cover_photo_url,
+        "adaptive": False,
+    }, status.HTTP_200_OK
+
+
+class MusicWaveformView(APIView):
+    """
+    Redirect to the waveform peaks blob of a track.
+
+    The blob itself is content-addressed and served by the CDN with an
+    immutable cache policy; this redirect may be cached by the client for
+    an hour (it only changes when the track is re-transcoded).
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, music_id: int):
+        music = get_object_or_404(Music.objects.select_related("artist__user"), id=music_id)
         if not music.is_public and music.artist.user != request.user:
             return Response(
                 {"error": "You do not have permission to access this music."},
                 status=status.HTTP_403_FORBIDDEN,
             )
-
-        # Resolve quality via service
-        preferred_quality = StreamingService.resolve_quality(request.user)
-        streaming_url = StreamingService.get_streaming_url(music_id, preferred_quality)
-
-        if not streaming_url:
+        if not music.waveform_url:
             return Response(
-                {"error": "No streaming files available for this music."},
+                {"error": "No waveform available for this music."},
                 status=status.HTTP_404_NOT_FOUND,
             )
+        response = redirect(music.waveform_url)
+        patch_cache_control(response, private=True, max_age=WAVEFORM_REDIRECT_MAX_AGE)
+        return response
 
-        # Determine actual quality served
-        streaming_file = StreamingFile.objects.filter(
-            music=music, hls_playlist=streaming_url
-        ).first()
-        quality_served = streaming_file.quality if streaming_file else preferred_quality
-
-        # Use relative URLs for proxy compatibility in local development
-        # HLS.js handled by Vite proxy for /media requests
-        
-        cover_photo_url = None
-        if music.cover_photo:
-            cover_photo_url = music.cover_photo.url
 
-        return Response({
-            "music_id": music_id,
-            "quality_served": quality_served,
-            "user_preferred_quality": preferred_quality,
-            "url": streaming_url,
-            "name": music.name,
-            "artist": music.artist.user.username,
-            "quality_matched": quality_served == preferred_quality,
-            "cover_photo": cover_photo_url,
-        })
+def hls_token_auth(request) -> HttpResponse:
+    """
+    ``auth_request`` target for nginx: 204 if the signed media path in
+    ``X-Original-URI`` may be served, 403 otherwise (see ``music.signing``).
+    """
+    path = request.headers.get("X-Original-URI", "")
+    return HttpResponse(status=204 if signing.verify_path(path) else 403)
 
 
 # ---------------------------------------------------------------------------
@@ -459,26 +624,20 @@ class MusicStreamingView(APIView):
 # ---------------------------------------------------------------------------
 
 class UserQualityPreferenceView(APIView):
-    """Get the user's current streaming quality setting."""
+    """
+    Get the user's current streaming quality setting.
+
+    Read-only: for non-premium users the stored preference is capped to
+    LOW in the entitlement snapshot rather than rewritten here.
+    """
 
     permission_classes = [IsAuthenticated]
 
     def get(self, request) -> Response:
-        user = request.user
-        pref, _ = UserPreference.objects.get_or_create(
-            user=user, defaults={"preferred_quality": HLSQuality.LOW}
-        )
-
-        is_premium = _is_user_premium(user)
-
-        # Force low quality for non-premium users
-        if not is_premium and pref.preferred_quality != HLSQuality.LOW:
-            pref.preferred_quality = HLSQuality.LOW
-            pref.save(update_fields=["preferred_quality", "updated_at"])
-
+        snapshot = entitlements.get_entitlements(request.user)
         return Response({
-            "current_quality": pref.preferred_quality,
-            "is_premium": is_premium,
+            "current_quality": snapshot.quality,
+            "is_premium": snapshot.is_premium,
         })
 
 
@@ -490,13 +649,6 @@ class UpdateUserPreferenceView(UpdateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserPreferenceSerializer
 
-    def get_object(self):
-        pref, _ = UserPreference.objects.get_or_create(
-            user=self.request.user,
-            defaults={"preferred_quality": HLSQuality.LOW},
-        )
-        return pref
-
     def update(self, request, *args, **kwargs):
         is_premium = _is_user_premium(request.user)
         requested_quality = request.data.get("preferred_quality")
@@ -506,4 +658,10 @@ class UpdateUserPreferenceView(UpdateAPIView):
                 {"error": "Premium subscription required for higher quality options"},
                 status=status.HTTP_403_FORBIDDEN,
             )
-        return super().update(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Goes through the service so the entitlement snapshot is dropped
+        pref = StreamingService.update_user_preference(
+            request.user, serializer.validated_data["preferred_quality"],
+        )
+        return Response(self.get_serializer(pref).data)
@@ -0,0 +1,120 @@
+"""
+Waveform peak extraction for the player scrubber.
+
+While transcoding, FFmpeg writes a mono, low-rate PCM copy of the decoded
+audio to an extra pipe.  ``WaveformPipe`` reads it on a background thread
+and ``PeakCollector`` reduces it block by block with NumPy, so memory
+stays small regardless of track length.  The result is a compact array of
+int8 peaks (0-127) published as an immutable, content-hashed blob.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WAVEFORM_SAMPLE_RATE = 8000
+WAVEFORM_BUCKETS = 1800
+BLOCK_SAMPLES = 256  # 32 ms at 8 kHz
+READ_CHUNK_BYTES = 64 * 1024
+_SAMPLE_WIDTH = 2  # s16le
+
+
+class PeakCollector:
+    """Running per-block absolute peaks of a 16-bit little-endian PCM stream."""
+
+    def __init__(self) -> None:
+        self._pending = b""
+        self._blocks: list[np.ndarray] = []
+
+    def feed(self, data: bytes) -> None:
+        data = self._pending + data
+        block_bytes = BLOCK_SAMPLES * _SAMPLE_WIDTH
+        usable = len(data) - len(data) % block_bytes
+        self._pending = data[usable:]
+        if usable:
+            self._blocks.append(_block_peaks(data[:usable], BLOCK_SAMPLES))
+
+    def buckets(self, count: int = WAVEFORM_BUCKETS) -> bytes:
+        """
+        Reduce the collected peaks to exactly *count* int8 buckets.
+
+        A track with fewer blocks than *count* is stretched by repeating
+        blocks.  Returns ``b""`` when no audio was fed.
+        """
+        blocks = list(self._blocks)
+        tail = self._pending[: len(self._pending) - len(self._pending) % _SAMPLE_WIDTH]
+        if tail:
+            blocks.append(_block_peaks(tail, len(tail) // _SAMPLE_WIDTH))
+        if not blocks:
+            return b""
+
+        peaks = np.concatenate(blocks)
+        if len(peaks) < count:
+            peaks = peaks[np.arange(count) * len(peaks) // count]
+        starts = np.linspace(0, len(peaks), count + 1).astype(np.int64)[:-1]
+        bucketed = np.maximum.reduceat(peaks, starts).astype(np.int32)
+        return (bucketed * 127 // 32768).astype(np.int8).tobytes()
+
+
+def _block_peaks(data: bytes, block_samples: int) -> np.ndarray:
+    samples = np.frombuffer(data, dtype="<i2").astype(np.int32)
+    return np.abs(samples.reshape(-1, block_samples)).max(axis=1).astype(np.uint16)
+
+
+class WaveformPipe:
+    """
+    OS pipe that FFmpeg writes waveform PCM into, drained on a thread.
+
+    Pass ``write_fd`` to FFmpeg via ``pass_fds`` and map the waveform
+    branch with :meth:`output_args`.  Once FFmpeg has exited, leaving the
+    ``with`` block closes our copy of the write end so the reader sees EOF;
+    :meth:`buckets` then returns the peaks.
+    """
+
+    def __init__(self) -> None:
+        read_fd, self.write_fd = os.pipe()
+        self._closed = False
+        self._collector = PeakCollector()
+        self._thread = threading.Thread(target=self._read, args=(read_fd,), daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> WaveformPipe:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def output_args(self, label: str) -> list[str]:
+        """FFmpeg output arguments sending *label* to this pipe as mono PCM."""
+        return [
+            "-map", label,
+            "-ac", "1",
+            "-ar", str(WAVEFORM_SAMPLE_RATE),
+            "-c:a", "pcm_s16le",
+            "-f", "s16le",
+            f"pipe:{self.write_fd}",
+        ]
+
+    def close(self) -> None:
+        if not self._closed:
+            os.close(self.write_fd)
+            self._closed = True
+        self._thread.join(timeout=30)
+
+    def buckets(self) -> bytes:
+        self.close()
+        return self._collector.buckets()
+
+    def _read(self, read_fd: int) -> None:
+        try:
+            with os.fdopen(read_fd, "rb", buffering=0) as stream:
+                for chunk in iter(lambda: stream.read(READ_CHUNK_BYTES), b""):
+                    self._collector.feed(chunk)
+        except Exception:
+            logger.exception("Error reading waveform PCM from FFmpeg")
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlist', '0003_alter_playlist_options_alter_playlisttrack_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='cover_photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Responsive WebP/AVIF derivatives of cover_photo (see common.images).'),
+        ),
+    ]
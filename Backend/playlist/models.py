@@ -36,6 +36,12 @@ class Playlist(models.Model):
         upload_to="playlist_covers/",
         validators=[FileExtensionValidator(allowed_extensions=["jpg", "jpeg", "png"])],
     )
+    cover_photo_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Responsive WebP/AVIF derivatives of cover_photo (see common.images).",
+    )
     tracks = models.ManyToManyField(
         Music,
         through="PlaylistTrack",
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from common.serializers import SrcsetField
 from .models import Playlist, PlaylistTrack
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets
@@ -81,13 +82,14 @@ class PlaylistSerializer(serializers.ModelSerializer):
     # created_by_details = UserSerializer(source='created_by', read_only=True)
     created_by = serializers.CharField(source='created_by.email', read_only = True) 
     created_by_username = serializers.CharField(source='created_by.username', read_only = True)  # To show username
+    cover_photo_srcset = SrcsetField(source='cover_photo_variants')
     
     
     class Meta:
         model = Playlist
         fields = [
             'id', 'name', 'description', 'is_public', 
-            'cover_photo', 'duration', 'created_at', 
+            'cover_photo', 'cover_photo_srcset', 'duration', 'created_at', 
             'updated_at', 'tracks', 'created_by_username',
             'created_by'
         ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_customuser_options_alter_customuser_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Responsive WebP/AVIF derivatives of profile_photo (see common.images).'),
+        ),
+    ]
@@ -78,6 +78,12 @@ class CustomUser(AbstractUser):
         blank=True,
         help_text="User's profile photo.",
     )
+    profile_photo_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Responsive WebP/AVIF derivatives of profile_photo (see common.images).",
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
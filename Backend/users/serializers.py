@@ -1,5 +1,6 @@
 from rest_framework import serializers
 import uuid
+from common.serializers import SrcsetField
 from .models import CustomUser
 from playlist.models import Playlist
 from django.contrib.auth import get_user_model
@@ -11,12 +12,13 @@ User = get_user_model()
 
 class UserSerializer(serializers.ModelSerializer):
     profile_photo_url = serializers.SerializerMethodField()
+    profile_photo_srcset = SrcsetField(source='profile_photo_variants')
     
     
     class Meta:
         model = User
         fields = ['id', 'email', 'username', 'first_name', 'profile_photo', 'last_name', 'is_active'
-                  , 'profile_photo_url']
+                  , 'profile_photo_url', 'profile_photo_srcset']
 
     def create(self, validated_data):
         temp_password = str(uuid.uuid4())